@@ -6,6 +6,8 @@ from soci import pagina_soci
 from dashboard import pagina_dashboard
 from report_backup import pagina_report_backup
 from drive_utils import carica_dati_iniziali_da_drive
+from immagini import LATO_LOGO_PX, normalizza_logo
+from dataset_condivisi import sincronizza_sessione
 from test_drive_page import pagina_test_drive
 
 
@@ -44,6 +46,9 @@ if "dati_caricati_da_drive" not in st.session_state:
         # non blocchiamo l'app se Drive non è configurato o dà errore
         pass
     st.session_state.dati_caricati_da_drive = True
+else:
+    # dati aggiornati da altre sessioni (stesso processo): nessun download
+    sincronizza_sessione()
 
 # ==========================
 # HEADER
@@ -108,8 +113,10 @@ if menu == "Anagrafica associazione":
             "Logo (PNG/JPG, opzionale)", type=["png", "jpg", "jpeg"]
         )
         if logo_file is not None:
-            a["Logo"] = logo_file.read()
-            st.image(a["Logo"], caption="Anteprima logo", use_container_width=True)
+            # ridimensionato e ricompresso una volta sola (cache per hash)
+            a["Logo"] = normalizza_logo(logo_file.read())
+        if a.get("Logo"):
+            st.image(a["Logo"], caption="Anteprima logo", width=LATO_LOGO_PX)
 
     if st.button("Salva anagrafica"):
         st.session_state.associazione = a
@@ -0,0 +1,339 @@
+import os
+import io
+import mmap
+import time
+import hashlib
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+# Backend di archiviazione dei file del gestionale (dataset, journal, backup).
+# Si sceglie con la variabile ambiente ASD_BACKEND:
+# - "drive"  : Google Drive (default, vedi backend_drive.py)
+# - "locale" : cartella sul disco del server (ASD_DATI_DIR)
+# - "finto"  : Drive simulato in memoria, con latenza e banda configurabili
+#              (ASD_FINTO_LATENZA_MS, ASD_FINTO_BANDA_KBPS), per prove e misure offline
+#
+# Dimensione dei blocchi per i caricamenti a pezzi (multiplo di 256 KB, come
+# richiesto dal protocollo resumable di Drive)
+CHUNK_UPLOAD = 5 * 1024 * 1024
+
+# I metadati di un file sono un dict con almeno "id", "name" e "version"
+# (più "md5Checksum" e "modifiedTime" quando disponibili): cambiano a ogni
+# nuova revisione e fanno da chiave per cache_locale.
+
+
+# Valore di se_versione per "il file non deve esistere"
+ASSENTE = "assente"
+
+# metadati non passati a _verifica_versione (None vuol dire "file assente")
+_DA_LEGGERE = object()
+
+
+class ConflittoVersione(Exception):
+    """
+    Il file è stato modificato da un altro processo dopo l'ultima lettura.
+
+    Se la scrittura è comunque avvenuta sopra quella dell'altro processo
+    (backend senza scritture condizionate, vedi BackendDrive.salva):
+    nuova = metadati della revisione appena scritta, sovrascritto = contenuto
+    della revisione sostituita, da unire prima di riscrivere.
+    """
+
+    def __init__(self, nome: str, attesa: str, attuale: str, nuova=None, sovrascritto=None):
+        super().__init__(f"{nome}: versione attesa {attesa}, trovata {attuale}")
+        self.nome = nome
+        self.attesa = attesa
+        self.attuale = attuale
+        self.nuova = nuova
+        self.sovrascritto = sovrascritto
+
+
+class BackendArchiviazione(ABC):
+    """Interfaccia comune dei backend di archiviazione.
+
+    salva ed elimina accettano se_versione (facoltativo): l'operazione avviene
+    solo se la versione attuale del file è ancora quella (ASSENTE = il file non
+    deve esistere), altrimenti solleva ConflittoVersione.
+    """
+
+    nome = ""
+
+    def errore(self):
+        """Messaggio se il backend non è utilizzabile (es. non configurato), altrimenti None."""
+        return None
+
+    @abstractmethod
+    def metadati(self, nome: str):
+        """Metadati del file nome, None se non esiste."""
+
+    @abstractmethod
+    def leggi(self, meta: dict):
+        """Contenuto (file-like posizionato all'inizio) della revisione descritta da meta."""
+
+    @abstractmethod
+    def salva(self, nome: str, data: bytes, mimetype: str, se_versione: str = None) -> dict:
+        """Crea o sostituisce il file nome. Restituisce i metadati della nuova revisione."""
+
+    @abstractmethod
+    def salva_blob(self, nome: str, data: bytes, mimetype: str) -> dict:
+        """Carica un nuovo oggetto (es. un backup) senza sostituire quelli esistenti."""
+
+    def salva_blob_da_file(self, nome: str, percorso: str, mimetype: str, progresso=None) -> dict:
+        """
+        Come salva_blob, ma legge il contenuto dal file percorso.
+        progresso (facoltativo) viene chiamato con la frazione caricata (0..1).
+        """
+        with open(percorso, "rb") as f:
+            meta = self.salva_blob(nome, f.read(), mimetype)
+        if progresso:
+            progresso(1.0)
+        return meta
+
+    @abstractmethod
+    def elimina(self, nome: str, se_versione: str = None):
+        """Elimina il file nome (se esiste)."""
+
+    @abstractmethod
+    def elenca(self, prefisso: str = "") -> list:
+        """Metadati dei file il cui nome inizia con prefisso."""
+
+    def carica(self, nome: str):
+        """Contenuto del file nome (file-like), None se non esiste."""
+        meta = self.metadati(nome)
+        return self.leggi(meta) if meta else None
+
+    def _verifica_versione(self, nome: str, se_versione: str, meta=_DA_LEGGERE):
+        """
+        Solleva ConflittoVersione se la versione di nome non è se_versione.
+        meta: metadati già letti (None = il file non esiste); se omesso li legge.
+        """
+        if se_versione is None:
+            return
+        if meta is _DA_LEGGERE:
+            meta = self.metadati(nome)
+        attuale = meta["version"] if meta else ASSENTE
+        if attuale != se_versione:
+            raise ConflittoVersione(nome, se_versione, attuale)
+
+
+def _ora_iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class BackendLocale(BackendArchiviazione):
+    """
+    File in una cartella locale (installazioni su un solo server).
+    Scritture atomiche (file temporaneo + rename), letture con mmap.
+    """
+
+    nome = "locale"
+
+    def __init__(self, cartella: str):
+        self.cartella = cartella
+        os.makedirs(cartella, exist_ok=True)
+        # controllo versione + rename atomici rispetto agli altri thread del processo
+        self._lock = threading.Lock()
+
+    def _percorso(self, nome: str) -> str:
+        return os.path.join(self.cartella, os.path.basename(nome))
+
+    def _meta(self, percorso: str) -> dict:
+        st_ = os.stat(percorso)
+        nome = os.path.basename(percorso)
+        return {
+            "id": nome,
+            "name": nome,
+            "size": str(st_.st_size),
+            "modifiedTime": _ora_iso(st_.st_mtime),
+            "version": f"{st_.st_mtime_ns}-{st_.st_size}-{st_.st_ino}",
+        }
+
+    def metadati(self, nome: str):
+        percorso = self._percorso(nome)
+        if not os.path.isfile(percorso):
+            return None
+        return self._meta(percorso)
+
+    def leggi(self, meta: dict):
+        with open(self._percorso(meta["name"]), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO(b"")
+            # la mappa resta valida anche dopo la chiusura del file e
+            # sopravvive a un rename successivo (punta sempre alla vecchia revisione)
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def salva(self, nome: str, data: bytes, mimetype: str, se_versione: str = None) -> dict:
+        percorso = self._percorso(nome)
+        fd, tmp = tempfile.mkstemp(dir=self.cartella, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._lock:
+                self._verifica_versione(nome, se_versione)
+                os.replace(tmp, percorso)
+                return self._meta(percorso)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def salva_blob(self, nome: str, data: bytes, mimetype: str) -> dict:
+        base, ext = os.path.splitext(os.path.basename(nome))
+        nome_blob = f"{base}_{time.strftime('%Y%m%d_%H%M%S')}{ext}"
+        return self.salva(nome_blob, data, mimetype)
+
+    def salva_blob_da_file(self, nome: str, percorso: str, mimetype: str, progresso=None) -> dict:
+        base, ext = os.path.splitext(os.path.basename(nome))
+        destinazione = self._percorso(f"{base}_{time.strftime('%Y%m%d_%H%M%S')}{ext}")
+        fd, tmp = tempfile.mkstemp(dir=self.cartella, suffix=".tmp")
+        try:
+            totale = os.path.getsize(percorso) or 1
+            copiati = 0
+            with open(percorso, "rb") as src, os.fdopen(fd, "wb") as dst:
+                while True:
+                    blocco = src.read(CHUNK_UPLOAD)
+                    if not blocco:
+                        break
+                    dst.write(blocco)
+                    copiati += len(blocco)
+                    if progresso:
+                        progresso(copiati / totale)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp, destinazione)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return self._meta(destinazione)
+
+    def elimina(self, nome: str, se_versione: str = None):
+        with self._lock:
+            self._verifica_versione(nome, se_versione)
+            try:
+                os.remove(self._percorso(nome))
+            except FileNotFoundError:
+                pass
+
+    def elenca(self, prefisso: str = "") -> list:
+        # solo file: nella cartella possono esserci sottocartelle di altri
+        # archivi (es. i PDF di blob_pdf.py in ASD_DATI_DIR/pdf)
+        with os.scandir(self.cartella) as voci:
+            nomi = sorted(
+                v.name
+                for v in voci
+                if v.is_file(follow_symlinks=False)
+                and v.name.startswith(prefisso)
+                and not v.name.endswith(".tmp")
+            )
+        return [self._meta(os.path.join(self.cartella, n)) for n in nomi]
+
+
+class BackendDriveFinto(BackendArchiviazione):
+    """
+    Drive simulato in memoria: ogni chiamata attende latenza_ms, ogni
+    trasferimento len(data) / banda. Condiviso da tutte le sessioni del processo.
+    """
+
+    nome = "finto"
+
+    def __init__(self, latenza_ms: float = 100.0, banda_kbps: float = 1000.0):
+        self.latenza = latenza_ms / 1000.0
+        self.banda = banda_kbps * 1024 / 8  # byte al secondo
+        self._lock = threading.Lock()
+        self._file = {}  # nome -> {"meta": ..., "data": ...}
+        self._progressivo = 0
+
+    def _attendi(self, n_byte: int = 0):
+        time.sleep(self.latenza + (n_byte / self.banda if self.banda > 0 else 0))
+
+    def _nuovo_meta(self, nome: str, data: bytes, precedente=None) -> dict:
+        self._progressivo += 1
+        return {
+            "id": precedente["id"] if precedente else f"finto-{self._progressivo}",
+            "name": nome,
+            "size": str(len(data)),
+            "md5Checksum": hashlib.md5(data).hexdigest(),
+            "modifiedTime": _ora_iso(time.time()),
+            "version": str(int(precedente["version"]) + 1) if precedente else "1",
+        }
+
+    def metadati(self, nome: str):
+        self._attendi()
+        with self._lock:
+            voce = self._file.get(nome)
+            return dict(voce["meta"]) if voce else None
+
+    def leggi(self, meta: dict):
+        with self._lock:
+            voce = self._file.get(meta["name"])
+            if voce is None or voce["meta"]["id"] != meta["id"]:
+                voce = self._file.get(meta["id"])
+            data = voce["data"] if voce else b""
+        self._attendi(len(data))
+        return io.BytesIO(data)
+
+    def salva(self, nome: str, data: bytes, mimetype: str, se_versione: str = None) -> dict:
+        data = bytes(data)
+        self._attendi(len(data))
+        with self._lock:
+            voce = self._file.get(nome)
+            self._verifica_versione(nome, se_versione, voce["meta"] if voce else None)
+            meta = self._nuovo_meta(nome, data, voce["meta"] if voce else None)
+            self._file[nome] = {"meta": meta, "data": data}
+            return dict(meta)
+
+    def salva_blob(self, nome: str, data: bytes, mimetype: str) -> dict:
+        data = bytes(data)
+        self._attendi(len(data))
+        with self._lock:
+            meta = self._nuovo_meta(nome, data)
+            # nome duplicato ammesso come su Drive: chiave interna = id
+            self._file[meta["id"]] = {"meta": meta, "data": data}
+            return dict(meta)
+
+    def elimina(self, nome: str, se_versione: str = None):
+        self._attendi()
+        with self._lock:
+            voce = self._file.get(nome)
+            self._verifica_versione(nome, se_versione, voce["meta"] if voce else None)
+            self._file.pop(nome, None)
+
+    def elenca(self, prefisso: str = "") -> list:
+        self._attendi()
+        with self._lock:
+            return [
+                dict(v["meta"])
+                for v in self._file.values()
+                if v["meta"]["name"].startswith(prefisso)
+            ]
+
+
+_backend = None
+_backend_config = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> BackendArchiviazione:
+    """Backend configurato (uno per processo, ricreato se cambia ASD_BACKEND)."""
+    global _backend, _backend_config
+    tipo = os.getenv("ASD_BACKEND", "drive").strip().lower()
+    with _backend_lock:
+        if _backend is None or _backend_config != tipo:
+            if tipo == "locale":
+                _backend = BackendLocale(os.getenv("ASD_DATI_DIR", "dati_asd"))
+            elif tipo == "finto":
+                _backend = BackendDriveFinto(
+                    latenza_ms=float(os.getenv("ASD_FINTO_LATENZA_MS", "100")),
+                    banda_kbps=float(os.getenv("ASD_FINTO_BANDA_KBPS", "1000")),
+                )
+            else:
+                from backend_drive import BackendDrive
+
+                _backend = BackendDrive()
+            _backend_config = tipo
+        return _backend
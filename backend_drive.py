@@ -0,0 +1,363 @@
+import os
+import io
+import json
+import time
+import threading
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload, MediaIoBaseDownload
+
+from archiviazione import ASSENTE, CHUNK_UPLOAD, BackendArchiviazione, ConflittoVersione
+from cache_locale import CAMPI_METADATI
+
+SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+
+# Upload resumable: tentativi di ripresa dopo un errore di rete, con attesa crescente
+MAX_RIPRESE_UPLOAD = 8
+
+# Client Drive condiviso da tutto il processo (tutte le sessioni Streamlit)
+_drive_lock = threading.Lock()
+_drive_stato = {"config": None, "creds": None, "service": None, "folder_id": None}
+_http_locale = threading.local()
+
+# Cache nome file -> fileId nella cartella configurata
+_file_id_cache = {}
+_file_id_lock = threading.Lock()
+
+
+def _get_drive_service():
+    """Restituisce (service, folder_id, error). Se error != None, Drive non è utilizzabile.
+
+    Il service viene costruito una sola volta per processo e riutilizzato;
+    viene ricostruito solo se cambiano le variabili ambiente.
+    """
+    service_json = os.getenv("GDRIVE_SERVICE_ACCOUNT_JSON")
+    folder_id = os.getenv("GDRIVE_FOLDER_ID")
+
+    if not service_json or not folder_id:
+        return None, None, "Google Drive non configurato nelle variabili ambiente."
+
+    config = (service_json, folder_id)
+    with _drive_lock:
+        if _drive_stato["config"] == config and _drive_stato["service"] is not None:
+            return _drive_stato["service"], folder_id, None
+
+        try:
+            info = json.loads(service_json)
+            creds = service_account.Credentials.from_service_account_info(
+                info,
+                scopes=SCOPES,
+            )
+            # niente cache su file del documento di discovery: viene letto
+            # una volta sola e tenuto in memoria insieme al service
+            service = build(
+                "drive", "v3", credentials=creds, cache_discovery=False
+            )
+        except Exception as e:
+            return None, None, f"Errore configurazione Google Drive: {e}"
+
+        _drive_stato.update(
+            config=config, creds=creds, service=service, folder_id=folder_id
+        )
+        # nuove credenziali: i client http per thread si ricreano da soli
+        # (vedi _http_thread), la cache dei fileId va azzerata
+        invalida_cache_file_id()
+        return service, folder_id, None
+
+
+def _http_thread():
+    """
+    Client http autenticato del thread corrente.
+    httplib2 non è thread-safe: ogni thread ha il suo, tutti condividono le
+    stesse credenziali, che si rinnovano da sole alla scadenza del token.
+    """
+    creds = _drive_stato["creds"]
+    if getattr(_http_locale, "creds", None) is not creds:
+        _http_locale.creds = creds
+        _http_locale.http = google_auth_httplib2.AuthorizedHttp(
+            creds, http=httplib2.Http()
+        )
+    return _http_locale.http
+
+
+def _esegui(request):
+    """Esegue una richiesta Drive con il client http del thread corrente."""
+    return request.execute(http=_http_thread())
+
+
+def invalida_cache_file_id(filename: str = None):
+    """Svuota la cache nome -> fileId (tutta, o solo per filename)."""
+    with _file_id_lock:
+        if filename is None:
+            _file_id_cache.clear()
+        else:
+            _file_id_cache.pop(filename, None)
+
+
+def _trova_file_id(service, folder_id: str, filename: str):
+    """Restituisce il fileId di filename nella cartella (None se non esiste)."""
+    with _file_id_lock:
+        if filename in _file_id_cache:
+            return _file_id_cache[filename]
+
+    res = _esegui(
+        service.files().list(
+            q=f"name='{filename}' and '{folder_id}' in parents and trashed=false",
+            fields="files(id,name)",
+            pageSize=1,
+        )
+    )
+    items = res.get("files", [])
+    file_id = items[0]["id"] if items else None
+
+    # memorizzo solo i file trovati: un file mancante può comparire in seguito
+    if file_id:
+        with _file_id_lock:
+            _file_id_cache[filename] = file_id
+    return file_id
+
+
+def _file_non_trovato(e: Exception) -> bool:
+    return isinstance(e, HttpError) and e.resp.status == 404
+
+
+def _carica_bytes_su_drive(service, folder_id: str, filename: str, data: bytes, mimetype: str):
+    """Crea o aggiorna filename nella cartella con il contenuto data.
+
+    Restituisce i metadati della nuova revisione (vedi CAMPI_METADATI).
+    """
+
+    def _media():
+        return MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype, resumable=False)
+
+    file_id = _trova_file_id(service, folder_id, filename)
+
+    if file_id:
+        try:
+            return _esegui(
+                service.files().update(
+                    fileId=file_id, media_body=_media(), fields=CAMPI_METADATI
+                )
+            )
+        except Exception as e:
+            if not _file_non_trovato(e):
+                raise
+            # il file è stato cancellato da Drive: l'id in cache non vale più
+            invalida_cache_file_id(filename)
+
+    metadata = {"name": filename, "parents": [folder_id]}
+    creato = _esegui(
+        service.files().create(
+            body=metadata, media_body=_media(), fields=CAMPI_METADATI
+        )
+    )
+    with _file_id_lock:
+        _file_id_cache[filename] = creato["id"]
+    return creato
+
+
+def _metadati(service, folder_id: str, filename: str, campi: str = CAMPI_METADATI):
+    """Metadati (id, md5Checksum, modifiedTime, version) di filename, None se non esiste."""
+    file_id = _trova_file_id(service, folder_id, filename)
+    if not file_id:
+        return None
+
+    try:
+        return _esegui(service.files().get(fileId=file_id, fields=campi))
+    except Exception as e:
+        if not _file_non_trovato(e):
+            raise
+        # id in cache non più valido: ripeto la ricerca una volta
+        invalida_cache_file_id(filename)
+        file_id = _trova_file_id(service, folder_id, filename)
+        if not file_id:
+            return None
+        return _esegui(service.files().get(fileId=file_id, fields=campi))
+
+
+def _elimina_da_drive(service, folder_id: str, filename: str):
+    """Elimina filename dalla cartella (se esiste)."""
+    file_id = _trova_file_id(service, folder_id, filename)
+    invalida_cache_file_id(filename)
+    if not file_id:
+        return
+    try:
+        _esegui(service.files().delete(fileId=file_id))
+    except Exception as e:
+        if not _file_non_trovato(e):
+            raise
+
+
+def _scarica_file(service, file_id: str) -> io.BytesIO:
+    return _scarica_media(service.files().get_media(fileId=file_id))
+
+
+def _scarica_media(request) -> io.BytesIO:
+    fh = io.BytesIO()
+    request.http = _http_thread()
+    downloader = MediaIoBaseDownload(fh, request)
+    done = False
+    while not done:
+        status, done = downloader.next_chunk()
+    fh.seek(0)
+    return fh
+
+
+def _revisione_precedente(service, file_id: str):
+    """Metadati (id, md5Checksum) della penultima revisione del file, None se non c'è."""
+    revisioni, token = [], None
+    while True:
+        res = _esegui(
+            service.revisions().list(
+                fileId=file_id,
+                fields="nextPageToken,revisions(id,md5Checksum)",
+                pageSize=1000,
+                pageToken=token,
+            )
+        )
+        revisioni += res.get("revisions", [])
+        token = res.get("nextPageToken")
+        if not token:
+            break
+    return revisioni[-2] if len(revisioni) >= 2 else None
+
+
+def _scarica_revisione(service, file_id: str, revision_id: str) -> bytes:
+    request = service.revisions().get_media(fileId=file_id, revisionId=revision_id)
+    return _scarica_media(request).getvalue()
+
+
+class BackendDrive(BackendArchiviazione):
+    """Backend Google Drive (cartella GDRIVE_FOLDER_ID, service account GDRIVE_SERVICE_ACCOUNT_JSON)."""
+
+    nome = "drive"
+
+    def errore(self):
+        _, _, err = _get_drive_service()
+        return err
+
+    def metadati(self, nome: str):
+        service, folder_id, _ = _get_drive_service()
+        return _metadati(service, folder_id, nome)
+
+    def leggi(self, meta: dict):
+        service, _, _ = _get_drive_service()
+        return _scarica_file(service, meta["id"])
+
+    def salva(self, nome: str, data: bytes, mimetype: str, se_versione: str = None) -> dict:
+        """
+        Drive v3 non ha scritture condizionate. Prima di scrivere si controlla
+        la versione (evita upload inutili) e si annota la revisione del
+        contenuto (headRevisionId); dopo, si verifica che la revisione
+        sostituita dalla nostra sia quella. Se nel frattempo ha scritto un
+        altro processo, la sua revisione è stata sostituita: si solleva
+        ConflittoVersione con il suo contenuto (sovrascritto), che il chiamante
+        unisce e riscrive. Non si confrontano i numeri di versione: crescono
+        anche per modifiche dei soli metadati o dei permessi, e non sempre di 1.
+        Questo restringe la finestra della gara senza chiuderla: due scritture
+        quasi simultanee possono ancora alternarsi, e la creazione di un file
+        ASSENTE non è verificabile (Drive ammette due file con lo stesso nome).
+        """
+        service, folder_id, _ = _get_drive_service()
+        if se_versione is None or se_versione == ASSENTE:
+            self._verifica_versione(nome, se_versione)
+            return _carica_bytes_su_drive(service, folder_id, nome, data, mimetype)
+
+        letta = _metadati(service, folder_id, nome, campi=CAMPI_METADATI + ",headRevisionId")
+        self._verifica_versione(nome, se_versione, letta)
+        meta = _carica_bytes_su_drive(service, folder_id, nome, data, mimetype)
+
+        sostituita = _revisione_precedente(service, meta["id"])
+        if (
+            sostituita is None
+            or sostituita["id"] == letta.get("headRevisionId")
+            or sostituita.get("md5Checksum") == letta.get("md5Checksum")
+        ):
+            return meta
+        sovrascritto = _scarica_revisione(service, meta["id"], sostituita["id"])
+        raise ConflittoVersione(
+            nome, se_versione, meta.get("version"), nuova=meta, sovrascritto=sovrascritto
+        )
+
+    def salva_blob(self, nome: str, data: bytes, mimetype: str) -> dict:
+        service, folder_id, _ = _get_drive_service()
+        media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype)
+        return _esegui(
+            service.files().create(
+                body={"name": nome, "parents": [folder_id]},
+                media_body=media,
+                fields=CAMPI_METADATI,
+            )
+        )
+
+    def salva_blob_da_file(self, nome: str, percorso: str, mimetype: str, progresso=None) -> dict:
+        """
+        Upload resumable a blocchi di CHUNK_UPLOAD byte, letti dal file:
+        la memoria usata non dipende dalla dimensione del file. Dopo un errore
+        di rete riprende dall'ultimo blocco confermato da Drive.
+        """
+        service, folder_id, _ = _get_drive_service()
+        media = MediaFileUpload(
+            percorso, mimetype=mimetype, chunksize=CHUNK_UPLOAD, resumable=True
+        )
+        request = service.files().create(
+            body={"name": nome, "parents": [folder_id]},
+            media_body=media,
+            fields=CAMPI_METADATI,
+        )
+        request.http = _http_thread()
+
+        risposta = None
+        riprese = 0
+        while risposta is None:
+            try:
+                # num_retries: i 5xx/429 li ripete già la libreria
+                stato, risposta = request.next_chunk(num_retries=3)
+                riprese = 0
+            except (HttpError, OSError, httplib2.HttpLib2Error) as e:
+                if isinstance(e, HttpError) and e.resp.status < 500:
+                    raise
+                riprese += 1
+                if riprese > MAX_RIPRESE_UPLOAD:
+                    raise
+                # al prossimo next_chunk la libreria chiede a Drive quanti
+                # byte ha ricevuto e riparte da lì
+                time.sleep(min(2 ** riprese, 60))
+                continue
+            if stato and progresso:
+                progresso(stato.progress())
+        if progresso:
+            progresso(1.0)
+        return risposta
+
+    def elimina(self, nome: str, se_versione: str = None):
+        service, folder_id, _ = _get_drive_service()
+        self._verifica_versione(nome, se_versione)
+        _elimina_da_drive(service, folder_id, nome)
+
+    def elenca(self, prefisso: str = "") -> list:
+        service, folder_id, _ = _get_drive_service()
+        q = f"'{folder_id}' in parents and trashed=false"
+        if prefisso:
+            q += f" and name contains '{prefisso}'"
+        risultati, token = [], None
+        while True:
+            res = _esegui(
+                service.files().list(
+                    q=q,
+                    fields=f"nextPageToken,files({CAMPI_METADATI})",
+                    pageSize=1000,
+                    pageToken=token,
+                )
+            )
+            # "contains" su Drive non è un prefisso: filtro qui
+            risultati += [
+                f for f in res.get("files", []) if f["name"].startswith(prefisso)
+            ]
+            token = res.get("nextPageToken")
+            if not token:
+                return risultati
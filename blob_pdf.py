@@ -0,0 +1,86 @@
+import os
+import re
+import mmap
+import hashlib
+import tempfile
+
+# Archivio dei PDF (ricevute generate, allegati della prima nota) su disco locale,
+# indirizzato per contenuto: ogni file si chiama con lo SHA-256 dei suoi byte.
+# Nei DataFrame (colonna "PDF") resta solo l'hash; i byte si leggono, con mmap,
+# solo quando servono per anteprima, download o email.
+# Lo stesso PDF salvato due volte occupa spazio una volta sola.
+BLOB_DIR = os.getenv(
+    "ASD_BLOB_DIR", os.path.join(os.getenv("ASD_DATI_DIR", "dati_asd"), "pdf")
+)
+_HASH_VALIDO = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _hash_valido(valore) -> bool:
+    """True se valore è un hash SHA-256 esadecimale (niente percorsi arbitrari dai dati)."""
+    return isinstance(valore, str) and _HASH_VALIDO.fullmatch(valore) is not None
+
+
+def _percorso(hash_pdf: str) -> str:
+    if not _hash_valido(hash_pdf):
+        raise ValueError(f"Hash PDF non valido: {hash_pdf!r}")
+    # sottocartelle per le prime due cifre: evita cartelle con migliaia di file
+    return os.path.join(BLOB_DIR, hash_pdf[:2], f"{hash_pdf}.pdf")
+
+
+def salva_pdf(data: bytes):
+    """Salva il PDF (se non c'è già) e restituisce il suo hash; None se data è vuoto."""
+    if not data:
+        return None
+    hash_pdf = hashlib.sha256(data).hexdigest()
+    percorso = _percorso(hash_pdf)
+    if os.path.exists(percorso):
+        return hash_pdf
+
+    cartella = os.path.dirname(percorso)
+    os.makedirs(cartella, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cartella, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, percorso)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return hash_pdf
+
+
+def apri_pdf(valore):
+    """
+    Contenuto del PDF indicato da valore (hash della colonna "PDF"),
+    mappato in memoria e senza copie; None se non disponibile.
+    Accetta anche i byte del PDF (righe create prima dell'archivio su disco).
+    """
+    if isinstance(valore, (bytes, bytearray, memoryview)):
+        return valore if len(valore) else None
+    if not _hash_valido(valore):
+        return None
+    try:
+        with open(_percorso(valore), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+        return None
+
+
+def leggi_pdf(valore):
+    """Come apri_pdf, ma restituisce bytes (download, allegati email); None se non disponibile."""
+    contenuto = apri_pdf(valore)
+    if contenuto is None:
+        return None
+    return bytes(contenuto)
+
+
+def esiste_pdf(valore) -> bool:
+    if isinstance(valore, (bytes, bytearray, memoryview)):
+        return len(valore) > 0
+    return _hash_valido(valore) and os.path.exists(_percorso(valore))
+
@@ -0,0 +1,104 @@
+import os
+import glob
+import stat
+import hashlib
+import tempfile
+
+import pandas as pd
+
+from formati import CSV_GZ, PARQUET, PARQUET_DISPONIBILE, deserializza_df, serializza_df
+
+# Cache su disco dei file scaricati da Drive, già convertiti in DataFrame
+# (parquet, o csv.gz senza pyarrow: si rilegge più in fretta di xlsx).
+# Una voce vale finché non cambiano md5Checksum / modifiedTime / version del file.
+# La cartella è privata dell'utente (0700): se esiste ma appartiene a un altro
+# utente o non si può rendere privata, la cache non viene usata.
+CACHE_DIR = os.getenv("ASD_CACHE_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "appasd",
+)
+
+FORMATO_CACHE = PARQUET if PARQUET_DISPONIBILE else CSV_GZ
+ESTENSIONE_DF = ".parquet" if FORMATO_CACHE == PARQUET else ".csv.gz"
+
+CAMPI_METADATI = "id,name,md5Checksum,modifiedTime,version"
+
+
+def _cartella_privata() -> str:
+    """CACHE_DIR (creata se serve) dopo aver verificato che sia privata dell'utente."""
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+    if os.name != "posix":
+        return CACHE_DIR
+    info = os.lstat(CACHE_DIR)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"{CACHE_DIR}: cartella di cache non privata")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(CACHE_DIR, 0o700)
+    return CACHE_DIR
+
+
+def _percorso(meta: dict, estensione: str) -> str:
+    firma = "|".join(
+        str(meta.get(k, "")) for k in ("md5Checksum", "modifiedTime", "version")
+    )
+    digest = hashlib.sha1(firma.encode("utf-8")).hexdigest()[:16]
+    nome = os.path.basename(str(meta["id"]))
+    return os.path.join(_cartella_privata(), f"{nome}-{digest}{estensione}")
+
+
+def _scrivi_atomico(meta: dict, estensione: str, scrivi):
+    """Scrive su un file temporaneo e lo rinomina: niente file a metà in cache."""
+    percorso = _percorso(meta, estensione)
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            scrivi(f)
+        os.replace(tmp, percorso)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    # le revisioni precedenti dello stesso file non servono più
+    prefisso = os.path.basename(percorso).rsplit("-", 1)[0]
+    for vecchio in glob.glob(
+        os.path.join(CACHE_DIR, f"{glob.escape(prefisso)}-*{estensione}")
+    ):
+        if vecchio != percorso:
+            try:
+                os.remove(vecchio)
+            except OSError:
+                pass
+
+
+def leggi_df(meta: dict):
+    """DataFrame in cache per questa revisione del file, oppure None."""
+    try:
+        with open(_percorso(meta, ESTENSIONE_DF), "rb") as f:
+            return deserializza_df(f.read(), FORMATO_CACHE)
+    except Exception:
+        return None
+
+
+def scrivi_df(meta: dict, df: pd.DataFrame):
+    try:
+        data = serializza_df(df, FORMATO_CACHE)
+        _scrivi_atomico(meta, ESTENSIONE_DF, lambda f: f.write(data))
+    except Exception:
+        # la cache è solo un'ottimizzazione
+        pass
+
+
+def leggi_bytes(meta: dict):
+    """Contenuto in cache per questa revisione del file, oppure None."""
+    try:
+        with open(_percorso(meta, ".bin"), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def scrivi_bytes(meta: dict, data: bytes):
+    try:
+        _scrivi_atomico(meta, ".bin", lambda f: f.write(data))
+    except Exception:
+        pass
@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+
+# Cache in memoria con limite sulla dimensione totale (in byte) dei valori:
+# quando si supera il limite si scartano le voci usate meno di recente.
+# Condivisa tra le sessioni del processo (thread-safe).
+
+
+class CacheLRU:
+    def __init__(self, max_byte: int, dimensione=len):
+        self.max_byte = max_byte
+        self._dimensione = dimensione
+        self._lock = threading.Lock()
+        self._voci = OrderedDict()  # chiave -> (valore, byte)
+        self._byte = 0
+
+    def get(self, chiave):
+        """Valore in cache per chiave (e la segna come usata di recente), oppure None."""
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is None:
+                return None
+            self._voci.move_to_end(chiave)
+            return voce[0]
+
+    def put(self, chiave, valore):
+        n_byte = self._dimensione(valore)
+        if n_byte > self.max_byte:
+            # più grande dell'intera cache: non la svuotiamo per un solo valore
+            return
+        with self._lock:
+            vecchia = self._voci.pop(chiave, None)
+            if vecchia is not None:
+                self._byte -= vecchia[1]
+            self._voci[chiave] = (valore, n_byte)
+            self._byte += n_byte
+            while self._byte > self.max_byte:
+                _, (_, scartati) = self._voci.popitem(last=False)
+                self._byte -= scartati
+
+    def ottieni(self, chiave, calcola):
+        """Valore in cache per chiave; se manca lo calcola con calcola() e lo memorizza."""
+        valore = self.get(chiave)
+        if valore is None:
+            valore = calcola()
+            if valore is not None:
+                self.put(chiave, valore)
+        return valore
+
+    def byte_occupati(self) -> int:
+        with self._lock:
+            return self._byte
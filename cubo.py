@@ -0,0 +1,119 @@
+import pandas as pd
+
+# Cubo di aggregati della prima nota per dashboard e report:
+# somme e conteggi di entrate / uscite per
+# (anno, mese, tipo voce, centro di costo, metodo di pagamento).
+# Le celle sono poche (dipendono dalle combinazioni, non dal numero di
+# movimenti): le viste leggono il cubo invece di raggruppare tutta la prima nota.
+# Il cubo non si modifica: con_righe restituisce un nuovo cubo, così quello
+# letto da una sessione resta coerente con la sua versione del dataset.
+DIMENSIONI = ("Anno", "Mese", "TipoVoce", "CentroCosto", "MetodoPagamento")
+MISURE = ("Entrate", "Uscite", "NumEntrate", "NumUscite", "Righe")
+
+# Anno / mese delle righe senza data valida
+SENZA_DATA = 0
+
+
+def _aggrega(df: pd.DataFrame) -> dict:
+    """{(anno, mese, tipo, centro, metodo): (entrate, uscite, n_entrate, n_uscite, righe)}"""
+    if df is None or df.empty:
+        return {}
+    date = pd.to_datetime(df["Data"], errors="coerce")
+
+    def _testo(col):
+        if col not in df.columns:
+            return pd.Series("", index=df.index)
+        return df[col].astype(object).where(df[col].notna(), "").astype(str)
+
+    def _importo(col):
+        if col not in df.columns:
+            return pd.Series(0.0, index=df.index)
+        return pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+
+    entrate, uscite = _importo("Entrata"), _importo("Uscita")
+    chiavi = [
+        date.dt.year.fillna(SENZA_DATA).astype(int).rename("Anno"),
+        date.dt.month.fillna(SENZA_DATA).astype(int).rename("Mese"),
+        _testo("TipoVoce").rename("TipoVoce"),
+        _testo("CentroCosto").rename("CentroCosto"),
+        _testo("MetodoPagamento").rename("MetodoPagamento"),
+    ]
+    valori = pd.DataFrame(
+        {
+            "Entrate": entrate,
+            "Uscite": uscite,
+            "NumEntrate": (entrate > 0).astype(int),
+            "NumUscite": (uscite > 0).astype(int),
+            "Righe": 1,
+        },
+        index=df.index,
+    )
+    gruppi = valori.groupby(chiavi, sort=False).sum()
+    return {
+        chiave: tuple(riga)
+        for chiave, riga in zip(gruppi.index, gruppi.itertuples(index=False, name=None))
+    }
+
+
+class CuboPrimaNota:
+    def __init__(self, celle: dict = None):
+        self._celle = celle or {}
+        self._tabella = None
+
+    @classmethod
+    def da_df(cls, df: pd.DataFrame) -> "CuboPrimaNota":
+        """Cubo calcolato da zero (caricamento iniziale, sostituzione del dataset)."""
+        return cls(_aggrega(df))
+
+    def con_righe(self, righe: pd.DataFrame) -> "CuboPrimaNota":
+        """Nuovo cubo con in più le righe aggiunte (costo proporzionale alle righe nuove)."""
+        celle = dict(self._celle)
+        for chiave, valori in _aggrega(righe).items():
+            vecchi = celle.get(chiave)
+            celle[chiave] = valori if vecchi is None else tuple(
+                a + b for a, b in zip(vecchi, valori)
+            )
+        return CuboPrimaNota(celle)
+
+    def tabella(self) -> pd.DataFrame:
+        """Celle del cubo come DataFrame (colonne DIMENSIONI + MISURE)."""
+        if self._tabella is None:
+            righe = [chiave + valori for chiave, valori in self._celle.items()]
+            self._tabella = pd.DataFrame(righe, columns=list(DIMENSIONI + MISURE))
+        return self._tabella
+
+    # ---------- viste ----------
+    def anni(self) -> list:
+        return sorted({k[0] for k in self._celle if k[0] != SENZA_DATA})
+
+    def righe_senza_data(self) -> int:
+        return sum(v[4] for k, v in self._celle.items() if k[0] == SENZA_DATA)
+
+    def entrate_per_mese(self) -> pd.DataFrame:
+        """Colonne AnnoMese (aaaa-mm) ed Entrata, in ordine di mese."""
+        t = self.tabella()
+        t = t[t["Anno"] != SENZA_DATA]
+        per_mese = t.groupby(["Anno", "Mese"])["Entrate"].sum().reset_index()
+        return pd.DataFrame(
+            {
+                "AnnoMese": [f"{a:04d}-{m:02d}" for a, m in zip(per_mese["Anno"], per_mese["Mese"])],
+                "Entrata": per_mese["Entrate"],
+            }
+        ).sort_values("AnnoMese")
+
+    def totali_per(self, dimensione: str, anno: int = None, misura: str = "Entrate") -> pd.DataFrame:
+        """
+        Somma di misura per dimensione (es. TipoVoce), in ordine decrescente;
+        con anno solo i movimenti di quell'anno. Colonne: dimensione, Entrata/Uscita.
+        """
+        t = self.tabella()
+        if anno is not None:
+            t = t[t["Anno"] == anno]
+        colonna = {"Entrate": "Entrata", "Uscite": "Uscita"}.get(misura, misura)
+        return (
+            t.groupby(dimensione)[misura]
+            .sum()
+            .reset_index()
+            .rename(columns={misura: colonna})
+            .sort_values(colonna, ascending=False)
+        )
@@ -1,5 +1,7 @@
 import streamlit as st
-import pandas as pd
+
+from dataset_condivisi import vista_dataset
+from schema import avviso_date_mancanti
 
 
 def pagina_dashboard():
@@ -10,23 +12,16 @@ def pagina_dashboard():
         st.info("La prima nota è vuota. Genera prima qualche ricevuta.")
         return
 
-    df = st.session_state.prima_nota.copy()
-
-    # Converto data in datetime e creo campo AnnoMese
-    df["Data_dt"] = pd.to_datetime(df["Data"], format="%d/%m/%Y", errors="coerce")
-    df["AnnoMese"] = df["Data_dt"].dt.to_period("M").astype(str)
+    # cubo di aggregati della prima nota: niente groupby sull'intero dataset
+    cubo = vista_dataset("prima_nota")
+    avviso_date_mancanti(cubo.righe_senza_data())
 
     # ==========================
     # ENTRATE PER MESE
     # ==========================
     st.markdown("### Entrate per mese")
 
-    entrate_mese = (
-        df.groupby("AnnoMese")["Entrata"]
-        .sum()
-        .reset_index()
-        .sort_values("AnnoMese")
-    )
+    entrate_mese = cubo.entrate_per_mese()
 
     if entrate_mese.empty:
         st.info("Nessuna entrata registrata per mese.")
@@ -42,12 +37,7 @@ def pagina_dashboard():
     # ==========================
     st.markdown("### Entrate per tipologia importo")
 
-    entrate_tipo = (
-        df.groupby("TipoVoce")["Entrata"]
-        .sum()
-        .reset_index()
-        .sort_values("Entrata", ascending=False)
-    )
+    entrate_tipo = cubo.totali_per("TipoVoce")
 
     if entrate_tipo.empty:
         st.info("Nessuna entrata per tipologia.")
@@ -63,12 +53,7 @@ def pagina_dashboard():
     # ==========================
     st.markdown("### Entrate per attività / centro di costo")
 
-    entrate_centro = (
-        df.groupby("CentroCosto")["Entrata"]
-        .sum()
-        .reset_index()
-        .sort_values("Entrata", ascending=False)
-    )
+    entrate_centro = cubo.totali_per("CentroCosto")
 
     if entrate_centro.empty:
         st.info("Nessuna entrata per attività / centro di costo.")
@@ -0,0 +1,253 @@
+import itertools
+import threading
+
+import pandas as pd
+import streamlit as st
+
+from cubo import CuboPrimaNota
+from registro import Registro
+from schema import normalizza_df
+
+# Dataset condivisi da tutte le sessioni Streamlit del processo
+# (ricevute_emesse, prima_nota, soci).
+#
+# Ogni dataset ha una versione che cresce a ogni modifica. Le sessioni tengono
+# in st.session_state un riferimento allo stesso DataFrame dell'archivio (niente
+# copie per sessione) e a ogni rerun passano alla versione più recente.
+# I DataFrame pubblicati non vanno mai modificati sul posto: ogni modifica
+# crea un nuovo DataFrame e lo pubblica con una nuova versione.
+# Le righe aggiunte finiscono nel Registro del dataset (registro.py) e le
+# sessioni le vedono alla prima lettura successiva (dataset()).
+# I dati entrano nell'archivio già normalizzati (colonne e tipi di schema.py).
+#
+# Alcuni dataset hanno anche una vista materializzata (es. il cubo di
+# aggregati della prima nota): aggiornata in modo incrementale quando si
+# aggiungono righe, ricalcolata (alla prima richiesta) quando il dataset
+# viene sostituito.
+VISTE = {
+    "prima_nota": CuboPrimaNota,
+}
+
+# Numeri progressivi che identificano un contenuto nel processo (vedi versione_dataset)
+_contatore_contenuti = itertools.count(1)
+_contatore_lock = threading.Lock()
+
+
+def _nuovo_numero() -> int:
+    with _contatore_lock:
+        return next(_contatore_contenuti)
+
+
+class ArchivioDataset:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dati = {}  # nome -> (versione, Registro)
+        self._viste = {}  # nome -> (versione, vista)
+        self._prossimi = {}  # nome -> primo numero non ancora riservato
+        self._contenuti = {}  # nome -> (versione, numero del contenuto)
+
+    def snapshot(self, nome: str):
+        """(versione, DataFrame) correnti del dataset; (0, None) se non c'è."""
+        with self._lock:
+            versione, registro = self._dati.get(nome, (0, None))
+            return versione, registro.df() if registro is not None else None
+
+    def versione(self, nome: str) -> int:
+        with self._lock:
+            return self._dati.get(nome, (0, None))[0]
+
+    def contenuto(self, nome: str, versione: int):
+        """
+        Numero del contenuto del dataset alla versione indicata, lo stesso per
+        tutte le sessioni (chiave per le cache); None se versione non è l'ultima.
+        """
+        with self._lock:
+            attuale = self._contenuti.get(nome)
+            return attuale[1] if attuale is not None and attuale[0] == versione else None
+
+    def nomi(self) -> list:
+        with self._lock:
+            return list(self._dati)
+
+    def pubblica(self, nome: str, df: pd.DataFrame, se_versione: int = None) -> int:
+        """
+        Pubblica df come nuova versione del dataset e restituisce la versione.
+        Con se_versione pubblica solo se la versione corrente è ancora quella
+        (altrimenti non cambia nulla e restituisce la versione corrente).
+        """
+        return self.pubblica_se(nome, df, se_versione)[1]
+
+    def pubblica_se(self, nome: str, df: pd.DataFrame, se_versione: int = None) -> tuple:
+        """Come pubblica, ma restituisce (pubblicato, versione corrente)."""
+        with self._lock:
+            versione = self.versione(nome)
+            if se_versione is not None and versione != se_versione:
+                return False, versione
+            self._dati[nome] = (versione + 1, Registro(nome, df))
+            self._contenuti[nome] = (versione + 1, _nuovo_numero())
+            return True, versione + 1
+
+    def aggiungi_righe(self, nome: str, righe: pd.DataFrame, colonne=None) -> int:
+        """
+        Aggiunge righe (normalizzate con schema.py) all'ultima versione del
+        dataset e restituisce la nuova versione. Il DataFrame completo viene
+        ricomposto solo alla prima lettura (vedi registro.Registro).
+        """
+        with self._lock:
+            versione, registro = self._dati.get(nome, (0, None))
+            if registro is None:
+                vuoto = pd.DataFrame(columns=colonne if colonne is not None else righe.columns)
+                registro = Registro(nome, normalizza_df(nome, vuoto))
+            blocco = registro.aggiungi(righe)
+            self._dati[nome] = (versione + 1, registro)
+            self._contenuti[nome] = (versione + 1, _nuovo_numero())
+            vista = self._viste.get(nome)
+            if vista is not None and vista[0] == versione:
+                self._viste[nome] = (versione + 1, vista[1].con_righe(blocco))
+            return versione + 1
+
+    def _primo_libero(self, nome: str, colonna: str, base) -> int:
+        _, registro = self._dati.get(nome, (0, None))
+        df = registro.df() if registro is not None else base
+        massimo = 0
+        if df is not None and colonna in df.columns and not df.empty:
+            valore = pd.to_numeric(df[colonna], errors="coerce").max()
+            massimo = 0 if pd.isna(valore) else int(valore)
+        return max(massimo + 1, self._prossimi.get(nome, 1))
+
+    def prossimo_numero(self, nome: str, colonna: str = "Numero", base=None) -> int:
+        """Primo numero che riserva_numeri assegnerebbe ora (senza riservarlo)."""
+        with self._lock:
+            return self._primo_libero(nome, colonna, base)
+
+    def riserva_numeri(self, nome: str, n: int, colonna: str = "Numero", base=None) -> int:
+        """
+        Riserva n numeri consecutivi (es. numeri di ricevuta) e restituisce il
+        primo: dopo il massimo numerico di colonna nel dataset e dopo i numeri
+        già riservati da altre sessioni. base: DataFrame da usare se il
+        dataset non è ancora nell'archivio.
+        """
+        with self._lock:
+            primo = self._primo_libero(nome, colonna, base)
+            self._prossimi[nome] = primo + n
+            return primo
+
+    def vista(self, nome: str, versione: int):
+        """
+        Vista materializzata del dataset alla versione indicata (calcolata
+        se manca); None se il dataset non ha viste o versione non è l'ultima.
+        """
+        tipo = VISTE.get(nome)
+        if tipo is None:
+            return None
+        with self._lock:
+            vista = self._viste.get(nome)
+            if vista is not None and vista[0] == versione:
+                return vista[1]
+            attuale, registro = self._dati.get(nome, (0, None))
+            if attuale != versione or registro is None:
+                return None
+            calcolata = tipo.da_df(registro.df())
+            self._viste[nome] = (versione, calcolata)
+            return calcolata
+
+
+_archivio = ArchivioDataset()
+
+
+def get_archivio() -> ArchivioDataset:
+    """Archivio dei dataset unico per il processo."""
+    return _archivio
+
+
+def _imposta_in_sessione(nome: str, versione: int, df: pd.DataFrame):
+    st.session_state[nome] = df
+    st.session_state.setdefault("versioni_dataset", {})[nome] = versione
+
+
+def sincronizza_sessione():
+    """Porta st.session_state all'ultima versione di ogni dataset condiviso."""
+    versioni = st.session_state.setdefault("versioni_dataset", {})
+    for nome in _archivio.nomi():
+        versione, df = _archivio.snapshot(nome)
+        if versioni.get(nome) != versione:
+            _imposta_in_sessione(nome, versione, df)
+
+
+def dataset(nome: str):
+    """
+    DataFrame del dataset nome per la sessione corrente, portato all'ultima
+    versione dell'archivio (righe aggiunte da questa o da altre sessioni).
+    """
+    versione = _archivio.versione(nome)
+    if versione and st.session_state.get("versioni_dataset", {}).get(nome) != versione:
+        versione, df = _archivio.snapshot(nome)
+        _imposta_in_sessione(nome, versione, df)
+    return st.session_state.get(nome)
+
+
+def versione_dataset(nome: str) -> int:
+    """
+    Numero che identifica il contenuto attuale del dataset nome nella sessione,
+    unico nel processo (chiave per le cache di indici, ordinamenti ed export).
+    Per i dataset dell'archivio è il numero assegnato dall'archivio alla
+    versione, uguale per tutte le sessioni; per i DataFrame solo in sessione
+    ne viene assegnato uno nuovo ogni volta che il DataFrame cambia (non si usa
+    id(), che dopo il garbage collector può essere riassegnato).
+    """
+    df = dataset(nome)
+    contenuti = st.session_state.setdefault("contenuti_dataset", {})
+    visto = contenuti.get(nome)
+    if visto is None or visto[0] is not df:
+        versione = st.session_state.get("versioni_dataset", {}).get(nome)
+        numero = _archivio.contenuto(nome, versione) if versione else None
+        if numero is None:
+            numero = _nuovo_numero()
+        # il riferimento tiene vivo il DataFrame: il confronto con "is" resta valido
+        contenuti[nome] = visto = (df, numero)
+    return visto[1]
+
+
+def vista_dataset(nome: str):
+    """Vista materializzata (es. cubo della prima nota) dell'ultima versione del dataset."""
+    versione = _archivio.versione(nome)
+    vista = _archivio.vista(nome, versione) if versione else None
+    if vista is None:
+        # dataset solo in sessione (non ancora nell'archivio)
+        vista = VISTE[nome].da_df(dataset(nome))
+    return vista
+
+
+def prossimo_numero(nome: str, colonna: str = "Numero") -> str:
+    """Prossimo numero libero di colonna (solo da mostrare: non è riservato)."""
+    return str(_archivio.prossimo_numero(nome, colonna, base=st.session_state.get(nome)))
+
+
+def riserva_numeri(nome: str, n: int, colonna: str = "Numero") -> list:
+    """n numeri consecutivi (testo) riservati per nuove righe di nome, unici tra le sessioni."""
+    primo = _archivio.riserva_numeri(nome, n, colonna, base=st.session_state.get(nome))
+    return [str(primo + i) for i in range(n)]
+
+
+def pubblica_dataset(nome: str, df: pd.DataFrame, se_versione: int = None) -> bool:
+    """
+    Sostituisce il dataset (per tutte le sessioni) e aggiorna la sessione corrente.
+    Con se_versione sostituisce solo se nessuno l'ha modificato dopo quella
+    versione (es. la versione letta dalla sessione) e restituisce False se
+    non l'ha sostituito: le righe aggiunte nel frattempo non vanno perse.
+    """
+    df = normalizza_df(nome, df)
+    pubblicato, versione = _archivio.pubblica_se(nome, df, se_versione=se_versione)
+    if pubblicato:
+        _imposta_in_sessione(nome, versione, df)
+    return pubblicato
+
+
+def aggiungi_righe(nome: str, righe: pd.DataFrame, colonne=None):
+    """
+    Aggiunge righe al dataset condiviso partendo dalla sua ultima versione
+    (anche se la sessione corrente non l'ha ancora vista) e restituisce la
+    nuova versione. Il DataFrame aggiornato si legge con dataset(nome).
+    colonne: colonne da usare se il dataset non esiste ancora.
+    """
+    return _archivio.aggiungi_righe(nome, righe, colonne)
@@ -1,11 +1,16 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
+from functools import lru_cache
 import io
 import base64
 import os
-import smtplib
-from email.message import EmailMessage
+import zipfile
+from functools import partial
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -13,37 +18,46 @@ from reportlab.lib.units import mm
 from reportlab.lib.utils import ImageReader
 import streamlit.components.v1 as components
 
-from drive_utils import salva_df_su_drive
+from blob_pdf import leggi_pdf, salva_pdf
+from cache_memoria import CacheLRU
+from esportazioni import bottone_export_excel, excel_bytes
+from griglia import griglia_paginata
+from immagini import (
+    LARGHEZZA_MINIATURA_PX,
+    LATO_LOGO_PUNTI,
+    hash_contenuto,
+    miniatura_pdf,
+    normalizza_logo,
+)
+from ricerca_soci import indice_soci
+from schema import (
+    COLONNA_ID,
+    COLONNE_PRIMA_NOTA,
+    COLONNE_RICEVUTE,
+    FORMATO_DATA,
+    df_vuoto,
+    formatta_data,
+    nuovi_id,
+)
+from posta import (
+    crea_messaggio,
+    get_coda_posta,
+    invia_subito,
+    mittente_configurato,
+    mostra_stato_invii,
+)
+from persistenza import accoda_salvataggio, mostra_stato_sincronizzazione
+from dataset_condivisi import (
+    aggiungi_righe,
+    dataset,
+    prossimo_numero,
+    riserva_numeri,
+    versione_dataset,
+)
 
 # ==========================
 # COSTANTI
 # ==========================
-COLONNE_RICEVUTE = [
-    "Numero",
-    "Data",
-    "Intestatario",
-    "CF",
-    "TipoVoce",
-    "CentroCosto",
-    "Causale",
-    "Importo",
-    "MetodoPagamento",
-    "Note",
-    "PDF",
-]
-
-COLONNE_PRIMA_NOTA = [
-    "Data",
-    "NumeroDocumento",
-    "Intestatario",
-    "TipoVoce",
-    "CentroCosto",
-    "Causale",
-    "Entrata",
-    "Uscita",
-    "MetodoPagamento",
-]
-
 # Listino rapido
 LISTINO = [
     {
@@ -92,10 +106,28 @@ def split_text(text: str, max_chars: int):
     return lines
 
 
-def crea_pdf_ricevuta(associazione: dict, dati: dict) -> bytes:
-    """Crea il PDF della ricevuta (layout elegante, con logo opzionale)."""
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+# Parte del PDF che dipende solo dall'associazione (logo + intestazione)
+CAMPI_INTESTAZIONE = (
+    "Denominazione",
+    "CodiceFiscale",
+    "Indirizzo",
+    "CAP",
+    "Comune",
+    "Provincia",
+    "Email",
+    "Telefono",
+)
+
+
+@lru_cache(maxsize=16)
+def _layout_intestazione(campi: tuple, logo_bytes):
+    """
+    Logo già decodificato e righe dell'intestazione, calcolati una volta per
+    ogni combinazione (dati associazione, logo) e riusati da tutte le ricevute.
+    Restituisce (logo_img, logo_xy, righe, y_separatore, y_fine) con righe =
+    ((font, dimensione, x, y, testo), ...).
+    """
+    associazione = dict(zip(CAMPI_INTESTAZIONE, campi))
     width, height = A4
 
     margin_left = 20 * mm
@@ -103,52 +135,42 @@ def crea_pdf_ricevuta(associazione: dict, dati: dict) -> bytes:
     y = margin_top
 
     # Logo
-    logo_bytes = associazione.get("Logo")
-    logo_width_mm = 30
-    logo_height_mm = 30
+    logo_width_mm = LATO_LOGO_PUNTI
+    logo_height_mm = LATO_LOGO_PUNTI
+    logo_img = None
+    x_text = margin_left
 
     if logo_bytes:
         try:
             logo_img = ImageReader(io.BytesIO(logo_bytes))
-            c.drawImage(
-                logo_img,
-                margin_left,
-                y - logo_height_mm,
-                width=logo_width_mm,
-                height=logo_height_mm,
-                preserveAspectRatio=True,
-                mask="auto",
-            )
+            # decodifica subito: le ricevute successive trovano i pixel pronti
+            logo_img.getRGBData()
             x_text = margin_left + logo_width_mm + 10
         except Exception:
-            x_text = margin_left
-    else:
-        x_text = margin_left
+            logo_img = None
 
     denominazione = (
         associazione.get("Denominazione") or "ASSOCIAZIONE SPORTIVA DILETTANTISTICA"
     )
 
     # Intestazione
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(x_text, y, denominazione)
+    righe = [("Helvetica-Bold", 14, x_text, y, denominazione)]
     y -= 14
 
-    c.setFont("Helvetica", 9)
     if associazione.get("CodiceFiscale"):
-        c.drawString(x_text, y, f'CF: {associazione["CodiceFiscale"]}')
+        righe.append(("Helvetica", 9, x_text, y, f'CF: {associazione["CodiceFiscale"]}'))
         y -= 10
 
     indirizzo = " ".join(
         [
-            associazione.get("Indirizzo", ""),
-            associazione.get("CAP", ""),
-            associazione.get("Comune", ""),
+            associazione.get("Indirizzo") or "",
+            associazione.get("CAP") or "",
+            associazione.get("Comune") or "",
             f'({associazione.get("Provincia", "")})' if associazione.get("Provincia") else "",
         ]
     ).strip()
     if indirizzo:
-        c.drawString(x_text, y, indirizzo)
+        righe.append(("Helvetica", 9, x_text, y, indirizzo))
         y -= 10
 
     contatti = []
@@ -157,15 +179,52 @@ def crea_pdf_ricevuta(associazione: dict, dati: dict) -> bytes:
     if associazione.get("Telefono"):
         contatti.append(f'Tel: {associazione["Telefono"]}')
     if contatti:
-        c.drawString(x_text, y, " - ".join(contatti))
+        righe.append(("Helvetica", 9, x_text, y, " - ".join(contatti)))
         y -= 12
 
     # Separatore
     y -= 4
-    c.setLineWidth(0.7)
-    c.line(margin_left, y, width - margin_left, y)
+    y_separatore = y
     y -= 18
 
+    logo_xy = (margin_left, margin_top - logo_height_mm, logo_width_mm, logo_height_mm)
+    return logo_img, logo_xy, tuple(righe), y_separatore, y
+
+
+def crea_pdf_ricevuta(associazione: dict, dati: dict) -> bytes:
+    """Crea il PDF della ricevuta (layout elegante, con logo opzionale)."""
+    buffer = io.BytesIO()
+    # invariant=1: niente data di creazione / ID casuali, stesso input -> stessi byte
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1, invariant=1)
+    width, height = A4
+
+    margin_left = 20 * mm
+
+    # Logo + intestazione (calcolati una volta per associazione)
+    logo_img, logo_xy, righe, y_separatore, y = _layout_intestazione(
+        tuple(associazione.get(k) for k in CAMPI_INTESTAZIONE),
+        normalizza_logo(associazione.get("Logo")),
+    )
+
+    if logo_img is not None:
+        x_logo, y_logo, w_logo, h_logo = logo_xy
+        c.drawImage(
+            logo_img,
+            x_logo,
+            y_logo,
+            width=w_logo,
+            height=h_logo,
+            preserveAspectRatio=True,
+            mask="auto",
+        )
+
+    for font, size, x, y_riga, testo in righe:
+        c.setFont(font, size)
+        c.drawString(x, y_riga, testo)
+
+    c.setLineWidth(0.7)
+    c.line(margin_left, y_separatore, width - margin_left, y_separatore)
+
     # Titolo
     c.setFont("Helvetica-Bold", 16)
     c.drawCentredString(width / 2, y, "RICEVUTA GENERICA")
@@ -233,12 +292,84 @@ def crea_pdf_ricevuta(associazione: dict, dati: dict) -> bytes:
     return pdf
 
 
+# PDF rigenerati dalle righe salvate (es. dopo un riavvio le ricevute
+# ricaricate da Drive non hanno il PDF): crea_pdf_ricevuta è deterministica,
+# quindi basta tenere in memoria quelli usati di recente.
+MAX_MB_CACHE_PDF = int(os.getenv("ASD_CACHE_PDF_MB", "32"))
+_cache_pdf = CacheLRU(MAX_MB_CACHE_PDF * 1024 * 1024)
+
+
+def _testo_riga(valore) -> str:
+    if valore is None or (not isinstance(valore, str) and pd.isna(valore)):
+        return ""
+    return str(valore)
+
+
+def dati_da_riga(riga) -> dict:
+    """Dati per crea_pdf_ricevuta ricostruiti da una riga di ricevute_emesse (None se la data non è valida)."""
+    data_r = riga.get("Data")
+    if isinstance(data_r, str):
+        # riga non normalizzata (data ancora in testo)
+        data_r = pd.to_datetime(data_r, format=FORMATO_DATA, errors="coerce")
+    if data_r is None or pd.isna(data_r):
+        return None
+    try:
+        importo = float(riga.get("Importo") or 0)
+    except (TypeError, ValueError):
+        importo = 0.0
+    dati = {k: _testo_riga(riga.get(k)) for k in COLONNE_RICEVUTE if k != "PDF"}
+    dati["Data"] = pd.Timestamp(data_r).date()
+    dati["Importo"] = 0.0 if pd.isna(importo) else importo
+    return dati
+
+
+def pdf_ricevuta(associazione: dict, riga):
+    """
+    PDF della ricevuta della riga: dall'archivio su disco se c'è, altrimenti
+    rigenerato (e tenuto nella cache LRU). None se la riga non basta a ricrearlo.
+    """
+    pdf_bytes = leggi_pdf(riga.get("PDF"))
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    dati = dati_da_riga(riga)
+    if dati is None:
+        return None
+    logo = normalizza_logo(associazione.get("Logo"))
+    chiave = (
+        tuple(associazione.get(k) for k in CAMPI_INTESTAZIONE),
+        hash_contenuto(logo) if logo else None,
+        tuple(sorted((k, str(v)) for k, v in dati.items())),
+    )
+    return _cache_pdf.ottieni(chiave, lambda: crea_pdf_ricevuta(associazione, dati))
+
+
 def pdf_to_base64(pdf_bytes: bytes) -> str:
     return base64.b64encode(pdf_bytes).decode()
 
 
-def mostra_preview_pdf(pdf_bytes: bytes):
-    """Anteprima PDF con fallback."""
+def mostra_preview_pdf(pdf_bytes, chiave: str = "anteprima"):
+    """
+    Anteprima leggera: miniatura PNG della prima pagina (calcolata una volta);
+    il PDF completo viene inviato al browser solo su richiesta.
+    Senza miniatura (pypdfium2 non installato) usa l'anteprima PDF incorporata.
+    chiave distingue i widget se ci sono più anteprime nella stessa pagina.
+    """
+    miniatura = miniatura_pdf(pdf_bytes)
+    if miniatura is None:
+        mostra_pdf_completo(pdf_bytes)
+        return
+
+    st.image(miniatura, caption="Anteprima prima pagina", width=LARGHEZZA_MINIATURA_PX)
+    if st.toggle(
+        "Mostra PDF completo",
+        key=f"{chiave}_completo_{hash_contenuto(pdf_bytes)[:16]}",
+    ):
+        mostra_pdf_completo(pdf_bytes)
+
+
+def mostra_pdf_completo(pdf_bytes):
+    """PDF incorporato nella pagina (data URI), con fallback."""
     b64 = pdf_to_base64(pdf_bytes)
     html = f"""
     <object data="data:application/pdf;base64,{b64}" type="application/pdf" width="100%" height="600px">
@@ -260,50 +391,382 @@ def invia_email_con_pdf(
     filename: str = "ricevuta.pdf",
 ):
     """
-    Invio email con allegato PDF.
+    Invio email con allegato PDF, sulla sessione SMTP condivisa (vedi posta.py).
     Richiede variabili ambiente SMTP_* e SENDER_EMAIL.
     """
-    smtp_server = os.getenv("SMTP_SERVER")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-    sender_email = os.getenv("SENDER_EMAIL", smtp_user)
+    return invia_subito(destinatario, oggetto, corpo, pdf_bytes, filename)
 
-    if not (smtp_server and smtp_user and smtp_password and sender_email):
-        return False, "SMTP non configurato nelle variabili d'ambiente."
 
-    try:
-        msg = EmailMessage()
-        msg["Subject"] = oggetto
-        msg["From"] = sender_email
-        msg["To"] = destinatario
-        msg.set_content(corpo)
-
-        msg.add_attachment(
-            pdf_bytes,
-            maintype="application",
-            subtype="pdf",
-            filename=filename,
-        )
+def _oggetto_corpo_email(associazione: dict, numero, intestatario) -> tuple:
+    denominazione = associazione.get("Denominazione", "")
+    oggetto = f"Ricevuta n. {numero} - {denominazione}"
+    corpo = (
+        f"Gentile {intestatario},\n\n"
+        "in allegato trova la ricevuta del versamento effettuato.\n\n"
+        f"Saluti,\n{denominazione}"
+    )
+    return oggetto, corpo
+
+
+def email_soci(soci: pd.DataFrame) -> tuple:
+    """Indirizzi email dei soci: (per codice fiscale, per "Nome Cognome")."""
+    if soci is None or soci.empty or "Email" not in soci.columns:
+        return {}, {}
+    email = soci["Email"].fillna("").astype(str).str.strip()
+    per_cf, per_nome = {}, {}
+    cf_col = "CF" if "CF" in soci.columns else None
+    if cf_col:
+        cf = soci[cf_col].fillna("").astype(str).str.strip().str.upper()
+        per_cf = {k: v for k, v in zip(cf, email) if k and v}
+    nomi = (
+        soci.get("Nome", pd.Series("", index=soci.index)).fillna("").astype(str).str.strip()
+        + " "
+        + soci.get("Cognome", pd.Series("", index=soci.index)).fillna("").astype(str).str.strip()
+    ).str.strip()
+    per_nome = {k: v for k, v in zip(nomi, email) if k and v}
+    return per_cf, per_nome
+
+
+def accoda_email_ricevute(associazione: dict, ricevute: pd.DataFrame, soci: pd.DataFrame, lotto: str):
+    """
+    Accoda l'invio via email delle ricevute ai soci (indirizzo cercato per CF,
+    poi per nominativo). I PDF vengono preparati dalla coda al momento dell'invio.
+    Le ricevute già in coda o già inviate nello stesso lotto vengono saltate.
+    Restituisce (accodate, numeri delle ricevute senza indirizzo).
+    """
+    mittente = mittente_configurato()
+    per_cf, per_nome = email_soci(soci)
+    associazione = dict(associazione)
+    elementi, senza_email = [], []
+    for _, riga in ricevute.iterrows():
+        cf = _testo_riga(riga.get("CF")).strip().upper()
+        intestatario = _testo_riga(riga.get("Intestatario")).strip()
+        destinatario = per_cf.get(cf) or per_nome.get(intestatario)
+        if not destinatario:
+            senza_email.append(riga["Numero"])
+            continue
+
+        def crea(riga=riga, destinatario=destinatario):
+            pdf_bytes = pdf_ricevuta(associazione, riga)
+            if pdf_bytes is None:
+                raise ValueError("PDF non ricreabile (data non valida)")
+            oggetto, corpo = _oggetto_corpo_email(
+                associazione, riga["Numero"], riga["Intestatario"]
+            )
+            return crea_messaggio(
+                mittente, destinatario, oggetto, corpo, pdf_bytes, f"ricevuta_{riga['Numero']}.pdf"
+            )
 
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
+        chiave = _testo_riga(riga.get(COLONNA_ID)) or f"n. {riga['Numero']}"
+        elementi.append((chiave, f"Ricevuta n. {riga['Numero']} a {destinatario}", crea))
 
-        return True, "Email inviata correttamente."
-    except Exception as e:
-        return False, f"Errore invio email: {e}"
+    accodate = get_coda_posta().accoda_lotto(lotto, elementi) if elementi else 0
+    return accodate, senza_email
 
 
 def df_to_excel_bytes(df: pd.DataFrame, sheet_name: str = "Dati") -> bytes:
+    return excel_bytes([(sheet_name, df)])
+
+
+# ==========================
+# EMISSIONE MASSIVA
+# ==========================
+def _contesto_processi():
+    """forkserver dove disponibile (Linux, macOS), altrimenti spawn."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def genera_pdf_ricevute(associazione: dict, lista_dati: list) -> list:
+    """
+    crea_pdf_ricevuta per ogni elemento di lista_dati, su un pool di processi
+    (il rendering dei PDF è CPU-bound). Se il pool non è disponibile o i dati
+    non sono serializzabili, in sequenza. Gli errori di crea_pdf_ricevuta
+    (anche nei processi figli) non vengono intercettati.
+    """
+
+    def _in_sequenza():
+        return [crea_pdf_ricevuta(associazione, d) for d in lista_dati]
+
+    if len(lista_dati) < 2:
+        return _in_sequenza()
+
+    try:
+        # verificato qui: nel pool l'errore arriverebbe come un errore qualsiasi del figlio
+        pickle.dumps((associazione, lista_dati))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return _in_sequenza()
+
+    n_processi = min(os.cpu_count() or 1, len(lista_dati))
+    try:
+        # niente fork dal server Streamlit (multithread): un figlio creato con
+        # fork può ereditare lock presi da altri thread e bloccarsi
+        pool = ProcessPoolExecutor(max_workers=n_processi, mp_context=_contesto_processi())
+    except (OSError, RuntimeError):
+        return _in_sequenza()
+
+    with pool:
+        try:
+            # map accoda subito tutti i lavori e avvia i processi
+            risultati = pool.map(
+                partial(crea_pdf_ricevuta, associazione),
+                lista_dati,
+                chunksize=max(1, len(lista_dati) // (n_processi * 4)),
+            )
+        except (OSError, RuntimeError, BrokenProcessPool):
+            # processi non avviabili
+            pool.shutdown(cancel_futures=True)
+            risultati = None
+        if risultati is not None:
+            try:
+                return list(risultati)
+            except BrokenProcessPool:
+                # un figlio è terminato di colpo (es. memoria esaurita)
+                pass
+    return _in_sequenza()
+
+
+def emetti_ricevute_massive(
+    soci_sel: pd.DataFrame,
+    cf_col,
+    attivita_col,
+    data_r: date,
+    tipo_voce: str,
+    causale: str,
+    importo: float,
+    metodo: str,
+):
+    """
+    Una ricevuta per ogni socio di soci_sel, con numeri consecutivi.
+    Aggiorna ricevute e prima nota con un solo inserimento ciascuna, accoda un
+    solo salvataggio per file e restituisce lo ZIP dei PDF.
+    """
+    n = len(soci_sel)
+    numeri = riserva_numeri("ricevute_emesse", n)
+
+    def _testo(col):
+        if not col or col not in soci_sel.columns:
+            return pd.Series("", index=soci_sel.index)
+        return soci_sel[col].fillna("").astype(str).str.strip()
+
+    intestatari = (_testo("Nome") + " " + _testo("Cognome")).str.strip().tolist()
+    cf = _testo(cf_col).tolist()
+    centri = _testo(attivita_col).tolist()
+
+    lista_dati = [
+        {
+            "Numero": numeri[i],
+            "Data": data_r,
+            "Intestatario": intestatari[i],
+            "CF": cf[i],
+            "TipoVoce": tipo_voce,
+            "CentroCosto": centri[i],
+            "Causale": causale,
+            "Importo": importo,
+            "MetodoPagamento": metodo,
+            "Note": "",
+        }
+        for i in range(n)
+    ]
+    pdfs = genera_pdf_ricevute(st.session_state.associazione, lista_dati)
+
+    data_ts = pd.Timestamp(data_r)
+    nuove_ricevute = pd.DataFrame(
+        {
+            "Numero": numeri,
+            "Data": data_ts,
+            "Intestatario": intestatari,
+            "CF": cf,
+            "TipoVoce": tipo_voce,
+            "CentroCosto": centri,
+            "Causale": causale,
+            "Importo": importo,
+            "MetodoPagamento": metodo,
+            "Note": "",
+            COLONNA_ID: nuovi_id(n),
+            # nel DataFrame solo l'hash: i PDF restano su disco (blob_pdf)
+            "PDF": [salva_pdf(p) for p in pdfs],
+        },
+        columns=COLONNE_RICEVUTE,
+    )
+    nuove_pn = pd.DataFrame(
+        {
+            "Data": data_ts,
+            "NumeroDocumento": numeri,
+            "Intestatario": intestatari,
+            "TipoVoce": tipo_voce,
+            "CentroCosto": centri,
+            "Causale": causale,
+            "Entrata": importo,
+            "Uscita": 0.0,
+            "MetodoPagamento": metodo,
+            COLONNA_ID: nuovi_id(n),
+        },
+        columns=COLONNE_PRIMA_NOTA,
+    )
+
+    aggiungi_righe("ricevute_emesse", nuove_ricevute, COLONNE_RICEVUTE)
+    aggiungi_righe("prima_nota", nuove_pn, COLONNE_PRIMA_NOTA)
+    accoda_salvataggio(nuove_ricevute.drop(columns=["PDF"]), "ricevute_asd_ssd.xlsx")
+    accoda_salvataggio(nuove_pn, "prima_nota_asd_ssd.xlsx")
+
     buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-    buffer.seek(0)
+    # i PDF sono già compressi: ZIP_STORED evita di ricomprimerli
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        for numero, pdf in zip(numeri, pdfs):
+            zf.writestr(f"ricevuta_{numero}.pdf", pdf)
     return buffer.getvalue()
 
 
+def _tab_emissione_massiva(soci_tutti: pd.DataFrame, cf_col, attivita_col):
+    st.markdown("### Emissione massiva (es. quota mensile a tutti i soci attivi)")
+
+    nomi_listino = [x["nome"] for x in LISTINO] + ["Importo personalizzato"]
+    modello_scelto = st.selectbox("Modello", nomi_listino, key="massiva_modello")
+
+    if modello_scelto != "Importo personalizzato":
+        modello = next(x for x in LISTINO if x["nome"] == modello_scelto)
+        tipo_voce = modello["tipo_voce"]
+        causale_default = modello["causale"]
+        importo_default = modello["importo"]
+    else:
+        tipo_voce = st.selectbox(
+            "Tipologia importo",
+            [
+                "Quota associativa annuale",
+                "Quota associativa mensile",
+                "Contributo associativo",
+                "Erogazione liberale",
+                "Altro",
+            ],
+            key="massiva_tipo",
+        )
+        causale_default = ""
+        importo_default = 0.0
+
+    col_m1, col_m2 = st.columns(2)
+    with col_m1:
+        data_r = st.date_input("Data", value=date.today(), key="massiva_data")
+        causale = st.text_input("Causale", causale_default, key="massiva_causale")
+        importo = st.number_input(
+            "Importo (senza IVA)",
+            min_value=0.0,
+            step=1.0,
+            format="%.2f",
+            value=float(importo_default),
+            key="massiva_importo",
+        )
+        metodo = st.selectbox(
+            "Metodo di pagamento",
+            ["", "Contanti", "Bonifico", "POS", "Altro"],
+            key="massiva_metodo",
+        )
+
+    with col_m2:
+        solo_attivi = st.checkbox("Solo soci attivi", value=True, key="massiva_attivi")
+        soci_sel = soci_tutti
+        if solo_attivi and "Attivo" in soci_sel.columns:
+            soci_sel = soci_sel[soci_sel["Attivo"] == True]
+        if attivita_col:
+            attivita = sorted(
+                a for a in soci_sel[attivita_col].dropna().astype(str).str.strip().unique() if a
+            )
+            attivita_sel = st.multiselect(
+                "Attività principale (vuoto = tutte)", attivita, key="massiva_attivita"
+            )
+            if attivita_sel:
+                soci_sel = soci_sel[
+                    soci_sel[attivita_col].astype(str).str.strip().isin(attivita_sel)
+                ]
+        st.metric("Ricevute da emettere", len(soci_sel))
+
+    if st.button(f"Emetti {len(soci_sel)} ricevute e aggiorna prima nota"):
+        if soci_sel.empty or importo <= 0:
+            st.error("Seleziona almeno un socio e un importo maggiore di zero.")
+        else:
+            with st.spinner("Generazione delle ricevute in corso..."):
+                st.session_state.zip_ricevute_massive = emetti_ricevute_massive(
+                    soci_sel,
+                    cf_col,
+                    attivita_col,
+                    data_r,
+                    tipo_voce,
+                    causale or "Attività istituzionale sportiva",
+                    importo,
+                    metodo,
+                )
+            st.success(
+                f"Emesse {len(soci_sel)} ricevute; prima nota aggiornata "
+                "e salvataggio su Google Drive avviato."
+            )
+
+    if st.session_state.get("zip_ricevute_massive"):
+        st.download_button(
+            label="Scarica ZIP delle ricevute emesse",
+            data=st.session_state.zip_ricevute_massive,
+            file_name="ricevute_emissione_massiva.zip",
+            mime="application/zip",
+        )
+
+
+def _sezione_invio_massivo(df: pd.DataFrame):
+    """Invio via email di tutte le ricevute di un mese (o di tutte) ai soci."""
+    with st.expander("📧 Invio massivo via email"):
+        date_r = df["Data"]
+        mesi = sorted(date_r.dropna().dt.strftime("%Y-%m").unique(), reverse=True)
+        periodo = st.selectbox(
+            "Ricevute da inviare",
+            ["Tutte"] + list(mesi),
+            format_func=lambda m: m if m == "Tutte" else f"Mese {m[5:]}/{m[:4]}",
+            key="invio_massivo_periodo",
+        )
+        da_inviare = df if periodo == "Tutte" else df[date_r.dt.strftime("%Y-%m") == periodo]
+        lotto = f"Ricevute {periodo}"
+        st.caption(
+            f"{len(da_inviare)} ricevute; l'indirizzo viene preso dall'anagrafica soci "
+            "(codice fiscale o nominativo)."
+        )
+
+        # conferma in due passi: il primo clic chiede conferma per il lotto scelto
+        chiave_conferma = "invio_massivo_da_confermare"
+        if st.button("Invia tutte via email", key="invio_massivo"):
+            if mittente_configurato() is None:
+                st.error("SMTP non configurato nelle variabili d'ambiente.")
+            else:
+                st.session_state[chiave_conferma] = lotto
+
+        if st.session_state.get(chiave_conferma) == lotto:
+            st.warning(f"Confermi l'invio via email di {len(da_inviare)} ricevute ({lotto})?")
+            c_si, c_no = st.columns(2)
+            with c_si:
+                conferma = st.button("Conferma invio", key="invio_massivo_conferma")
+            with c_no:
+                annulla = st.button("Annulla", key="invio_massivo_annulla")
+            if annulla:
+                st.session_state.pop(chiave_conferma, None)
+                st.rerun()
+            if conferma:
+                st.session_state.pop(chiave_conferma, None)
+                accodate, senza_email = accoda_email_ricevute(
+                    st.session_state.associazione,
+                    da_inviare,
+                    st.session_state.get("soci"),
+                    lotto,
+                )
+                st.info(
+                    f"{accodate} email accodate per l'invio "
+                    "(le ricevute già in coda o inviate in questo lotto non vengono ripetute)."
+                )
+                if senza_email:
+                    st.warning(
+                        "Socio senza email per le ricevute n. "
+                        + ", ".join(str(n) for n in senza_email)
+                    )
+
+        mostra_stato_invii(lotto)
+
+
 # ==========================
 # PAGINA RICEVUTE
 # ==========================
@@ -312,19 +775,20 @@ def pagina_ricevute():
 
     # Stato iniziale
     if "ricevute_emesse" not in st.session_state:
-        st.session_state.ricevute_emesse = pd.DataFrame(columns=COLONNE_RICEVUTE)
+        st.session_state.ricevute_emesse = df_vuoto("ricevute_emesse", ["PDF"])
     if "prima_nota" not in st.session_state:
-        st.session_state.prima_nota = pd.DataFrame(columns=COLONNE_PRIMA_NOTA)
-    if "progressivo_ricevuta" not in st.session_state:
-        st.session_state.progressivo_ricevuta = 1
+        st.session_state.prima_nota = df_vuoto("prima_nota")
 
     # Colonna PDF garantita
     if "PDF" not in st.session_state.ricevute_emesse.columns:
-        st.session_state.ricevute_emesse["PDF"] = None
+        # nuovo DataFrame: quello in sessione può essere condiviso con altre sessioni
+        st.session_state.ricevute_emesse = st.session_state.ricevute_emesse.assign(PDF=None)
 
     if not st.session_state.associazione.get("Denominazione"):
         st.warning("Compila prima l'anagrafica dell'associazione (menu a sinistra).")
 
+    mostra_stato_sincronizzazione("ricevute_asd_ssd.xlsx", "prima_nota_asd_ssd.xlsx")
+
     # ===== SOCI =====
     soci_df = st.session_state.get("soci", pd.DataFrame())
     if soci_df is None or soci_df.empty:
@@ -344,50 +808,44 @@ def pagina_ricevute():
         )
         return
 
-    # Colonne CF / attività
-    if "Codice fiscale" in soci_df.columns:
-        cf_col = "Codice fiscale"
-    elif "CF" in soci_df.columns:
-        cf_col = "CF"
-    else:
-        cf_col = None
+    # Colonne CF / attività: nomi canonici (vedi schema.py)
+    cf_col = "CF" if "CF" in soci_df.columns else None
+    attivita_col = "AttivitaPrincipale" if "AttivitaPrincipale" in soci_df.columns else None
 
-    if "Attività principale (es. Calcio U10)" in soci_df.columns:
-        attivita_col = "Attività principale (es. Calcio U10)"
-    elif "Attività principale" in soci_df.columns:
-        attivita_col = "Attività principale"
-    else:
-        cand = [c for c in soci_df.columns if c.startswith("Attività principale")]
-        attivita_col = cand[0] if cand else None
-
-    # Etichette select soci
-    opzioni = []
-    righe = []
-    for _, r in soci_df.iterrows():
-        nome = str(r.get("Nome", "")).strip()
-        cognome = str(r.get("Cognome", "")).strip()
-        cf_val = str(r.get(cf_col, "")).strip() if cf_col else ""
-        label = f"{nome} {cognome}".strip()
-        if cf_val:
-            label += f" (CF: {cf_val})"
-        opzioni.append(label)
-        righe.append(r)
-
-    tab_nuova, tab_elenco = st.tabs(["Nuova ricevuta", "Elenco ricevute"])
+    # Indice di ricerca dei soci attivi (ricostruito solo quando cambiano i soci)
+    indice = indice_soci(cf_col)
+
+    tab_nuova, tab_massiva, tab_elenco = st.tabs(
+        ["Nuova ricevuta", "Emissione massiva", "Elenco ricevute"]
+    )
 
     # ===== TAB NUOVA RICEVUTA =====
     with tab_nuova:
-        numero_default = str(st.session_state.progressivo_ricevuta)
-        numero = st.text_input("Numero ricevuta", numero_default)
+        # il numero proposto viene riservato solo all'emissione
+        numero_default = prossimo_numero("ricevute_emesse")
+        numero = st.text_input("Numero ricevuta", numero_default).strip()
+        st.caption(
+            "Il numero proposto viene assegnato all'emissione: se nel frattempo "
+            "lo usa un'altra sessione, la ricevuta prende il successivo libero."
+        )
         data_r = st.date_input("Data", value=date.today())
 
         st.markdown("### Seleziona socio per la ricevuta")
-        idx_socio = st.selectbox(
+        ricerca = st.text_input(
+            "Cerca socio (nome, cognome o codice fiscale)", key="ricerca_socio"
+        )
+        trovati = indice.cerca(ricerca)
+        if not trovati:
+            st.warning("Nessun socio corrisponde alla ricerca: mostro i primi soci attivi.")
+            trovati = indice.cerca("")
+        elif ricerca:
+            st.caption(f"Primi {len(trovati)} soci corrispondenti.")
+        pos_socio = st.selectbox(
             "Socio (se non presente, registralo nella pagina **Soci / Iscritti**)",
-            options=list(range(len(opzioni))),
-            format_func=lambda i: opzioni[i],
+            options=trovati,
+            format_func=lambda i: indice.etichette[i],
         )
-        socio_sel = righe[idx_socio]
+        socio_sel = st.session_state.soci.iloc[pos_socio]
 
         intestatario_default = (
             f"{str(socio_sel.get('Nome', '')).strip()} "
@@ -486,11 +944,18 @@ def pagina_ricevute():
             intestatario = intestatario_default
             cf = cf_default
 
+            if numero in ("", numero_default):
+                numero = None
             if not intestatario or importo <= 0:
                 st.error(
                     "Verifica che il socio sia selezionato e che l'importo sia maggiore di zero."
                 )
+            elif numero is not None and numero in set(dataset("ricevute_emesse")["Numero"]):
+                st.error(f"Esiste già una ricevuta n. {numero}.")
             else:
+                if numero is None:
+                    # numero riservato nell'archivio condiviso: unico tra le sessioni
+                    numero = riserva_numeri("ricevute_emesse", 1)[0]
                 dati = {
                     "Numero": numero,
                     "Data": data_r,
@@ -508,7 +973,7 @@ def pagina_ricevute():
 
                 nuova_riga = {
                     "Numero": numero,
-                    "Data": data_r.strftime("%d/%m/%Y"),
+                    "Data": pd.Timestamp(data_r),
                     "Intestatario": intestatario,
                     "CF": cf,
                     "TipoVoce": tipo_voce,
@@ -517,16 +982,16 @@ def pagina_ricevute():
                     "Importo": importo,
                     "MetodoPagamento": metodo,
                     "Note": note,
-                    "PDF": pdf_bytes,
+                    COLONNA_ID: nuovi_id()[0],
+                    "PDF": salva_pdf(pdf_bytes),
                 }
 
-                st.session_state.ricevute_emesse = pd.concat(
-                    [st.session_state.ricevute_emesse, pd.DataFrame([nuova_riga])],
-                    ignore_index=True,
+                aggiungi_righe(
+                    "ricevute_emesse", pd.DataFrame([nuova_riga]), COLONNE_RICEVUTE
                 )
 
                 nuova_riga_pn = {
-                    "Data": data_r.strftime("%d/%m/%Y"),
+                    "Data": pd.Timestamp(data_r),
                     "NumeroDocumento": numero,
                     "Intestatario": intestatario,
                     "TipoVoce": tipo_voce,
@@ -535,40 +1000,30 @@ def pagina_ricevute():
                     "Entrata": importo,
                     "Uscita": 0.0,
                     "MetodoPagamento": metodo,
+                    COLONNA_ID: nuovi_id()[0],
                 }
 
-                st.session_state.prima_nota = pd.concat(
-                    [st.session_state.prima_nota, pd.DataFrame([nuova_riga_pn])],
-                    ignore_index=True,
+                aggiungi_righe(
+                    "prima_nota", pd.DataFrame([nuova_riga_pn]), COLONNE_PRIMA_NOTA
                 )
 
-                st.session_state.progressivo_ricevuta += 1
-
-                # ===== SALVATAGGIO SU DRIVE (con messaggio) =====
-                try:
-                    df_ricevute_drive = st.session_state.ricevute_emesse.drop(
-                        columns=["PDF"]
-                    )
-                    salva_df_su_drive(df_ricevute_drive, "ricevute_asd_ssd.xlsx")
-                    salva_df_su_drive(
-                        st.session_state.prima_nota, "prima_nota_asd_ssd.xlsx"
-                    )
-                    st.info(
-                        "💾 Dati salvati su Google Drive "
-                        "(ricevute_asd_ssd.xlsx e prima_nota_asd_ssd.xlsx)."
-                    )
-                except Exception as e:
-                    st.error(
-                        "❌ Errore nel salvataggio su Google Drive "
-                        "(ricevute/prima nota)."
-                    )
-                    st.code(repr(e))
+                # ===== SALVATAGGIO SU DRIVE (in background) =====
+                # solo le righe nuove: vanno nel journal, non si ricarica il file intero
+                riga_drive = pd.DataFrame([nuova_riga]).drop(columns=["PDF"])
+                accoda_salvataggio(riga_drive, "ricevute_asd_ssd.xlsx")
+                accoda_salvataggio(
+                    pd.DataFrame([nuova_riga_pn]), "prima_nota_asd_ssd.xlsx"
+                )
+                st.info(
+                    "💾 Salvataggio su Google Drive avviato "
+                    "(ricevute_asd_ssd.xlsx e prima_nota_asd_ssd.xlsx)."
+                )
 
                 st.success("Ricevuta generata e prima nota aggiornata.")
 
                 # Anteprima + download
                 st.markdown("Anteprima PDF")
-                mostra_preview_pdf(pdf_bytes)
+                mostra_preview_pdf(pdf_bytes, chiave="nuova_ricevuta")
 
                 st.download_button(
                     label="Scarica PDF ricevuta",
@@ -581,14 +1036,8 @@ def pagina_ricevute():
                 if email_dest:
                     invio = st.checkbox("Invia subito via email a questo indirizzo")
                     if invio:
-                        oggetto = (
-                            f"Ricevuta n. {numero} - "
-                            f"{st.session_state.associazione.get('Denominazione', '')}"
-                        )
-                        corpo = (
-                            f"Gentile {intestatario},\n\n"
-                            "in allegato trova la ricevuta del versamento effettuato.\n\n"
-                            f"Saluti,\n{st.session_state.associazione.get('Denominazione', '')}"
+                        oggetto, corpo = _oggetto_corpo_email(
+                            st.session_state.associazione, numero, intestatario
                         )
                         ok, msg = invia_email_con_pdf(
                             email_dest,
@@ -602,42 +1051,50 @@ def pagina_ricevute():
                         else:
                             st.error(msg)
 
+    # ===== TAB EMISSIONE MASSIVA =====
+    with tab_massiva:
+        _tab_emissione_massiva(st.session_state.soci, cf_col, attivita_col)
+
     # ===== TAB ELENCO RICEVUTE =====
     with tab_elenco:
-        df = st.session_state.ricevute_emesse.copy()
+        df = dataset("ricevute_emesse")
         if df.empty:
             st.info("Non sono ancora state emesse ricevute.")
             return
 
-        st.dataframe(df.drop(columns=["PDF"]))
-
-        excel_bytes = df_to_excel_bytes(
-            df.drop(columns=["PDF"]), sheet_name="Ricevute"
-        )
-        st.download_button(
-            label="Esporta tutte le ricevute in Excel",
-            data=excel_bytes,
-            file_name="ricevute_asd_ssd.xlsx",
-            mime=(
-                "application/vnd.openxmlformats-officedocument."
-                "spreadsheetml.sheet"
-            ),
+        pos_sel = griglia_paginata(
+            df,
+            "elenco_ricevute",
+            versione=versione_dataset("ricevute_emesse"),
+            nascoste=("PDF", COLONNA_ID),
         )
 
-        idx = st.number_input(
-            "Seleziona l'indice riga per vedere anteprima / scaricare / inviare",
-            min_value=0,
-            max_value=len(df) - 1,
-            step=1,
+        bottone_export_excel(
+            "Esporta tutte le ricevute in Excel",
+            "ricevute_asd_ssd.xlsx",
+            ("ricevute", versione_dataset("ricevute_emesse")),
+            lambda: [("Ricevute", df.drop(columns=["PDF"]))],
         )
 
-        row = df.iloc[int(idx)]
-        pdf_bytes = row["PDF"]
+        _sezione_invio_massivo(df)
+
+        if pos_sel is None:
+            st.info("Seleziona una ricevuta nell'elenco per vedere anteprima / scaricare / inviare.")
+            return
+
+        row = df.iloc[pos_sel]
 
-        st.markdown(f"Ricevuta selezionata: n. {row['Numero']} del {row['Data']}")
+        st.markdown(
+            f"Ricevuta selezionata: n. {row['Numero']} del {formatta_data(row['Data'])}"
+        )
+
+        pdf_bytes = pdf_ricevuta(st.session_state.associazione, row)
+        if pdf_bytes is None:
+            st.info("Impossibile ricreare il PDF di questa ricevuta (data non valida).")
+            return
 
         st.markdown("Anteprima PDF")
-        mostra_preview_pdf(pdf_bytes)
+        mostra_preview_pdf(pdf_bytes, chiave="elenco_ricevute")
 
         st.download_button(
             label="Scarica PDF ricevuta selezionata",
@@ -654,14 +1111,8 @@ def pagina_ricevute():
             if not email_esistente:
                 st.error("Inserisci un indirizzo email valido.")
             else:
-                oggetto = (
-                    f"Ricevuta n. {row['Numero']} - "
-                    f"{st.session_state.associazione.get('Denominazione', '')}"
-                )
-                corpo = (
-                    f"Gentile {row['Intestatario']},\n\n"
-                    "in allegato trova la ricevuta del versamento effettuato.\n\n"
-                    f"Saluti,\n{st.session_state.associazione.get('Denominazione', '')}"
+                oggetto, corpo = _oggetto_corpo_email(
+                    st.session_state.associazione, row["Numero"], row["Intestatario"]
                 )
                 ok, msg = invia_email_con_pdf(
                     email_esistente,
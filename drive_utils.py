@@ -1,129 +1,587 @@
 import os
-import io
 import json
+import datetime
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import streamlit as st
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
 
-SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+import cache_locale
+from archiviazione import ASSENTE, ConflittoVersione, get_backend
+from dataset_condivisi import get_archivio, sincronizza_sessione
+from schema import COLONNA_ID, FORMATO_DATA, date_in_testo, normalizza_df
+from formati import (
+    MIMETYPES,
+    deserializza_df,
+    formati_in_lettura,
+    formato_dataset,
+    nome_base,
+    nome_file,
+    serializza_df,
+)
 
+# Le funzioni di questo modulo lavorano sul backend di archiviazione
+# configurato (Google Drive di default, vedi archiviazione.get_backend).
 
-def _get_drive_service():
-    """Restituisce (service, folder_id, error). Se error != None, Drive non è utilizzabile."""
-    service_json = os.getenv("GDRIVE_SERVICE_ACCOUNT_JSON")
-    folder_id = os.getenv("GDRIVE_FOLDER_ID")
 
-    if not service_json or not folder_id:
-        return None, None, "Google Drive non configurato nelle variabili ambiente."
+def archivio_configurato() -> bool:
+    """True se il backend di archiviazione è utilizzabile (es. Drive configurato)."""
+    return get_backend().errore() is None
 
+
+# Versione di ogni file come l'abbiamo letta o scritta l'ultima volta
+# (nome file -> version, oppure ASSENTE). Le scritture la usano come
+# condizione: se nel frattempo un altro processo ha modificato il file,
+# il backend solleva ConflittoVersione e le righe vengono unite (vedi sotto).
+_versioni_note = {}
+
+# Tentativi di scrittura dopo un conflitto di versione
+MAX_TENTATIVI_CONFLITTO = 3
+
+
+def _annota_versione(nome: str, meta):
+    _versioni_note[nome] = meta["version"] if meta else ASSENTE
+
+
+def _salva_versionato(backend, nome: str, data: bytes, mimetype: str) -> dict:
+    """
+    Salva nome solo se non è cambiato dall'ultima lettura/scrittura.
+    Se la versione non è ancora nota, la legge prima (mai scritture senza condizione).
+    """
+    if nome not in _versioni_note:
+        _annota_versione(nome, backend.metadati(nome))
+    try:
+        meta = backend.salva(nome, data, mimetype, se_versione=_versioni_note[nome])
+    except ConflittoVersione as e:
+        if e.nuova is not None:
+            # scritto comunque: d'ora in poi si riscrive sopra la nostra revisione
+            _annota_versione(nome, e.nuova)
+        raise
+    _annota_versione(nome, meta)
+    return meta
+
+
+def _scarica_bytes(backend, nome: str):
+    """
+    Contenuto del file nome (None se non esiste).
+    Se la revisione nel backend è quella già in cache locale non scarica nulla:
+    basta la richiesta dei metadati.
+    """
+    meta = backend.metadati(nome)
+    _annota_versione(nome, meta)
+    if meta is None:
+        return None
+
+    data = cache_locale.leggi_bytes(meta)
+    if data is None:
+        data = backend.leggi(meta).read()
+        cache_locale.scrivi_bytes(meta, data)
+    return data
+
+
+def _scarica_df(backend, nome: str, formato: str):
+    """Come _scarica_bytes, ma tiene in cache il DataFrame già letto."""
+    meta = backend.metadati(nome)
+    _annota_versione(nome, meta)
+    if meta is None:
+        return None
+
+    df = cache_locale.leggi_df(meta)
+    if df is None:
+        df = deserializza_df(backend.leggi(meta), formato)
+        cache_locale.scrivi_df(meta, df)
+    return df
+
+
+# ==========================
+# IDENTITÀ DELLE RIGHE (UNIONE DOPO UN CONFLITTO)
+# ==========================
+# Ogni riga ha un identificativo (colonna IdRiga, UUID assegnato
+# all'inserimento): le versioni di un file si uniscono per IdRiga.
+# Le righe scritte prima dell'introduzione di IdRiga ricevono un
+# identificativo derivato dal contenuto (colonne di CHIAVI_RIGA) e dal numero
+# di occorrenza, così due righe identiche restano due righe e ogni processo
+# che legge lo stesso file ottiene gli stessi identificativi.
+CHIAVI_RIGA = {
+    "ricevute_asd_ssd.xlsx": ["Numero"],
+    "prima_nota_asd_ssd.xlsx": [
+        "Data",
+        "NumeroDocumento",
+        "Intestatario",
+        "Causale",
+        "Entrata",
+        "Uscita",
+    ],
+    "soci_asd_ssd.xlsx": ["CF"],
+}
+
+# Colonne che non contano nel confronto del contenuto (i PDF non vanno su Drive)
+_ESCLUSE_DAL_CONFRONTO = {COLONNA_ID, "PDF"}
+
+
+def _valore_chiave(v) -> str:
+    # 12, 12.0 e "12" (Excel, parquet, journal JSON) devono coincidere
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return ""
+    if isinstance(v, (pd.Timestamp, datetime.date)):
+        # date da Excel / parquet come nei file scritti in testo
+        return v.strftime(FORMATO_DATA)
+    testo = str(v).strip()
     try:
-        info = json.loads(service_json)
-        creds = service_account.Credentials.from_service_account_info(
-            info,
-            scopes=SCOPES,
+        return repr(float(testo))
+    except ValueError:
+        return testo
+
+
+def _chiave_contenuto(df: pd.DataFrame, filename: str) -> pd.Series:
+    colonne = [c for c in CHIAVI_RIGA.get(filename, df.columns) if c in df.columns]
+    if not colonne:
+        colonne = [c for c in df.columns if c not in _ESCLUSE_DAL_CONFRONTO]
+    chiave = pd.Series("", index=df.index)
+    for col in colonne:
+        chiave = chiave + "|" + df[col].map(_valore_chiave)
+
+    if filename == "soci_asd_ssd.xlsx" and {"Nome", "Cognome"} <= set(df.columns):
+        senza_cf = chiave.str.strip("|") == ""
+        per_nome = (
+            "|" + df["Nome"].map(_valore_chiave) + "|" + df["Cognome"].map(_valore_chiave)
         )
-        service = build("drive", "v3", credentials=creds)
-        return service, folder_id, None
-    except Exception as e:
-        return None, None, f"Errore configurazione Google Drive: {e}"
+        chiave = chiave.where(~senza_cf, "nome" + per_nome.str.lower())
+    return chiave
+
+
+def id_righe(df: pd.DataFrame, filename: str) -> pd.Series:
+    """IdRiga di ogni riga di df; per le righe che non l'hanno, quello derivato."""
+    contenuto = _chiave_contenuto(df, filename)
+    occorrenza = contenuto.groupby(contenuto).cumcount().astype(str)
+    derivati = (filename + contenuto + "#" + occorrenza).map(
+        lambda k: uuid.uuid5(uuid.NAMESPACE_URL, k).hex
+    )
+    if COLONNA_ID not in df.columns:
+        return derivati
+    ids = df[COLONNA_ID].map(lambda v: "" if v is None or pd.isna(v) else str(v).strip())
+    return ids.where(ids != "", derivati)
+
+
+def con_id_righe(df: pd.DataFrame, filename: str) -> pd.DataFrame:
+    """df con IdRiga compilato su tutte le righe (vedi id_righe)."""
+    if df.empty:
+        return df
+    return df.assign(**{COLONNA_ID: id_righe(df, filename).to_numpy()})
+
+
+def _firma_contenuto(df: pd.DataFrame, colonne: list) -> pd.Series:
+    firma = pd.Series("", index=df.index)
+    for col in colonne:
+        firma = firma + "|" + df[col].map(_valore_chiave)
+    return firma
+
+
+def _conflitti(remoto: pd.DataFrame, locale: pd.DataFrame, filename: str) -> list:
+    """Righe con lo stesso IdRiga ma contenuto diverso: [{"IdRiga", "remota", "locale"}]."""
+    if remoto.empty or locale.empty:
+        return []
+    colonne = sorted(
+        (set(remoto.columns) & set(locale.columns)) - _ESCLUSE_DAL_CONFRONTO, key=str
+    )
+    remoto = remoto.assign(_id=id_righe(remoto, filename).to_numpy())
+    locale = locale.assign(_id=id_righe(locale, filename).to_numpy())
+    remoto = remoto.assign(_firma=_firma_contenuto(remoto, colonne).to_numpy())
+    locale = locale.assign(_firma=_firma_contenuto(locale, colonne).to_numpy())
+    diverse = remoto.merge(locale, on="_id", suffixes=("_remota", "_locale"))
+    diverse = diverse[diverse["_firma_remota"] != diverse["_firma_locale"]]
+
+    def _riga(r, suffisso):
+        return {c: _valore_json(r[f"{c}{suffisso}"]) for c in colonne}
+
+    return [
+        {
+            COLONNA_ID: r["_id"],
+            "remota": _riga(r, "_remota"),
+            "locale": _riga(r, "_locale"),
+        }
+        for _, r in diverse.iterrows()
+    ]
+
+
+def _valore_json(v):
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return None
+    return v.item() if hasattr(v, "item") else v
+
+
+def unisci_per_chiave(remoto: pd.DataFrame, locale: pd.DataFrame, filename: str) -> tuple:
+    """
+    Unione per IdRiga: righe remote che locale non ha, poi tutte le righe
+    locali. Restituisce (DataFrame unito, conflitti): a parità di IdRiga con
+    contenuto diverso resta la riga locale e la remota finisce nei conflitti
+    (vedi _conflitti), invece di andare persa in silenzio.
+    """
+    # identificativi derivati sull'intero file: su un sottoinsieme cambierebbe
+    # il numero di occorrenza delle righe identiche
+    remoto, locale = con_id_righe(remoto, filename), con_id_righe(locale, filename)
+    solo_remote = remoto[~id_righe(remoto, filename).isin(set(id_righe(locale, filename)))]
+    unito = pd.concat([solo_remote, locale], ignore_index=True)
+    return unito, _conflitti(remoto, locale, filename)
+
+
+def _aggiungi_mancanti(df: pd.DataFrame, righe: pd.DataFrame, filename: str) -> pd.DataFrame:
+    """df più, in coda, le righe che df non contiene ancora."""
+    id_df = set(id_righe(df, filename))
+    righe = con_id_righe(righe, filename)
+    mancanti = righe[~id_righe(righe, filename).isin(id_df)]
+    if mancanti.empty:
+        return df
+    return pd.concat([df, mancanti], ignore_index=True)
+
+
+def _unisci_voci(remote: list, nuove: list, filename: str) -> tuple:
+    """
+    Voci del journal remoto più le nuove, senza doppioni per IdRiga.
+    Restituisce (voci, conflitti) come unisci_per_chiave.
+    """
+    if not remote or not nuove:
+        return remote + nuove, []
+    df_nuove = pd.DataFrame([v["riga"] for v in nuove])
+    df_remote = pd.DataFrame([v["riga"] for v in remote])
+    id_nuove = set(id_righe(df_nuove, filename))
+    id_remote = id_righe(df_remote, filename)
+    voci = [v for v, k in zip(remote, id_remote) if k not in id_nuove] + nuove
+    return voci, _conflitti(df_remote, df_nuove, filename)
+
+
+# Conflitti rilevati da questo processo (filename -> lista), per la UI.
+# Le versioni scartate restano anche su Drive in <dataset>.conflitti.jsonl.
+_conflitti_rilevati = {}
+
+
+def _nome_conflitti(filename: str) -> str:
+    return f"{nome_base(filename)}.conflitti.jsonl"
+
+
+def _registra_conflitti(backend, filename: str, conflitti: list):
+    """Conserva le versioni remote scartate (su Drive e per mostra_conflitti)."""
+    if not conflitti:
+        return
+    ts = pd.Timestamp.now(tz="UTC").isoformat()
+    nuove = [{"ts": ts, **c} for c in conflitti]
+    _conflitti_rilevati.setdefault(filename, []).extend(nuove)
+
+    nome = _nome_conflitti(filename)
+    data = _scarica_bytes(backend, nome) or b""
+    for tentativo in range(MAX_TENTATIVI_CONFLITTO):
+        try:
+            _salva_versionato(
+                backend, nome, data + _voci_journal_to_bytes(nuove), "application/x-ndjson"
+            )
+            return
+        except ConflittoVersione as e:
+            # il file cresce solo in coda: quello sostituito contiene già il nostro punto di partenza
+            if e.sovrascritto is not None:
+                data = e.sovrascritto
+            else:
+                data = _scarica_bytes(backend, nome) or b""
+
+
+def conflitti_rilevati(filename: str) -> list:
+    """Conflitti di IdRiga rilevati salvando filename (riga remota scartata e riga locale)."""
+    return list(_conflitti_rilevati.get(filename, []))
+
+
+# ==========================
+# JOURNAL DELLE RIGHE AGGIUNTE (DELTA SYNC)
+# ==========================
+# Le nuove righe non riscrivono il file principale: finiscono in un piccolo
+# journal JSONL accanto al file (es. prima_nota_asd_ssd.journal.jsonl).
+# Quando il journal supera JOURNAL_MAX_RIGHE righe o JOURNAL_MAX_ORE ore,
+# viene "compattato" nel file principale e poi eliminato.
+JOURNAL_MAX_RIGHE = int(os.getenv("ASD_JOURNAL_MAX_RIGHE", "200"))
+JOURNAL_MAX_ORE = float(os.getenv("ASD_JOURNAL_MAX_ORE", "24"))
+
+# filename -> lista di voci {"ts": ..., "riga": {...}} già presenti nel journal
+_journal_cache = {}
+# un lock per dataset: scritture sullo stesso file serializzate, file diversi in parallelo
+_dataset_locks = {}
+_dataset_locks_lock = threading.Lock()
+
+
+def _lock_dataset(filename: str) -> threading.RLock:
+    with _dataset_locks_lock:
+        return _dataset_locks.setdefault(filename, threading.RLock())
+
+
+def _nome_journal(filename: str) -> str:
+    return f"{nome_base(filename)}.journal.jsonl"
+
+
+def _voci_journal_da_bytes(data: bytes) -> list:
+    voci = []
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            voci.append(json.loads(line))
+    return voci
+
+
+def _voci_journal_to_bytes(voci: list) -> bytes:
+    return "".join(
+        json.dumps(v, ensure_ascii=False) + "\n" for v in voci
+    ).encode("utf-8")
+
+
+def _voci_journal(backend, filename: str, rileggi: bool = False) -> list:
+    """Voci del journal di filename (dalla cache, altrimenti dal backend)."""
+    with _lock_dataset(filename):
+        if rileggi or filename not in _journal_cache:
+            data = _scarica_bytes(backend, _nome_journal(filename))
+            _journal_cache[filename] = _voci_journal_da_bytes(data) if data else []
+        return _journal_cache[filename]
+
+
+def _journal_da_compattare(voci: list) -> bool:
+    if len(voci) >= JOURNAL_MAX_RIGHE:
+        return True
+    if voci:
+        eta = pd.Timestamp.now(tz="UTC") - pd.Timestamp(voci[0]["ts"])
+        return eta >= pd.Timedelta(hours=JOURNAL_MAX_ORE)
+    return False
 
 
 def salva_df_su_drive(df: pd.DataFrame, filename: str):
-    """Salva (o aggiorna) un file Excel su Drive con nome filename."""
-    service, folder_id, err = _get_drive_service()
+    """Salva (o aggiorna) su Drive il dataset filename nel formato configurato.
+
+    filename è il nome logico (es. prima_nota_asd_ssd.xlsx): il file su Drive
+    prende l'estensione del formato (vedi formati.formato_dataset).
+    Riscrive il file completo e azzera il journal, dopo averne incorporato le
+    righe che df non contiene (es. scritte da un altro processo). Se il file
+    è cambiato dall'ultima lettura, la versione remota viene unita per
+    identità di riga invece di essere sovrascritta.
+    Le date vengono scritte come testo gg/mm/aaaa (come nei file storici).
+    """
+    df = date_in_testo(df)
+    backend = get_backend()
+    err = backend.errore()
     if err:
         # Non blocchiamo l'app se Drive non è configurato
         return False, err
 
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Dati")
-    buffer.seek(0)
+    formato = formato_dataset(filename)
+    nome = nome_file(filename, formato)
+    nome_journal = _nome_journal(filename)
 
-    media = MediaIoBaseUpload(
-        buffer,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        resumable=False,
-    )
+    with _lock_dataset(filename):
+        for tentativo in range(MAX_TENTATIVI_CONFLITTO):
+            voci = _voci_journal(backend, filename, rileggi=True)
+            if voci:
+                df = _aggiungi_mancanti(
+                    df, pd.DataFrame([v["riga"] for v in voci]), filename
+                )
+            try:
+                _salva_versionato(backend, nome, serializza_df(df, formato), MIMETYPES[formato])
+            except ConflittoVersione as e:
+                if e.sovrascritto is not None:
+                    # la nostra scrittura ha sostituito quella di un altro processo
+                    remoto = deserializza_df(e.sovrascritto, formato)
+                else:
+                    remoto = _scarica_df(backend, nome, formato)
+                if remoto is not None:
+                    df, conflitti = unisci_per_chiave(remoto, df, filename)
+                    _registra_conflitti(backend, filename, conflitti)
+                continue
+            try:
+                # solo se nessuno ha aggiunto righe al journal dopo averlo letto
+                backend.elimina(nome_journal, se_versione=_versioni_note.get(nome_journal))
+            except ConflittoVersione:
+                continue
+            _annota_versione(nome_journal, None)
+            _journal_cache[filename] = []
+            break
+        else:
+            raise ConflittoVersione(nome, _versioni_note.get(nome), "modificata di continuo")
 
-    # Cerco se esiste già un file con quel nome nella cartella
-    res = service.files().list(
-        q=f"name='{filename}' and '{folder_id}' in parents and trashed=false",
-        fields="files(id,name)",
-        pageSize=1,
-    ).execute()
-    items = res.get("files", [])
-
-    if items:
-        file_id = items[0]["id"]
-        service.files().update(fileId=file_id, media_body=media).execute()
-    else:
-        metadata = {"name": filename, "parents": [folder_id]}
-        service.files().create(body=metadata, media_body=media).execute()
+        # le copie in altri formati (es. il vecchio .xlsx) non sono più aggiornate
+        for altro in formati_in_lettura(filename):
+            if altro != formato:
+                backend.elimina(nome_file(filename, altro))
 
     return True, "File salvato su Drive."
 
 
+def accoda_righe_su_drive(righe: pd.DataFrame, filename: str):
+    """
+    Aggiunge righe al dataset filename senza ricaricare il file completo:
+    le righe vanno nel journal, che viene compattato nel file principale
+    solo al superamento delle soglie. Se un altro processo ha scritto il
+    journal nel frattempo, si rilegge solo il journal e si uniscono le righe.
+    """
+    righe = date_in_testo(righe)
+    backend = get_backend()
+    err = backend.errore()
+    if err:
+        return False, err
+
+    ts = pd.Timestamp.now(tz="UTC").isoformat()
+    nuove = [
+        {"ts": ts, "riga": r}
+        for r in json.loads(
+            righe.to_json(orient="records", date_format="iso", force_ascii=False)
+        )
+    ]
+    nome_journal = _nome_journal(filename)
+
+    with _lock_dataset(filename):
+        voci = _voci_journal(backend, filename)
+        for tentativo in range(MAX_TENTATIVI_CONFLITTO):
+            tutte, conflitti = _unisci_voci(voci, nuove, filename)
+            data = _voci_journal_to_bytes(tutte)
+            try:
+                meta = _salva_versionato(backend, nome_journal, data, "application/x-ndjson")
+                break
+            except ConflittoVersione as e:
+                voci = _voci_journal(backend, filename, rileggi=True)
+                if e.sovrascritto is not None:
+                    # il journal attuale è il nostro: recupero le voci sostituite
+                    voci, _ = _unisci_voci(_voci_journal_da_bytes(e.sovrascritto), voci, filename)
+        else:
+            raise ConflittoVersione(nome_journal, _versioni_note.get(nome_journal), "modificata di continuo")
+
+        _registra_conflitti(backend, filename, conflitti)
+
+        # il journal appena scritto è già noto: alla prossima lettura niente download
+        cache_locale.scrivi_bytes(meta, data)
+        _journal_cache[filename] = tutte
+
+        if _journal_da_compattare(tutte):
+            return compatta_su_drive(filename)
+
+    return True, "Righe aggiunte su Drive."
+
+
+def compatta_su_drive(filename: str):
+    """Incorpora il journal nel file principale e lo azzera."""
+    backend = get_backend()
+    err = backend.errore()
+    if err:
+        return False, err
+
+    with _lock_dataset(filename):
+        df, err = carica_df_da_drive(filename)
+        if df is None:
+            return False, err
+        return salva_df_su_drive(df, filename)
+
+
 def carica_df_da_drive(filename: str):
-    """Scarica un Excel da Drive e lo restituisce come DataFrame."""
-    service, folder_id, err = _get_drive_service()
+    """Scarica un dataset da Drive (più le righe del journal) come DataFrame.
+
+    Cerca prima il formato configurato, poi gli altri e infine il vecchio .xlsx.
+    """
+    backend = get_backend()
+    err = backend.errore()
     if err:
         return None, err
 
-    res = service.files().list(
-        q=f"name='{filename}' and '{folder_id}' in parents and trashed=false",
-        fields="files(id,name)",
-        pageSize=1,
-    ).execute()
-    items = res.get("files", [])
+    with _lock_dataset(filename):
+        df = None
+        for formato in formati_in_lettura(filename):
+            df = _scarica_df(backend, nome_file(filename, formato), formato)
+            if df is not None:
+                break
+        # ricontrollo sempre il journal su Drive: può averlo scritto un altro processo
+        voci = _voci_journal(backend, filename, rileggi=True)
 
-    if not items:
+    if df is None and not voci:
         return None, "File non trovato su Drive."
 
-    file_id = items[0]["id"]
+    # identificativi derivati calcolati su file e journal separatamente,
+    # come quando si confrontano durante il salvataggio
+    df = con_id_righe(df, filename) if df is not None else pd.DataFrame()
+    if voci:
+        righe_journal = con_id_righe(pd.DataFrame([v["riga"] for v in voci]), filename)
+        df = _aggiungi_mancanti(df, righe_journal, filename)
+    return df, None
 
-    fh = io.BytesIO()
-    request = service.files().get_media(fileId=file_id)
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    fh.seek(0)
 
-    df = pd.read_excel(fh)
-    return df, None
+# chiave in st.session_state -> file su Drive
+DATASET_DRIVE = {
+    "ricevute_emesse": "ricevute_asd_ssd.xlsx",
+    "prima_nota": "prima_nota_asd_ssd.xlsx",
+    "soci": "soci_asd_ssd.xlsx",
+}
+
+
+def _carica_cronometrato(filename: str):
+    """carica_df_da_drive con il tempo impiegato (download + lettura), in secondi."""
+    inizio = time.perf_counter()
+    try:
+        df, err = carica_df_da_drive(filename)
+    except Exception as e:
+        df, err = None, f"Errore lettura da Google Drive: {e}"
+    return df, err, time.perf_counter() - inizio
+
+
+def _carica_in_parallelo(da_caricare: dict) -> dict:
+    """
+    Carica i dataset {chiave: filename} in parallelo; restituisce
+    {chiave: DataFrame o None}. Registra tempi ed errori in st.session_state.
+    """
+    # un thread per file: la lettura di uno si sovrappone al download
+    # degli altri (st.session_state si tocca solo da qui)
+    inizio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(da_caricare)) as pool:
+        futures = {
+            chiave: pool.submit(_carica_cronometrato, filename)
+            for chiave, filename in da_caricare.items()
+        }
+        risultati = {chiave: f.result() for chiave, f in futures.items()}
+
+    tempi = {chiave: round(sec, 3) for chiave, (_, _, sec) in risultati.items()}
+    tempi["totale"] = round(time.perf_counter() - inizio, 3)
+    st.session_state.tempi_caricamento_drive = tempi
+    st.session_state.errori_caricamento_drive = {
+        da_caricare[chiave]: err
+        for chiave, (df, err, _) in risultati.items()
+        if df is None
+    }
+    return {chiave: df for chiave, (df, _, _) in risultati.items()}
 
 
 def carica_dati_iniziali_da_drive():
     """
-    Se esistono i file Excel su Drive, carica:
+    Se esistono i dataset su Drive (in qualunque formato), carica in parallelo:
     - ricevute_asd_ssd.xlsx  -> st.session_state.ricevute_emesse
     - prima_nota_asd_ssd.xlsx -> st.session_state.prima_nota
     - soci_asd_ssd.xlsx      -> st.session_state.soci
     Non dà errore se i file non esistono o Drive non è configurato.
+    I dataset finiscono nell'archivio condiviso tra le sessioni (dataset_condivisi):
+    si scaricano solo quelli che nessuna sessione ha ancora caricato.
+    I tempi di caricamento (secondi) finiscono in st.session_state.tempi_caricamento_drive,
+    i messaggi dei file non caricati in st.session_state.errori_caricamento_drive.
     """
-    # Ricevute
-    if "ricevute_emesse" not in st.session_state or st.session_state.ricevute_emesse.empty:
-        df, err = carica_df_da_drive("ricevute_asd_ssd.xlsx")
-        if df is not None:
-            # aggiungo colonna PDF vuota (i PDF non sono salvati su Drive)
-            if "PDF" not in df.columns:
-                df["PDF"] = None
-            st.session_state.ricevute_emesse = df
+    archivio = get_archivio()
+    da_caricare = {
+        chiave: filename
+        for chiave, filename in DATASET_DRIVE.items()
+        if archivio.versione(chiave) == 0
+    }
 
-    # Prima nota
-    if "prima_nota" not in st.session_state or st.session_state.prima_nota.empty:
-        df, err = carica_df_da_drive("prima_nota_asd_ssd.xlsx")
-        if df is not None:
-            st.session_state.prima_nota = df
+    if da_caricare:
+        for chiave, df in _carica_in_parallelo(da_caricare).items():
+            if df is None:
+                continue
+            # colonne canoniche e tipi compatti, una volta sola al caricamento
+            df = normalizza_df(chiave, df)
+            if chiave in ("ricevute_emesse", "prima_nota") and "PDF" not in df.columns:
+                # aggiungo colonna PDF vuota (i PDF non sono salvati su Drive)
+                df["PDF"] = None
+            # se nel frattempo un'altra sessione l'ha già caricato, tengo il suo
+            archivio.pubblica(chiave, df, se_versione=0)
 
-    # Soci
-    if "soci" not in st.session_state or st.session_state.soci.empty:
-        df, err = carica_df_da_drive("soci_asd_ssd.xlsx")
-        if df is not None:
-            st.session_state.soci = df
+    sincronizza_sessione()
 
 
+def verifica_lettura_da_drive():
+    """Rilegge tutti i dataset da Drive senza toccare i dati in uso (pagina di test)."""
+    _carica_in_parallelo(DATASET_DRIVE)
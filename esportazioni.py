@@ -0,0 +1,79 @@
+import io
+import os
+
+import streamlit as st
+import xlsxwriter
+
+from cache_memoria import CacheLRU
+
+# Export Excel generati solo quando l'utente li chiede e memorizzati per
+# (versione dei dataset, filtro): i rerun successivi, anche se cambia un altro
+# widget, riusano gli stessi byte senza riserializzare la prima nota.
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MAX_MB_CACHE_EXPORT = int(os.getenv("ASD_CACHE_EXPORT_MB", "64"))
+
+_cache_export = CacheLRU(MAX_MB_CACHE_EXPORT * 1024 * 1024)
+
+
+def excel_bytes(fogli: list) -> bytes:
+    """fogli = [(nome_foglio, DataFrame), ...] -> file xlsx (bytes)."""
+    buffer = io.BytesIO()
+    scrivi_excel(buffer, fogli)
+    return buffer.getvalue()
+
+
+def scrivi_excel(destinazione, fogli: list):
+    """
+    Scrive il file xlsx dei fogli [(nome_foglio, DataFrame), ...] in
+    destinazione (percorso o file-like, anche non posizionabile come
+    ZipFile.open(..., "w")). Le righe vanno direttamente a xlsxwriter in
+    modalità constant_memory (ogni riga va su disco appena scritta: la
+    memoria non cresce con il file).
+    """
+    wb = xlsxwriter.Workbook(
+        destinazione,
+        {
+            "constant_memory": True,
+            "default_date_format": "dd/mm/yyyy",
+            "remove_timezone": True,
+            "strings_to_formulas": False,
+        },
+    )
+    try:
+        for nome_foglio, df in fogli:
+            ws = wb.add_worksheet(nome_foglio)
+            ws.write_row(0, 0, [str(c) for c in df.columns])
+            # NaN/NaT -> cella vuota; tipi numpy -> tipi Python
+            valori = df.astype(object).where(df.notna(), None)
+            for r, riga in enumerate(valori.itertuples(index=False, name=None), start=1):
+                ws.write_row(r, 0, riga)
+    finally:
+        wb.close()
+
+
+def bottone_export_excel(
+    etichetta: str,
+    file_name: str,
+    chiave: tuple,
+    fogli,
+):
+    """
+    Download di un export Excel. fogli() -> [(nome_foglio, DataFrame), ...]
+    viene chiamata solo al primo clic su "Prepara": poi il file resta in cache
+    per chiave (es. versione dei dataset + filtro) e il download è immediato.
+    """
+    data = _cache_export.get(chiave)
+    if data is None:
+        if not st.button(f"Prepara: {etichetta}", key=f"prepara_export_{file_name}"):
+            return
+        with st.spinner("Preparazione file Excel..."):
+            data = excel_bytes(fogli())
+        _cache_export.put(chiave, data)
+
+    st.download_button(
+        label=etichetta,
+        data=data,
+        file_name=file_name,
+        mime=MIME_XLSX,
+        key=f"scarica_export_{file_name}",
+    )
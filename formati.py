@@ -0,0 +1,152 @@
+import os
+import io
+import gzip
+import json
+import importlib.util
+
+import pandas as pd
+
+# Formati di archiviazione dei dataset su Drive.
+# L'Excel resta leggibile (file storici .xlsx) ma serve soprattutto per gli export.
+PARQUET = "parquet"
+CSV_GZ = "csv.gz"
+XLSX = "xlsx"
+
+ESTENSIONI = {
+    PARQUET: ".parquet",
+    CSV_GZ: ".csv.gz",
+    XLSX: ".xlsx",
+}
+
+MIMETYPES = {
+    PARQUET: "application/vnd.apache.parquet",
+    CSV_GZ: "application/gzip",
+    XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+PARQUET_DISPONIBILE = importlib.util.find_spec("pyarrow") is not None
+
+
+def nome_base(filename: str) -> str:
+    """Nome del dataset senza estensione (es. prima_nota_asd_ssd)."""
+    for ext in ESTENSIONI.values():
+        if filename.endswith(ext):
+            return filename[: -len(ext)]
+    return os.path.splitext(filename)[0]
+
+
+def formato_dataset(filename: str) -> str:
+    """
+    Formato con cui salvare il dataset filename.
+    Variabili ambiente (facoltative):
+    - ASD_FORMATO_<NOME_DATASET> : es. ASD_FORMATO_PRIMA_NOTA_ASD_SSD=csv.gz
+    - ASD_FORMATO_DATI : formato di default per tutti i dataset
+    Senza configurazione: parquet se pyarrow è installato, altrimenti csv.gz.
+    """
+    formato = os.getenv(f"ASD_FORMATO_{nome_base(filename).upper()}") or os.getenv(
+        "ASD_FORMATO_DATI"
+    )
+    if formato not in ESTENSIONI or (formato == PARQUET and not PARQUET_DISPONIBILE):
+        formato = PARQUET if PARQUET_DISPONIBILE else CSV_GZ
+    return formato
+
+
+def nome_file(filename: str, formato: str) -> str:
+    """Nome del file su Drive per il dataset filename nel formato indicato."""
+    return nome_base(filename) + ESTENSIONI[formato]
+
+
+def formati_in_lettura(filename: str) -> list:
+    """Formati da cercare in lettura: quello configurato, gli altri, infine l'Excel storico."""
+    preferito = formato_dataset(filename)
+    altri = [f for f in (PARQUET, CSV_GZ) if f != preferito]
+    if not PARQUET_DISPONIBILE and PARQUET in altri:
+        altri.remove(PARQUET)
+    return [preferito] + altri + ([XLSX] if preferito != XLSX else [])
+
+
+def _tipo_colonna(serie: pd.Series) -> str:
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # colonne categoriche dei DataFrame normalizzati (schema.py): salvate come testo
+        return "string"
+    if pd.api.types.is_bool_dtype(serie):
+        return "bool"
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(serie):
+        return "float" if pd.api.types.is_float_dtype(serie) else "int"
+    valori = serie.dropna()
+    if not valori.empty and valori.map(lambda v: isinstance(v, bool)).all():
+        return "bool"
+    return "string"
+
+
+def _prepara(df: pd.DataFrame) -> tuple:
+    """
+    Rende le colonne omogenee (parquet non accetta colonne object miste,
+    es. Numero int dal vecchio Excel e str dalle nuove righe).
+    Restituisce (df, schema) con schema = {colonna: tipo}.
+    """
+    df = df.copy()
+    schema = {}
+    for col in df.columns:
+        tipo = _tipo_colonna(df[col])
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+        if tipo == "string" and df[col].dtype == object:
+            df[col] = df[col].map(lambda v: v if v is None or pd.isna(v) else str(v))
+        elif tipo == "bool" and df[col].dtype == object:
+            df[col] = df[col].astype("boolean")
+        schema[str(col)] = tipo
+    return df, schema
+
+
+def serializza_df(df: pd.DataFrame, formato: str) -> bytes:
+    """DataFrame -> bytes nel formato indicato."""
+    buffer = io.BytesIO()
+    if formato == XLSX:
+        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            df.to_excel(writer, index=False, sheet_name="Dati")
+        return buffer.getvalue()
+
+    df, schema = _prepara(df)
+    if formato == PARQUET:
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+
+    # CSV compresso con lo schema esplicito nella prima riga
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gz:
+        testo = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        testo.write(json.dumps(schema, ensure_ascii=False) + "\n")
+        df.to_csv(testo, index=False, date_format="%Y-%m-%dT%H:%M:%S")
+        testo.flush()
+        testo.detach()
+    return buffer.getvalue()
+
+
+def deserializza_df(fh, formato: str) -> pd.DataFrame:
+    """File (bytes o file-like) nel formato indicato -> DataFrame."""
+    if isinstance(fh, (bytes, bytearray, memoryview)):
+        fh = io.BytesIO(fh)
+
+    if formato == XLSX:
+        return pd.read_excel(fh)
+    if formato == PARQUET:
+        return pd.read_parquet(fh)
+
+    with gzip.GzipFile(fileobj=fh, mode="rb") as gz:
+        testo = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        schema = json.loads(testo.readline())
+        df = pd.read_csv(
+            testo,
+            dtype={
+                col: {"string": str, "float": float, "bool": str}.get(tipo, object)
+                for col, tipo in schema.items()
+                if tipo in ("string", "float", "bool")
+            },
+            parse_dates=[col for col, tipo in schema.items() if tipo == "datetime"],
+        )
+    for col, tipo in schema.items():
+        if tipo == "bool" and col in df.columns:
+            df[col] = df[col].map({"True": True, "False": False})
+    return df
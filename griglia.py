@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from cache_memoria import CacheLRU
+from schema import config_colonne_data
+
+# Griglia paginata per gli elenchi (ricevute, prima nota, soci):
+# ordinamento e suddivisione in pagine fatti qui, al browser arriva solo la
+# pagina visibile. L'ordine di ogni colonna si calcola una volta per versione
+# del dataset (array di posizioni iloc, in cache) e si riusa per ogni pagina
+# e per ogni sottoinsieme di righe (filtri).
+RIGHE_PER_PAGINA = (25, 50, 100, 200)
+ORDINE_INSERIMENTO = "(ordine di inserimento)"
+
+_cache_ordini = CacheLRU(32 * 1024 * 1024, dimensione=lambda a: a.nbytes)
+
+
+def _ordine(df: pd.DataFrame, versione, colonna: str, decrescente: bool) -> np.ndarray:
+    """Posizioni iloc di df ordinate per colonna (valori mancanti in fondo)."""
+
+    def _calcola():
+        if colonna == ORDINE_INSERIMENTO:
+            ordine = np.arange(len(df))
+            return ordine[::-1].copy() if decrescente else ordine
+        serie = df[colonna].reset_index(drop=True)
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype(object)
+        try:
+            ordinata = serie.sort_values(
+                ascending=not decrescente, kind="stable", na_position="last"
+            )
+        except TypeError:
+            # tipi misti (es. colonne non previste dallo schema)
+            ordinata = serie.astype(str).sort_values(ascending=not decrescente, kind="stable")
+        return ordinata.index.to_numpy()
+
+    if versione is None:
+        return _calcola()
+    return _cache_ordini.ottieni((versione, len(df), colonna, decrescente), _calcola)
+
+
+def griglia_paginata(
+    df: pd.DataFrame,
+    chiave: str,
+    versione=None,
+    posizioni=None,
+    nascoste=(),
+    selezione: bool = True,
+):
+    """
+    Mostra df una pagina alla volta, ordinato per la colonna scelta.
+    chiave: prefisso dei widget; versione: identifica il contenuto di df
+    (es. versione_dataset) per riusare gli ordinamenti; posizioni: iloc delle
+    righe da mostrare (None = tutte); nascoste: colonne da non mostrare.
+    Con selezione restituisce la posizione iloc in df della riga selezionata
+    (None se nessuna), altrimenti None.
+    """
+    colonne = [c for c in df.columns if c not in nascoste]
+
+    c_ord, c_dir, c_n = st.columns([3, 1, 1])
+    with c_ord:
+        colonna = st.selectbox(
+            "Ordina per", [ORDINE_INSERIMENTO] + colonne, key=f"{chiave}_ordina"
+        )
+    with c_dir:
+        decrescente = st.toggle("Decrescente", value=True, key=f"{chiave}_decrescente")
+    with c_n:
+        per_pagina = st.selectbox(
+            "Righe per pagina", RIGHE_PER_PAGINA, key=f"{chiave}_per_pagina"
+        )
+
+    ordine = _ordine(df, versione, colonna, decrescente)
+    incluse = None
+    if posizioni is not None:
+        incluse = np.zeros(len(df), dtype=bool)
+        incluse[np.asarray(posizioni, dtype=np.int64)] = True
+        ordine = ordine[incluse[ordine]]
+
+    totale = len(ordine)
+    if totale == 0:
+        st.info("Nessuna riga da mostrare.")
+        return None
+
+    n_pagine = (totale - 1) // per_pagina + 1
+    chiave_pagina = f"{chiave}_pagina"
+    if st.session_state.get(chiave_pagina, 1) > n_pagine:
+        st.session_state[chiave_pagina] = 1
+    pagina = st.number_input(
+        f"Pagina (di {n_pagine})", min_value=1, max_value=n_pagine, step=1, key=chiave_pagina
+    )
+
+    inizio = (int(pagina) - 1) * per_pagina
+    sulla_pagina = ordine[inizio : inizio + per_pagina]
+    df_pagina = df.iloc[sulla_pagina][colonne]
+    st.caption(f"Righe {inizio + 1}–{inizio + len(sulla_pagina)} di {totale}")
+
+    if not selezione:
+        st.dataframe(df_pagina, column_config=config_colonne_data(df_pagina))
+        return None
+
+    evento = st.dataframe(
+        df_pagina,
+        column_config=config_colonne_data(df_pagina),
+        on_select="rerun",
+        selection_mode="single-row",
+        # widget diverso per pagina / ordinamento: la selezione non resta
+        # agganciata a una posizione della pagina precedente
+        key=f"{chiave}_tabella_{colonna}_{decrescente}_{per_pagina}_{pagina}",
+    )
+
+    # la riga selezionata resta tale anche cambiando pagina
+    chiave_selezionata = f"{chiave}_selezionata"
+    righe = evento.selection.rows
+    if righe:
+        st.session_state[chiave_selezionata] = int(sulla_pagina[righe[0]])
+    selezionata = st.session_state.get(chiave_selezionata)
+    if selezionata is None or selezionata >= len(df):
+        return None
+    if incluse is not None and not incluse[selezionata]:
+        # esclusa dai filtri attuali
+        return None
+    return selezionata
@@ -0,0 +1,111 @@
+import io
+import hashlib
+import importlib.util
+
+from PIL import Image, ImageOps
+
+from cache_memoria import CacheLRU
+
+# Logo dell'associazione normalizzato una volta al caricamento:
+# ridimensionato alla risoluzione che serve davvero (30x30 punti nel PDF),
+# trasparenza conservata solo se usata, ricompresso.
+# Il risultato è messo in cache per hash del contenuto: ricevute, anteprime e
+# pagina Anagrafica riusano sempre gli stessi byte.
+
+# Lato del logo nel PDF (punti) e risoluzione di stampa
+LATO_LOGO_PUNTI = 30
+DPI_LOGO = 300
+LATO_LOGO_PX = round(LATO_LOGO_PUNTI / 72 * DPI_LOGO)  # 125 px
+
+QUALITA_JPEG = 85
+MAX_LOGHI_IN_CACHE = 32
+
+# sha256 del logo caricato -> byte normalizzati (max MAX_LOGHI_IN_CACHE voci)
+_cache = CacheLRU(MAX_LOGHI_IN_CACHE, dimensione=lambda _: 1)
+
+
+def hash_contenuto(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _ha_trasparenza(img: Image.Image) -> bool:
+    if img.mode in ("RGBA", "LA"):
+        return img.getchannel("A").getextrema()[0] < 255
+    return img.mode == "P" and "transparency" in img.info
+
+
+def _normalizza(data: bytes) -> bytes:
+    img = Image.open(io.BytesIO(data))
+    img = ImageOps.exif_transpose(img)  # foto da telefono: orientamento EXIF
+    img.thumbnail((LATO_LOGO_PX, LATO_LOGO_PX), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if _ha_trasparenza(img):
+        # PNG con canale alfa: nel PDF diventa la maschera (mask="auto")
+        img.convert("RGBA").save(out, format="PNG", optimize=True)
+    else:
+        img.convert("RGB").save(out, format="JPEG", quality=QUALITA_JPEG, optimize=True)
+    return out.getvalue()
+
+
+def normalizza_logo(data: bytes):
+    """
+    Logo pronto per PDF e anteprime (bytes PNG/JPEG di al massimo
+    LATO_LOGO_PX pixel per lato). Se l'immagine non è leggibile restituisce
+    i byte originali; None se data è vuoto.
+    """
+    if not data:
+        return None
+    data = bytes(data)
+    chiave = hash_contenuto(data)
+    normalizzato = _cache.get(chiave)
+    if normalizzato is not None:
+        return normalizzato
+
+    try:
+        normalizzato = _normalizza(data)
+    except Exception:
+        normalizzato = data
+
+    _cache.put(chiave, normalizzato)
+    # rileggere un logo già normalizzato non lo rielabora
+    _cache.put(hash_contenuto(normalizzato), normalizzato)
+    return normalizzato
+
+
+# Anteprime dei PDF (ricevute, allegati): prima pagina renderizzata una volta
+# come PNG piccolo e tenuta in cache per hash del PDF. Serve pypdfium2
+# (facoltativo): senza, le pagine usano l'anteprima PDF incorporata.
+PDFIUM_DISPONIBILE = importlib.util.find_spec("pypdfium2") is not None
+LARGHEZZA_MINIATURA_PX = 480
+_cache_miniature = CacheLRU(16 * 1024 * 1024)
+
+
+def _renderizza_prima_pagina(pdf_bytes) -> bytes:
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(bytes(pdf_bytes))
+    try:
+        pagina = pdf[0]
+        scala = LARGHEZZA_MINIATURA_PX / pagina.get_width()
+        img = pagina.render(scale=scala).to_pil()
+        pagina.close()
+    finally:
+        pdf.close()
+    out = io.BytesIO()
+    img.convert("RGB").save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def miniatura_pdf(pdf_bytes):
+    """PNG della prima pagina del PDF (bytes), None se non disponibile."""
+    if not PDFIUM_DISPONIBILE or not pdf_bytes:
+        return None
+
+    def _calcola():
+        try:
+            return _renderizza_prima_pagina(pdf_bytes)
+        except Exception:
+            return None
+
+    return _cache_miniature.ottieni(hash_contenuto(pdf_bytes), _calcola)
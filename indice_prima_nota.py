@@ -0,0 +1,178 @@
+import re
+import bisect
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from cache_memoria import CacheLRU
+from dataset_condivisi import dataset, versione_dataset
+
+# Indici della prima nota per i filtri combinati dell'elenco movimenti,
+# costruiti una volta per versione del dataset (una nuova riga = nuova
+# versione = indici ricostruiti alla prima ricerca) e condivisi tra le sessioni
+# (la chiave è versione_dataset, uguale per tutte le sessioni):
+# - date e importi ordinati: intervalli con due ricerche binarie
+# - una bitmap (array bool) per ogni valore di CentroCosto, TipoVoce, MetodoPagamento
+# - indice invertito delle parole di Causale, Intestatario, NumeroDocumento
+# Un filtro è l'AND delle bitmap dei singoli criteri.
+DIMENSIONI = ("CentroCosto", "TipoVoce", "MetodoPagamento")
+COLONNE_TESTO = ("Causale", "Intestatario", "NumeroDocumento")
+MOVIMENTI = ("Tutti", "Solo entrate", "Solo uscite")
+
+MAX_MB_CACHE_INDICI = 64
+_cache_indici = CacheLRU(MAX_MB_CACHE_INDICI * 1024 * 1024, dimensione=lambda i: i.nbytes)
+
+
+def _parole(testo: str) -> list:
+    """Parole minuscole, senza accenti e punteggiatura."""
+    testo = unicodedata.normalize("NFKD", str(testo))
+    testo = testo.encode("ascii", "ignore").decode("ascii").lower()
+    return re.sub(r"[^a-z0-9]+", " ", testo).split()
+
+
+def _testo(df: pd.DataFrame, col: str) -> list:
+    if col not in df.columns:
+        return [""] * len(df)
+    return df[col].astype(object).where(df[col].notna(), "").astype(str).tolist()
+
+
+def _importi(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors="coerce").fillna(0.0).to_numpy(dtype="float64")
+
+
+class _Ordinato:
+    """Valori ordinati con le loro posizioni: righe con valore in [minimo, massimo]."""
+
+    def __init__(self, valori: np.ndarray, validi: np.ndarray):
+        posizioni = np.flatnonzero(validi)
+        ordine = np.argsort(valori[posizioni], kind="stable")
+        self.valori = valori[posizioni][ordine]
+        self.posizioni = posizioni[ordine]
+
+    def tra(self, minimo=None, massimo=None) -> np.ndarray:
+        inizio = 0 if minimo is None else np.searchsorted(self.valori, minimo, side="left")
+        fine = len(self.valori)
+        if massimo is not None:
+            fine = np.searchsorted(self.valori, massimo, side="right")
+        return self.posizioni[inizio:fine]
+
+
+class IndicePrimaNota:
+    def __init__(self, df: pd.DataFrame):
+        self.n = len(df)
+
+        if "Data" in df.columns:
+            date = pd.to_datetime(df["Data"], errors="coerce")
+        else:
+            date = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+        self._date = _Ordinato(date.to_numpy(dtype="datetime64[ns]"), date.notna().to_numpy())
+
+        entrate, uscite = _importi(df, "Entrata"), _importi(df, "Uscita")
+        self._entrate = entrate > 0
+        self._uscite = uscite > 0
+        # importo del movimento: entrata o uscita
+        self._importi = _Ordinato(np.maximum(entrate, uscite), np.ones(self.n, dtype=bool))
+
+        self.bitmap = {}  # dimensione -> {valore: array bool}
+        for col in DIMENSIONI:
+            valori = pd.Series(_testo(df, col), dtype="category")
+            codici = valori.cat.codes.to_numpy()
+            self.bitmap[col] = {
+                v: codici == i for i, v in enumerate(valori.cat.categories) if v != ""
+            }
+
+        postings = defaultdict(list)
+        for col in COLONNE_TESTO:
+            for i, testo in enumerate(_testo(df, col)):
+                for parola in _parole(testo):
+                    postings[parola].append(i)
+        self._parole = sorted(postings)
+        self._postings = [np.unique(np.asarray(postings[p], dtype=np.int64)) for p in self._parole]
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria (approssimata) occupata dall'indice, per la cache."""
+        array = [self._entrate, self._uscite, self._date.valori, self._date.posizioni]
+        array += [self._importi.valori, self._importi.posizioni] + self._postings
+        array += [b for bitmap in self.bitmap.values() for b in bitmap.values()]
+        return sum(a.nbytes for a in array) + sum(len(p) + 50 for p in self._parole)
+
+    def valori(self, dimensione: str) -> list:
+        """Valori presenti per una dimensione (per i selettori dei filtri)."""
+        return sorted(self.bitmap.get(dimensione, {}))
+
+    def _da_posizioni(self, posizioni: np.ndarray) -> np.ndarray:
+        maschera = np.zeros(self.n, dtype=bool)
+        maschera[posizioni] = True
+        return maschera
+
+    def _con_prefisso(self, prefisso: str) -> np.ndarray:
+        maschera = np.zeros(self.n, dtype=bool)
+        j = bisect.bisect_left(self._parole, prefisso)
+        while j < len(self._parole) and self._parole[j].startswith(prefisso):
+            maschera[self._postings[j]] = True
+            j += 1
+        return maschera
+
+    def filtra(self, filtro: dict) -> np.ndarray:
+        """Posizioni (iloc, in ordine) delle righe che rispettano tutti i criteri di filtro."""
+        maschera = np.ones(self.n, dtype=bool)
+
+        movimenti = filtro.get("movimenti", "Tutti")
+        if movimenti == "Solo entrate":
+            maschera &= self._entrate
+        elif movimenti == "Solo uscite":
+            maschera &= self._uscite
+
+        dal, al = filtro.get("dal"), filtro.get("al")
+        if dal is not None or al is not None:
+            if dal is not None:
+                dal = np.datetime64(pd.Timestamp(dal), "ns")
+            if al is not None:
+                # fino alla fine del giorno indicato
+                fine_giorno = pd.Timestamp(al) + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+                al = np.datetime64(fine_giorno, "ns")
+            maschera &= self._da_posizioni(self._date.tra(dal, al))
+
+        minimo, massimo = filtro.get("importo_min"), filtro.get("importo_max")
+        if minimo is not None or massimo is not None:
+            maschera &= self._da_posizioni(self._importi.tra(minimo, massimo))
+
+        for col in DIMENSIONI:
+            scelti = filtro.get(col) or ()
+            if scelti:
+                bitmap = self.bitmap[col]
+                unione = np.zeros(self.n, dtype=bool)
+                for v in scelti:
+                    if v in bitmap:
+                        unione |= bitmap[v]
+                maschera &= unione
+
+        # ogni parola cercata deve essere l'inizio di una parola del movimento
+        for parola in _parole(filtro.get("testo", "")):
+            maschera &= self._con_prefisso(parola)
+            if not maschera.any():
+                break
+
+        return np.flatnonzero(maschera)
+
+
+def chiave_filtro(filtro: dict) -> tuple:
+    """Forma hashable del filtro (per le cache degli export)."""
+    return tuple(
+        (k, tuple(v) if isinstance(v, (list, tuple)) else v) for k, v in sorted(filtro.items())
+    )
+
+
+def indice_prima_nota() -> IndicePrimaNota:
+    """Indice della prima nota della sessione, ricostruito solo quando la prima nota cambia."""
+    # prima la versione (porta la sessione all'ultima), poi il DataFrame a cui si riferisce
+    versione = versione_dataset("prima_nota")
+    df = dataset("prima_nota")
+    if df is None:
+        df = pd.DataFrame()
+    return _cache_indici.ottieni(versione, lambda: IndicePrimaNota(df))
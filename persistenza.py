@@ -0,0 +1,199 @@
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from drive_utils import (
+    accoda_righe_su_drive,
+    archivio_configurato,
+    conflitti_rilevati,
+    salva_df_su_drive,
+)
+
+# Stati di sincronizzazione di un file
+IN_ATTESA = "in attesa"
+SINCRONIZZATO = "sincronizzato"
+ERRORE = "errore"
+NON_CONFIGURATO = "non configurato"
+
+# Backoff esponenziale sugli errori Drive: 1s, 2s, 4s, ... fino a 60s
+BACKOFF_INIZIALE = 1.0
+BACKOFF_MASSIMO = 60.0
+MAX_TENTATIVI = 6
+
+
+class CodaScrittura:
+    """
+    Salvataggi su Drive in background (write-behind).
+
+    Le pagine accodano le modifiche e proseguono subito; un thread di
+    servizio le carica su Drive. Più modifiche allo stesso file ancora in
+    coda vengono unite in un solo caricamento.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # filename -> {"completo": DataFrame | None, "righe": [DataFrame, ...]}
+        self._in_coda = {}
+        # filename -> (istante del prossimo tentativo, tentativi falliti)
+        self._tentativi = {}
+        # filename -> {"stato": ..., "messaggio": ..., "ora": ...}
+        self._stato = {}
+        self._thread = threading.Thread(
+            target=self._ciclo, name="coda-scrittura-drive", daemon=True
+        )
+        self._thread.start()
+
+    # ---------- API per le pagine ----------
+    def accoda_righe(self, righe: pd.DataFrame, filename: str):
+        with self._cond:
+            voce = self._in_coda.setdefault(filename, {"completo": None, "righe": []})
+            voce["righe"].append(righe)
+            self._pianifica(filename)
+
+    def salva_completo(self, df: pd.DataFrame, filename: str):
+        with self._cond:
+            # il file completo include già le righe accodate prima
+            self._in_coda[filename] = {"completo": df, "righe": []}
+            self._pianifica(filename)
+
+    def stato(self, filename: str):
+        with self._cond:
+            return dict(self._stato.get(filename, {}))
+
+    # ---------- interno ----------
+    def _pianifica(self, filename: str):
+        # una nuova modifica riparte da zero anche dopo un errore definitivo
+        self._tentativi[filename] = (time.monotonic(), 0)
+        self._imposta_stato(filename, IN_ATTESA, "Salvataggio su Drive in corso...")
+        self._cond.notify()
+
+    def _imposta_stato(self, filename: str, stato: str, messaggio: str):
+        self._stato[filename] = {
+            "stato": stato,
+            "messaggio": messaggio,
+            "ora": time.strftime("%H:%M:%S"),
+        }
+
+    def _prossimo(self):
+        """(filename pronto da caricare, None) oppure (None, secondi di attesa)."""
+        adesso = time.monotonic()
+        pronti = [
+            (quando, f)
+            for f, (quando, _) in self._tentativi.items()
+            if f in self._in_coda and quando != float("inf")
+        ]
+        if not pronti:
+            return None, None
+        quando, filename = min(pronti)
+        if quando > adesso:
+            return None, quando - adesso
+        return filename, None
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                filename, attesa = self._prossimo()
+                while filename is None:
+                    self._cond.wait(timeout=attesa)
+                    filename, attesa = self._prossimo()
+                voce = self._in_coda.pop(filename)
+                _, tentativi = self._tentativi[filename]
+
+            ok, msg = self._carica(filename, voce)
+
+            with self._cond:
+                if ok:
+                    if filename not in self._in_coda:
+                        self._tentativi.pop(filename, None)
+                        self._imposta_stato(filename, SINCRONIZZATO, msg)
+                    continue
+
+                if not archivio_configurato():
+                    # come prima: senza Drive i dati restano solo in sessione
+                    self._in_coda.pop(filename, None)
+                    self._tentativi.pop(filename, None)
+                    self._imposta_stato(filename, NON_CONFIGURATO, msg)
+                    continue
+
+                # rimetto in coda quanto non caricato, davanti alle modifiche nuove
+                nuova = self._in_coda.get(filename)
+                if nuova is None:
+                    self._in_coda[filename] = voce
+                elif nuova["completo"] is None:
+                    nuova["completo"] = voce["completo"]
+                    nuova["righe"] = voce["righe"] + nuova["righe"]
+
+                tentativi += 1
+                if tentativi >= MAX_TENTATIVI:
+                    # resta in coda: riparte alla prossima modifica del file
+                    self._tentativi[filename] = (float("inf"), tentativi)
+                    self._imposta_stato(filename, ERRORE, msg)
+                else:
+                    ritardo = min(BACKOFF_INIZIALE * 2 ** (tentativi - 1), BACKOFF_MASSIMO)
+                    self._tentativi[filename] = (time.monotonic() + ritardo, tentativi)
+                    self._imposta_stato(
+                        filename, IN_ATTESA, f"{msg} Nuovo tentativo tra {ritardo:.0f}s."
+                    )
+
+    def _carica(self, filename: str, voce: dict):
+        try:
+            if voce["completo"] is not None:
+                ok, msg = salva_df_su_drive(voce["completo"], filename)
+                if not ok:
+                    return ok, msg
+            if voce["righe"]:
+                righe = pd.concat(voce["righe"], ignore_index=True)
+                return accoda_righe_su_drive(righe, filename)
+            return True, "File salvato su Drive."
+        except Exception as e:
+            return False, f"Errore salvataggio su Drive: {e}"
+
+
+_coda = None
+_coda_lock = threading.Lock()
+
+
+def get_coda_scrittura() -> CodaScrittura:
+    """Coda di scrittura unica per il processo (condivisa tra le sessioni)."""
+    global _coda
+    with _coda_lock:
+        if _coda is None:
+            _coda = CodaScrittura()
+        return _coda
+
+
+def accoda_salvataggio(righe: pd.DataFrame, filename: str):
+    """Accoda l'aggiunta di righe a filename su Drive e ritorna subito."""
+    get_coda_scrittura().accoda_righe(righe, filename)
+
+
+def accoda_salvataggio_completo(df: pd.DataFrame, filename: str):
+    """Accoda la riscrittura completa di filename su Drive e ritorna subito."""
+    get_coda_scrittura().salva_completo(df, filename)
+
+
+def mostra_stato_sincronizzazione(*filenames: str):
+    """Mostra lo stato di sincronizzazione su Drive dei file indicati."""
+    coda = get_coda_scrittura()
+    for filename in filenames:
+        stato = coda.stato(filename)
+        if not stato:
+            continue
+        if stato["stato"] == SINCRONIZZATO:
+            st.caption(f"💾 {filename}: sincronizzato su Drive ({stato['ora']}).")
+        elif stato["stato"] == IN_ATTESA:
+            st.caption(f"⏳ {filename}: {stato['messaggio']}")
+        elif stato["stato"] == ERRORE:
+            st.error(f"❌ {filename}: {stato['messaggio']}")
+
+        conflitti = conflitti_rilevati(filename)
+        if conflitti:
+            st.warning(
+                f"⚠️ {filename}: {len(conflitti)} righe modificate anche da un'altra "
+                "postazione. È stata tenuta la versione di questa postazione; "
+                "l'altra è conservata su Drive nel file .conflitti.jsonl."
+            )
+            with st.expander("Dettaglio conflitti"):
+                st.json(conflitti)
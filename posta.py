@@ -0,0 +1,340 @@
+import os
+import time
+import smtplib
+import threading
+from email.message import EmailMessage
+
+import streamlit as st
+
+# Invio email (ricevute) con una sola sessione SMTP per processo:
+# la connessione (STARTTLS + login) resta aperta tra un messaggio e l'altro e
+# viene riaperta se il server la chiude. Gli invii massivi passano da una coda
+# con limite di messaggi al minuto e nuovi tentativi sugli errori temporanei.
+#
+# Variabili ambiente:
+# - SMTP_SERVER, SMTP_PORT (default 587)
+# - SMTP_USER, SMTP_PASSWORD : login (facoltativo: senza credenziali niente login)
+# - SENDER_EMAIL : mittente (default SMTP_USER)
+# - SMTP_STARTTLS : "0" per disattivare STARTTLS (default attivo)
+# - SMTP_MAX_AL_MINUTO : limite di invii al minuto della coda (default 30)
+# - SMTP_TENTATIVI : tentativi per messaggio (default 3)
+#
+# Prova offline con un server SMTP locale che stampa i messaggi, ad esempio:
+#   python -m aiosmtpd -n -l localhost:8025
+#   SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_STARTTLS=0 SENDER_EMAIL=asd@example.org
+
+# Dopo quanti secondi di inattività si verifica la connessione (NOOP) prima di usarla
+SECONDI_VERIFICA_CONNESSIONE = 60
+TIMEOUT_SMTP = 30
+BACKOFF_INIZIALE = 2.0
+
+# Stati dei messaggi in coda
+IN_CODA = "in coda"
+INVIATO = "inviato"
+ERRORE = "errore"
+
+
+def configurazione_smtp() -> dict:
+    smtp_user = os.getenv("SMTP_USER")
+    return {
+        "server": os.getenv("SMTP_SERVER"),
+        "porta": int(os.getenv("SMTP_PORT", "587")),
+        "utente": smtp_user,
+        "password": os.getenv("SMTP_PASSWORD"),
+        "mittente": os.getenv("SENDER_EMAIL", smtp_user),
+        "starttls": os.getenv("SMTP_STARTTLS", "1").strip().lower() not in ("0", "no", "false"),
+        "max_al_minuto": float(os.getenv("SMTP_MAX_AL_MINUTO", "30")),
+        "tentativi": int(os.getenv("SMTP_TENTATIVI", "3")),
+    }
+
+
+def errore_configurazione(config: dict):
+    """Messaggio se l'SMTP non è configurato, altrimenti None."""
+    if not (config["server"] and config["mittente"]):
+        return "SMTP non configurato nelle variabili d'ambiente."
+    if bool(config["utente"]) != bool(config["password"]):
+        return "SMTP_USER e SMTP_PASSWORD vanno impostati insieme."
+    return None
+
+
+def crea_messaggio(
+    mittente: str,
+    destinatario: str,
+    oggetto: str,
+    corpo: str,
+    pdf_bytes: bytes,
+    filename: str,
+) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = oggetto
+    msg["From"] = mittente
+    msg["To"] = destinatario
+    msg.set_content(corpo)
+    msg.add_attachment(
+        pdf_bytes,
+        maintype="application",
+        subtype="pdf",
+        filename=filename,
+    )
+    return msg
+
+
+class SessioneSMTP:
+    """Connessione SMTP persistente, riaperta quando serve."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._smtp = None
+        self._config = None
+        self._ultimo_uso = 0.0
+
+    def _chiudi(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                try:
+                    self._smtp.close()
+                except Exception:
+                    pass
+            self._smtp = None
+
+    def _scarta(self):
+        """Chiude il socket di una connessione già caduta (senza QUIT)."""
+        if self._smtp is not None:
+            try:
+                self._smtp.close()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _connetti(self, config: dict):
+        smtp = smtplib.SMTP(config["server"], config["porta"], timeout=TIMEOUT_SMTP)
+        try:
+            if config["starttls"]:
+                smtp.starttls()
+            if config["utente"]:
+                smtp.login(config["utente"], config["password"])
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._config = config
+
+    def _connessione(self, config: dict):
+        """Sessione pronta all'uso (nuova se la configurazione è cambiata o quella vecchia è caduta)."""
+        if self._smtp is not None and self._config != config:
+            self._chiudi()
+        if (
+            self._smtp is not None
+            and time.monotonic() - self._ultimo_uso > SECONDI_VERIFICA_CONNESSIONE
+        ):
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self._chiudi()
+            except Exception:
+                self._scarta()
+        if self._smtp is None:
+            self._connetti(config)
+        return self._smtp
+
+    def invia(self, msg: EmailMessage, config: dict):
+        """Invia msg; se la connessione è caduta la riapre e riprova una volta."""
+        with self._lock:
+            for tentativo in (1, 2):
+                smtp = self._connessione(config)
+                try:
+                    smtp.send_message(msg)
+                    self._ultimo_uso = time.monotonic()
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    self._scarta()
+                    if tentativo == 2:
+                        raise
+                except smtplib.SMTPRecipientsRefused:
+                    # destinatario rifiutato: la sessione resta valida
+                    self._ultimo_uso = time.monotonic()
+                    raise
+                except Exception:
+                    self._chiudi()
+                    raise
+
+
+def _errore_definitivo(e: Exception) -> bool:
+    """Errori che un nuovo tentativo non risolve (indirizzo rifiutato, login errato, 5xx)."""
+    if isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPAuthenticationError)):
+        return True
+    codice = getattr(e, "smtp_code", None)
+    return isinstance(codice, int) and 500 <= codice < 600
+
+
+class CodaPosta:
+    """
+    Invii in background, rispettando SMTP_MAX_AL_MINUTO.
+
+    Ogni elemento è (id lotto, chiave, descrizione, funzione che crea il
+    messaggio): il messaggio (e quindi il PDF) viene preparato solo al momento
+    dell'invio. Nello stesso lotto una chiave (es. la ricevuta) si accoda una
+    volta sola, finché il suo invio non fallisce.
+    """
+
+    def __init__(self, sessione: SessioneSMTP):
+        self._sessione = sessione
+        self._cond = threading.Condition()
+        self._coda = []  # [(quando, progressivo, lotto, chiave, descrizione, crea, tentativi)]
+        self._progressivo = 0
+        # lotto -> {"totale", "inviati", "errori": [(descrizione, messaggio)], "ora",
+        #           "chiavi": chiavi in coda o già inviate}
+        self._lotti = {}
+        self._ultimo_invio = 0.0
+        self._thread = threading.Thread(target=self._ciclo, name="coda-posta", daemon=True)
+        self._thread.start()
+
+    # ---------- API per le pagine ----------
+    def accoda_lotto(self, lotto: str, elementi: list) -> int:
+        """
+        elementi = [(chiave, descrizione, crea_messaggio), ...]; crea_messaggio() -> EmailMessage.
+        Salta le chiavi già in coda o già inviate nel lotto; restituisce quanti ne ha accodati.
+        """
+        with self._cond:
+            stato = self._lotti.setdefault(
+                lotto, {"totale": 0, "inviati": 0, "errori": [], "ora": "", "chiavi": set()}
+            )
+            adesso = time.monotonic()
+            accodati = 0
+            for chiave, descrizione, crea in elementi:
+                if chiave in stato["chiavi"]:
+                    continue
+                stato["chiavi"].add(chiave)
+                self._progressivo += 1
+                self._coda.append((adesso, self._progressivo, lotto, chiave, descrizione, crea, 0))
+                accodati += 1
+            stato["totale"] += accodati
+            self._cond.notify()
+            return accodati
+
+    def stato_lotto(self, lotto: str):
+        with self._cond:
+            stato = self._lotti.get(lotto)
+            if stato is None:
+                return {}
+            return {
+                "totale": stato["totale"],
+                "inviati": stato["inviati"],
+                "errori": list(stato["errori"]),
+                "ora": stato["ora"],
+            }
+
+    # ---------- interno ----------
+    def _prossimo(self):
+        if not self._coda:
+            return None, None
+        self._coda.sort(key=lambda e: (e[0], e[1]))
+        config = configurazione_smtp()
+        intervallo = 60.0 / config["max_al_minuto"] if config["max_al_minuto"] > 0 else 0.0
+        pronto = max(self._coda[0][0], self._ultimo_invio + intervallo)
+        attesa = pronto - time.monotonic()
+        if attesa > 0:
+            return None, attesa
+        return self._coda.pop(0), None
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                elemento, attesa = self._prossimo()
+                while elemento is None:
+                    self._cond.wait(timeout=attesa)
+                    elemento, attesa = self._prossimo()
+
+            _, progressivo, lotto, chiave, descrizione, crea, tentativi = elemento
+            config = configurazione_smtp()
+            errore = errore_configurazione(config)
+            msg = None
+            if errore is None:
+                try:
+                    msg = crea()
+                except Exception as e:
+                    # PDF o messaggio non costruibili: riprovare non cambia nulla
+                    errore = f"{e}"
+            if msg is not None:
+                try:
+                    self._sessione.invia(msg, config)
+                except Exception as e:
+                    errore = f"{e}"
+                    if tentativi + 1 < config["tentativi"] and not _errore_definitivo(e):
+                        ritardo = BACKOFF_INIZIALE * 2**tentativi
+                        with self._cond:
+                            self._ultimo_invio = time.monotonic()
+                            self._coda.append(
+                                (
+                                    time.monotonic() + ritardo,
+                                    progressivo,
+                                    lotto,
+                                    chiave,
+                                    descrizione,
+                                    crea,
+                                    tentativi + 1,
+                                )
+                            )
+                        continue
+
+            with self._cond:
+                if msg is not None:
+                    self._ultimo_invio = time.monotonic()
+                stato = self._lotti[lotto]
+                if errore is None:
+                    stato["inviati"] += 1
+                else:
+                    stato["errori"].append((descrizione, errore))
+                    # non inviato: si può accodare di nuovo
+                    stato["chiavi"].discard(chiave)
+                stato["ora"] = time.strftime("%H:%M:%S")
+
+
+_sessione = SessioneSMTP()
+_coda = None
+_coda_lock = threading.Lock()
+
+
+def get_coda_posta() -> CodaPosta:
+    """Coda di invio unica per il processo (condivisa tra le sessioni)."""
+    global _coda
+    with _coda_lock:
+        if _coda is None:
+            _coda = CodaPosta(_sessione)
+        return _coda
+
+
+def invia_subito(destinatario: str, oggetto: str, corpo: str, pdf_bytes: bytes, filename: str):
+    """Invio immediato di un messaggio sulla sessione SMTP condivisa. Restituisce (ok, msg)."""
+    config = configurazione_smtp()
+    errore = errore_configurazione(config)
+    if errore:
+        return False, errore
+    try:
+        msg = crea_messaggio(config["mittente"], destinatario, oggetto, corpo, pdf_bytes, filename)
+        _sessione.invia(msg, config)
+        return True, "Email inviata correttamente."
+    except Exception as e:
+        return False, f"Errore invio email: {e}"
+
+
+def mittente_configurato():
+    """Indirizzo mittente, oppure None se l'SMTP non è configurato."""
+    config = configurazione_smtp()
+    return None if errore_configurazione(config) else config["mittente"]
+
+
+def mostra_stato_invii(lotto: str):
+    """Avanzamento dell'invio massivo lotto."""
+    stato = get_coda_posta().stato_lotto(lotto)
+    if not stato:
+        return
+    fatti = stato["inviati"] + len(stato["errori"])
+    st.progress(
+        fatti / stato["totale"] if stato["totale"] else 1.0,
+        text=f"📧 {lotto}: {stato['inviati']} inviate, {len(stato['errori'])} errori, "
+        f"{stato['totale'] - fatti} in coda",
+    )
+    for descrizione, errore in stato["errori"]:
+        st.error(f"❌ {descrizione}: {errore}")
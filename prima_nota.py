@@ -2,38 +2,71 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
-from drive_utils import salva_df_su_drive
-from documenti import mostra_preview_pdf, df_to_excel_bytes
+from blob_pdf import leggi_pdf, salva_pdf
+from persistenza import accoda_salvataggio, mostra_stato_sincronizzazione
+from dataset_condivisi import aggiungi_righe, dataset, pubblica_dataset, versione_dataset
+from documenti import mostra_preview_pdf
+from esportazioni import bottone_export_excel
+from griglia import griglia_paginata
+from indice_prima_nota import DIMENSIONI, MOVIMENTI, chiave_filtro, indice_prima_nota
+from schema import COLONNA_ID, COLONNE_PRIMA_NOTA, df_vuoto, formatta_data, nuovi_id
 
 
 def _inizializza_prima_nota():
     """
     Inizializza la prima nota nello session_state, con colonna PDF per gli allegati.
     """
-    colonne_base = [
-        "Data",
-        "NumeroDocumento",
-        "Intestatario",
-        "TipoVoce",
-        "CentroCosto",
-        "Causale",
-        "Entrata",
-        "Uscita",
-        "MetodoPagamento",
-    ]
-
     if "prima_nota" not in st.session_state:
-        st.session_state.prima_nota = pd.DataFrame(columns=colonne_base + ["PDF"])
-    else:
-        df = st.session_state.prima_nota.copy()
-        # garantiamo la presenza delle colonne base
-        for col in colonne_base:
-            if col not in df.columns:
-                df[col] = "" if col not in ["Entrata", "Uscita"] else 0.0
-        # colonna PDF per gli allegati
+        st.session_state.prima_nota = df_vuoto("prima_nota", ["PDF"])
+        return
+
+    for tentativo in range(3):
+        df = dataset("prima_nota")
+        versione = st.session_state.get("versioni_dataset", {}).get("prima_nota", 0)
+        mancanti = [col for col in COLONNE_PRIMA_NOTA + ["PDF"] if col not in df.columns]
+        if not mancanti:
+            return
+        # il DataFrame in sessione è condiviso con le altre sessioni: ne pubblico
+        # uno nuovo (pubblica_dataset aggiunge le colonne base mancanti, schema.py),
+        # solo se nessuno ha aggiunto righe dopo la versione appena letta
         if "PDF" not in df.columns:
-            df["PDF"] = None
-        st.session_state.prima_nota = df
+            # colonna PDF per gli allegati
+            df = df.assign(PDF=None)
+        if pubblica_dataset("prima_nota", df, se_versione=versione):
+            return
+
+
+def _filtri_prima_nota(indice) -> dict:
+    """Criteri di ricerca dell'elenco movimenti (combinati in AND)."""
+    filtro = {
+        "movimenti": st.radio("Filtra movimenti", MOVIMENTI, horizontal=True),
+    }
+    with st.expander("Filtri avanzati"):
+        filtro["testo"] = st.text_input(
+            "Cerca in causale / intestatario / numero documento", ""
+        ).strip()
+
+        col1, col2 = st.columns(2)
+        with col1:
+            filtro["dal"] = st.date_input("Dal", value=None, format="DD/MM/YYYY")
+            filtro["importo_min"] = st.number_input(
+                "Importo minimo", min_value=0.0, value=None, step=1.0, format="%.2f"
+            )
+        with col2:
+            filtro["al"] = st.date_input("Al", value=None, format="DD/MM/YYYY")
+            filtro["importo_max"] = st.number_input(
+                "Importo massimo", min_value=0.0, value=None, step=1.0, format="%.2f"
+            )
+
+        etichette = {
+            "CentroCosto": "Centro di costo",
+            "TipoVoce": "Tipo voce",
+            "MetodoPagamento": "Metodo di pagamento",
+        }
+        for col, colonna_st in zip(DIMENSIONI, st.columns(len(DIMENSIONI))):
+            with colonna_st:
+                filtro[col] = tuple(st.multiselect(etichette[col], indice.valori(col)))
+    return filtro
 
 
 def pagina_prima_nota():
@@ -47,6 +80,7 @@ def pagina_prima_nota():
     st.subheader("Prima nota (entrate da ricevute + uscite manuali)")
 
     _inizializza_prima_nota()
+    mostra_stato_sincronizzazione("prima_nota_asd_ssd.xlsx")
     df_pn = st.session_state.prima_nota
 
     tab_nuova_uscita, tab_elenco = st.tabs(["Nuova uscita", "Elenco prima nota"])
@@ -95,10 +129,11 @@ def pagina_prima_nota():
             if importo_uscita <= 0:
                 st.error("L'importo dell'uscita deve essere maggiore di zero.")
             else:
-                pdf_bytes = allegato.read() if allegato is not None else None
+                # nel DataFrame solo l'hash dell'allegato: il file resta su disco
+                hash_pdf = salva_pdf(allegato.read()) if allegato is not None else None
 
                 nuova_riga = {
-                    "Data": data_u.strftime("%d/%m/%Y"),
+                    "Data": pd.Timestamp(data_u),
                     "NumeroDocumento": numero_doc,
                     "Intestatario": intestatario,
                     "TipoVoce": "Uscita",
@@ -107,25 +142,21 @@ def pagina_prima_nota():
                     "Entrata": 0.0,
                     "Uscita": importo_uscita,
                     "MetodoPagamento": metodo_pagamento,
-                    "PDF": pdf_bytes,
+                    COLONNA_ID: nuovi_id()[0],
+                    "PDF": hash_pdf,
                 }
 
                 # aggiungo alla prima nota
-                st.session_state.prima_nota = pd.concat(
-                    [st.session_state.prima_nota, pd.DataFrame([nuova_riga])],
-                    ignore_index=True,
+                aggiungi_righe(
+                    "prima_nota",
+                    pd.DataFrame([nuova_riga]),
+                    list(st.session_state.prima_nota.columns),
                 )
 
-                # salvataggio su Drive (senza PDF)
-                try:
-                    df_drive = st.session_state.prima_nota.copy()
-                    if "PDF" in df_drive.columns:
-                        df_drive = df_drive.drop(columns=["PDF"])
-                    salva_df_su_drive(df_drive, "prima_nota_asd_ssd.xlsx")
-                    st.info("💾 Prima nota aggiornata e salvata su Google Drive.")
-                except Exception as e:
-                    st.error("❌ Errore nel salvataggio della prima nota su Google Drive.")
-                    st.code(repr(e))
+                # salvataggio su Drive in background (solo la nuova riga, senza PDF)
+                riga_drive = pd.DataFrame([nuova_riga]).drop(columns=["PDF"])
+                accoda_salvataggio(riga_drive, "prima_nota_asd_ssd.xlsx")
+                st.info("💾 Prima nota aggiornata, salvataggio su Google Drive avviato.")
 
                 st.success("Uscita registrata correttamente.")
 
@@ -133,70 +164,52 @@ def pagina_prima_nota():
     # TAB ELENCO PRIMA NOTA
     # ==========================
     with tab_elenco:
-        df_pn = st.session_state.prima_nota.copy()
+        df_pn = dataset("prima_nota")
 
         if df_pn.empty:
             st.info("La prima nota è vuota. Registra una ricevuta o una uscita.")
             return
 
-        # filtro entrate / uscite / tutte
-        filtro = st.radio(
-            "Filtra movimenti",
-            ["Tutti", "Solo entrate", "Solo uscite"],
-            horizontal=True,
+        indice = indice_prima_nota()
+        filtro = _filtri_prima_nota(indice)
+        posizioni = indice.filtra(filtro)
+
+        # elenco paginato, senza colonna PDF
+        idx_sel = griglia_paginata(
+            df_pn,
+            "elenco_prima_nota",
+            versione=versione_dataset("prima_nota"),
+            posizioni=posizioni,
+            nascoste=("PDF", COLONNA_ID),
         )
 
-        if filtro == "Solo entrate":
-            df_vis = df_pn[df_pn["Entrata"] > 0]
-        elif filtro == "Solo uscite":
-            df_vis = df_pn[df_pn["Uscita"] > 0]
-        else:
-            df_vis = df_pn
-
-        # mostriamo senza colonna PDF
-        if "PDF" in df_vis.columns:
-            df_mostra = df_vis.drop(columns=["PDF"])
-        else:
-            df_mostra = df_vis
-
-        st.dataframe(df_mostra)
-
-        # export excel
-        excel_bytes = df_to_excel_bytes(df_mostra, sheet_name="PrimaNota")
-        st.download_button(
-            label="Esporta prima nota in Excel",
-            data=excel_bytes,
-            file_name="prima_nota_asd_ssd.xlsx",
-            mime=(
-                "application/vnd.openxmlformats-officedocument."
-                "spreadsheetml.sheet"
-            ),
+        # export excel dei movimenti filtrati (su richiesta, in cache per versione + filtro)
+        bottone_export_excel(
+            "Esporta prima nota in Excel",
+            "prima_nota_asd_ssd.xlsx",
+            ("prima_nota", versione_dataset("prima_nota"), chiave_filtro(filtro)),
+            lambda: [("PrimaNota", df_pn.iloc[posizioni].drop(columns=["PDF"], errors="ignore"))],
         )
 
-        # selezione movimento per allegato PDF
+        # movimento selezionato nell'elenco: dettaglio e allegato PDF
         st.markdown("### Dettaglio movimento / Allegato")
 
-        idx_max = len(df_pn) - 1
-        idx_sel = st.number_input(
-            "Indice movimento (riga)",
-            min_value=0,
-            max_value=idx_max,
-            value=idx_max,
-            step=1,
-        )
+        if idx_sel is None:
+            st.info("Seleziona un movimento nell'elenco per vedere il dettaglio e l'allegato.")
+            return
 
-        riga = df_pn.iloc[int(idx_sel)]
+        riga = df_pn.iloc[idx_sel]
 
         st.write(
-            f"Movimento selezionato: **{riga['Data']} - {riga['NumeroDocumento']} - "
+            f"Movimento selezionato: **{formatta_data(riga['Data'])} - {riga['NumeroDocumento']} - "
             f"{riga['Causale']} - Entrata €{riga['Entrata']:.2f} / Uscita €{riga['Uscita']:.2f}**"
         )
 
-        pdf_bytes = riga.get("PDF", None)
+        pdf_bytes = leggi_pdf(riga.get("PDF", None))
 
         if pdf_bytes:
             st.markdown("#### Allegato PDF")
-            mostra_preview_pdf(pdf_bytes)
+            mostra_preview_pdf(pdf_bytes, chiave="allegato_prima_nota")
             st.download_button(
                 "Scarica PDF allegato",
                 data=pdf_bytes,
@@ -0,0 +1,41 @@
+import threading
+
+import pandas as pd
+
+from schema import concatena, normalizza_df
+
+# Registro di un dataset a cui si aggiungono righe (ricevute, prima nota, soci).
+# Le righe aggiunte restano in blocchi separati (costo proporzionale alle
+# righe nuove, niente copia del DataFrame completo a ogni inserimento);
+# il DataFrame completo si ricompone con un solo concat quando qualcuno lo
+# legge, e resta in cache fino all'aggiunta successiva.
+
+
+class Registro:
+    def __init__(self, nome: str, df: pd.DataFrame):
+        self.nome = nome
+        self._lock = threading.Lock()
+        self._consolidato = df
+        self._blocchi = []  # DataFrame normalizzati in attesa di consolidamento
+        self._righe = len(df)
+
+    def __len__(self):
+        return self._righe
+
+    def aggiungi(self, righe: pd.DataFrame) -> pd.DataFrame:
+        """Accoda righe (normalizzate con schema.py) e restituisce il blocco aggiunto."""
+        blocco = normalizza_df(self.nome, righe)
+        with self._lock:
+            self._blocchi.append(blocco)
+            self._righe += len(blocco)
+        return blocco
+
+    def df(self) -> pd.DataFrame:
+        """DataFrame completo (ricomposto solo se ci sono blocchi nuovi)."""
+        with self._lock:
+            if self._blocchi:
+                self._consolidato = concatena(
+                    self.nome, [self._consolidato] + self._blocchi
+                )
+                self._blocchi = []
+            return self._consolidato
@@ -1,56 +1,96 @@
 import streamlit as st
 import pandas as pd
-import io
 import os
+import weakref
 import zipfile
-import json
+import tempfile
 
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from archiviazione import get_backend
+from dataset_condivisi import versione_dataset, vista_dataset
+from schema import avviso_date_mancanti
+from esportazioni import bottone_export_excel, scrivi_excel
 
-from documenti import df_to_excel_bytes
 
-
-def upload_to_google_drive(file_bytes: bytes, filename: str):
+def upload_to_google_drive(percorso: str, filename: str, progresso=None):
     """
-    Upload su Google Drive usando service account.
-    Variabili ambiente richieste:
+    Upload del file percorso sul backend di archiviazione configurato
+    (Google Drive di default, vedi archiviazione.get_backend), a blocchi e
+    con ripresa automatica dopo errori di rete.
+    progresso (facoltativo) riceve la frazione caricata (0..1).
+    Variabili ambiente richieste per Drive:
     - GDRIVE_SERVICE_ACCOUNT_JSON : stringa JSON del service account
     - GDRIVE_FOLDER_ID : ID cartella di destinazione
     """
-    service_json = os.getenv("GDRIVE_SERVICE_ACCOUNT_JSON")
-    folder_id = os.getenv("GDRIVE_FOLDER_ID")
+    backend = get_backend()
+    err = backend.errore()
+    if err:
+        return False, err
+
+    try:
+        backend.salva_blob_da_file(filename, percorso, "application/zip", progresso)
+        return True, "Backup caricato su Google Drive."
+    except Exception as e:
+        return False, f"Errore upload Google Drive: {e}"
+
+
+def scrivi_zip_backup(percorso: str, df_ricevute: pd.DataFrame, df_pn: pd.DataFrame):
+    """
+    Scrive il backup ZIP (ricevute + prima nota) nel file percorso.
+    Ogni xlsx va direttamente nella sua voce dello ZIP: nessun file intero in memoria.
+    """
+    with zipfile.ZipFile(percorso, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("ricevute_asd_ssd.xlsx", "w") as fh:
+            scrivi_excel(fh, [("Ricevute", df_ricevute)])
+        with zf.open("prima_nota_asd_ssd.xlsx", "w") as fh:
+            scrivi_excel(fh, [("PrimaNota", df_pn)])
 
-    if not service_json or not folder_id:
-        return False, "Google Drive non configurato (mancano variabili ambiente)."
 
+def _rimuovi_file(percorso: str):
     try:
-        info = json.loads(service_json)
-        creds = service_account.Credentials.from_service_account_info(
-            info,
-            scopes=["https://www.googleapis.com/auth/drive.file"],
-        )
+        os.remove(percorso)
+    except FileNotFoundError:
+        pass
 
-        service = build("drive", "v3", credentials=creds)
 
-        media = io.BytesIO(file_bytes)
-        media_up = MediaIoBaseUpload(media, mimetype="application/zip")
+class _FileBackup:
+    """
+    Backup ZIP temporaneo di una sessione: il file viene eliminato quando è
+    sostituito (elimina) o quando la sessione termina e l'oggetto viene
+    raccolto dal garbage collector (al più tardi all'uscita del processo).
+    """
 
-        file_metadata = {
-            "name": filename,
-            "parents": [folder_id],
-        }
+    def __init__(self, chiave, percorso: str):
+        self.chiave = chiave
+        self.percorso = percorso
+        self._finalizza = weakref.finalize(self, _rimuovi_file, percorso)
 
-        service.files().create(
-            body=file_metadata,
-            media_body=media_up,
-            fields="id",
-        ).execute()
+    def elimina(self):
+        self._finalizza()
 
-        return True, "Backup caricato su Google Drive."
-    except Exception as e:
-        return False, f"Errore upload Google Drive: {e}"
+
+def _backup_pronto(chiave):
+    """Percorso del backup ZIP della sessione se è ancora aggiornato, altrimenti None."""
+    backup = st.session_state.get("backup_zip")
+    if backup and backup.chiave == chiave and os.path.exists(backup.percorso):
+        return backup.percorso
+    return None
+
+
+def _prepara_backup(chiave, df_ricevute: pd.DataFrame, df_pn: pd.DataFrame) -> str:
+    """Scrive il backup ZIP su un file temporaneo (sostituisce quello precedente della sessione)."""
+    fd, percorso_zip = tempfile.mkstemp(suffix=".zip")
+    os.close(fd)
+    try:
+        scrivi_zip_backup(percorso_zip, df_ricevute, df_pn)
+    except Exception:
+        os.remove(percorso_zip)
+        raise
+
+    vecchio = st.session_state.get("backup_zip")
+    if vecchio is not None:
+        vecchio.elimina()
+    st.session_state.backup_zip = _FileBackup(chiave, percorso_zip)
+    return percorso_zip
 
 
 def pagina_report_backup():
@@ -60,55 +100,45 @@ def pagina_report_backup():
         st.info("Non ci sono dati in prima nota. Genera prima qualche ricevuta.")
         return
 
-    # Preparazione dati
-    df = st.session_state.prima_nota.copy()
-    df["Data_dt"] = pd.to_datetime(df["Data"], format="%d/%m/%Y", errors="coerce")
-    df["Anno"] = df["Data_dt"].dt.year
+    # Riepiloghi dal cubo di aggregati (aggiornato a ogni nuovo movimento)
+    cubo = vista_dataset("prima_nota")
+    avviso_date_mancanti(cubo.righe_senza_data())
 
-    anni = sorted(df["Anno"].dropna().unique().tolist())
+    anni = cubo.anni()
     if not anni:
         st.info("Non risultano anni validi in prima nota.")
         return
 
     anno_scelto = st.selectbox("Anno di riferimento per il report", anni)
 
-    df_anno = df[df["Anno"] == anno_scelto].copy()
+    def _dettaglio_anno():
+        # solo per l'export: filtra la prima nota quando il file viene preparato
+        df = st.session_state.prima_nota
+        df_anno = df[df["Data"].dt.year == anno_scelto]
+        return df_anno.drop(columns=["PDF"]) if "PDF" in df_anno.columns else df_anno
 
     st.markdown(f"### Report {anno_scelto}")
 
     # Riepilogo per Tipologia
     st.markdown("#### Entrate per tipologia importo")
-    per_tipo = (
-        df_anno.groupby("TipoVoce")["Entrata"]
-        .sum()
-        .reset_index()
-        .sort_values("Entrata", ascending=False)
-    )
+    per_tipo = cubo.totali_per("TipoVoce", anno=anno_scelto)
     st.dataframe(per_tipo)
 
     # Riepilogo per Centro di costo
     st.markdown("#### Entrate per attività / centro di costo")
-    per_centro = (
-        df_anno.groupby("CentroCosto")["Entrata"]
-        .sum()
-        .reset_index()
-        .sort_values("Entrata", ascending=False)
-    )
+    per_centro = cubo.totali_per("CentroCosto", anno=anno_scelto)
     st.dataframe(per_centro)
 
-    # Export Excel report annuale
-    buffer_report = io.BytesIO()
-    with pd.ExcelWriter(buffer_report, engine="xlsxwriter") as writer:
-        per_tipo.to_excel(writer, index=False, sheet_name="Per_Tipologia")
-        per_centro.to_excel(writer, index=False, sheet_name="Per_CentroCosto")
-        df_anno.to_excel(writer, index=False, sheet_name="Dettaglio_PrimaNota")
-    buffer_report.seek(0)
-
-    st.download_button(
-        label="⬇️ Scarica report annuale (Excel)",
-        data=buffer_report.read(),
-        file_name=f"report_asd_ssd_{anno_scelto}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    # Export Excel report annuale (preparato su richiesta, in cache per versione + anno)
+    bottone_export_excel(
+        "⬇️ Scarica report annuale (Excel)",
+        f"report_asd_ssd_{anno_scelto}.xlsx",
+        ("report", versione_dataset("prima_nota"), anno_scelto),
+        lambda: [
+            ("Per_Tipologia", per_tipo),
+            ("Per_CentroCosto", per_centro),
+            ("Dettaglio_PrimaNota", _dettaglio_anno()),
+        ],
     )
 
     st.markdown("---")
@@ -117,37 +147,44 @@ def pagina_report_backup():
     if "ricevute_emesse" not in st.session_state:
         st.session_state.ricevute_emesse = pd.DataFrame()
 
-    df_ricevute = st.session_state.ricevute_emesse.copy()
+    # nessuna copia: i DataFrame condivisi non vengono modificati e la
+    # colonna PDF contiene solo gli hash (i file sono in blob_pdf)
+    df_ricevute = st.session_state.ricevute_emesse
     if not df_ricevute.empty and "PDF" in df_ricevute.columns:
         df_ricevute = df_ricevute.drop(columns=["PDF"])
 
-    df_pn = st.session_state.prima_nota.copy()
-
-    # Crea ZIP (ricevute + prima nota) sempre pronto per il download
-    excel_ricevute = df_to_excel_bytes(df_ricevute, sheet_name="Ricevute")
-    excel_pn = df_to_excel_bytes(df_pn, sheet_name="PrimaNota")
-
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr("ricevute_asd_ssd.xlsx", excel_ricevute)
-        zf.writestr("prima_nota_asd_ssd.xlsx", excel_pn)
-    zip_buffer.seek(0)
-    zip_bytes = zip_buffer.getvalue()
-
-    st.download_button(
-        label="⬇️ Scarica backup ZIP (ricevute + prima nota)",
-        data=zip_bytes,
-        file_name="backup_asd_ssd.zip",
-        mime="application/zip",
-    )
+    df_pn = st.session_state.prima_nota
+
+    # ZIP (ricevute + prima nota) creato su file temporaneo solo su richiesta,
+    # e riusato finché i dati non cambiano
+    chiave = (versione_dataset("ricevute_emesse"), versione_dataset("prima_nota"))
+    percorso_zip = _backup_pronto(chiave)
+    if percorso_zip is None:
+        if not st.button("Prepara backup ZIP (ricevute + prima nota)"):
+            return
+        with st.spinner("Preparazione backup..."):
+            percorso_zip = _prepara_backup(chiave, df_ricevute, df_pn)
+
+    with open(percorso_zip, "rb") as f:
+        st.download_button(
+            label="⬇️ Scarica backup ZIP (ricevute + prima nota)",
+            data=f,
+            file_name="backup_asd_ssd.zip",
+            mime="application/zip",
+        )
 
     st.markdown("#### Upload opzionale su Google Drive")
     do_drive = st.checkbox("Carica il backup ZIP su Google Drive (se configurato)")
     if do_drive and st.button("📤 Carica su Google Drive"):
-        ok, msg = upload_to_google_drive(zip_bytes, "backup_asd_ssd.zip")
+        barra = st.progress(0.0, text="Caricamento backup...")
+        ok, msg = upload_to_google_drive(
+            percorso_zip,
+            "backup_asd_ssd.zip",
+            progresso=lambda p: barra.progress(
+                min(p, 1.0), text=f"Caricamento backup... {p:.0%}"
+            ),
+        )
         if ok:
             st.success(msg)
         else:
             st.error(msg)
-
-
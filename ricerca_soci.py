@@ -0,0 +1,110 @@
+import re
+import bisect
+import unicodedata
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from cache_memoria import CacheLRU
+from dataset_condivisi import dataset, versione_dataset
+
+# Indice di ricerca dei soci attivi (Nome, Cognome, CF) per il selettore delle
+# ricevute: costruito una volta per versione del dataset soci e condiviso tra
+# le sessioni (la chiave è versione_dataset, uguale per tutte le sessioni). Ricerca per prefisso delle parole; se non trova nulla, per
+# somiglianza di trigrammi (errori di battitura).
+TOP_K = 50
+
+# max 8 indici in memoria (versioni recenti × colonna del CF)
+_cache_indici = CacheLRU(8, dimensione=lambda _: 1)
+
+
+def _normalizza(testo: str) -> str:
+    """Minuscolo, senza accenti e punteggiatura."""
+    testo = unicodedata.normalize("NFKD", str(testo))
+    testo = testo.encode("ascii", "ignore").decode("ascii").lower()
+    return re.sub(r"[^a-z0-9]+", " ", testo).strip()
+
+
+def _trigrammi(testo: str) -> set:
+    trigrammi = set()
+    for parola in testo.split():
+        parola = f" {parola} "
+        trigrammi.update(parola[i : i + 3] for i in range(len(parola) - 2))
+    return trigrammi
+
+
+class IndiceSoci:
+    def __init__(self, soci: pd.DataFrame, cf_col=None):
+        n = len(soci)
+
+        def _colonna(col):
+            if not col or col not in soci.columns:
+                return [""] * n
+            return soci[col].fillna("").astype(str).str.strip().tolist()
+
+        nomi, cognomi, cf = _colonna("Nome"), _colonna("Cognome"), _colonna(cf_col)
+        if "Attivo" in soci.columns:
+            attivi = (soci["Attivo"] == True).tolist()
+        else:
+            attivi = [True] * n
+
+        # posizioni (iloc) dei soci attivi, nell'ordine del dataset
+        self.posizioni = [i for i in range(n) if attivi[i]]
+        self.etichette = {}
+        parole = []  # (parola, posizione), ordinate per la ricerca per prefisso
+        self._trigrammi = defaultdict(set)
+        for i in self.posizioni:
+            etichetta = f"{nomi[i]} {cognomi[i]}".strip()
+            if cf[i]:
+                etichetta += f" (CF: {cf[i]})"
+            self.etichette[i] = etichetta
+
+            testo = _normalizza(f"{nomi[i]} {cognomi[i]} {cf[i]}")
+            parole.extend((p, i) for p in set(testo.split()))
+            for g in _trigrammi(testo):
+                self._trigrammi[g].add(i)
+
+        parole.sort()
+        self._parole = [p for p, _ in parole]
+        self._pos_parole = [i for _, i in parole]
+
+    def _con_prefisso(self, prefisso: str) -> set:
+        trovati = set()
+        j = bisect.bisect_left(self._parole, prefisso)
+        while j < len(self._parole) and self._parole[j].startswith(prefisso):
+            trovati.add(self._pos_parole[j])
+            j += 1
+        return trovati
+
+    def cerca(self, testo: str, k: int = TOP_K) -> list:
+        """Posizioni (iloc) dei primi k soci attivi che corrispondono a testo."""
+        query = _normalizza(testo or "")
+        if not query:
+            return self.posizioni[:k]
+
+        # ogni parola cercata deve essere l'inizio di una parola del socio
+        risultato = None
+        for parola in query.split():
+            trovati = self._con_prefisso(parola)
+            risultato = trovati if risultato is None else risultato & trovati
+            if not risultato:
+                break
+        if risultato:
+            return sorted(risultato)[:k]
+
+        # nessuna corrispondenza esatta: soci con più trigrammi in comune
+        punteggi = Counter()
+        for g in _trigrammi(query):
+            for i in self._trigrammi.get(g, ()):
+                punteggi[i] += 1
+        return [i for i, _ in punteggi.most_common(k)]
+
+
+def indice_soci(cf_col=None) -> IndiceSoci:
+    """Indice dei soci della sessione, ricostruito solo quando soci cambia."""
+    # prima la versione (porta la sessione all'ultima), poi il DataFrame a cui si riferisce
+    versione = versione_dataset("soci")
+    soci = dataset("soci")
+    if soci is None:
+        soci = pd.DataFrame()
+    return _cache_indici.ottieni((versione, cf_col), lambda: IndiceSoci(soci, cf_col))
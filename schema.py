@@ -0,0 +1,256 @@
+import uuid
+import warnings
+
+import pandas as pd
+import streamlit as st
+
+# Schema dei dataset del gestionale, applicato una volta sola quando i dati
+# entrano nell'archivio condiviso (caricamento da Drive, nuove righe):
+# - nomi di colonna canonici (es. "Codice fiscale" -> "CF")
+# - tipi compatti: categorie per le colonne con pochi valori distinti,
+#   float per gli importi, bool per Attivo, datetime64 per le date,
+#   testo senza NaN per il resto.
+# Le date si convertono in testo (FORMATO_DATA) solo per mostrarle, per gli
+# export e per i file su Drive (date_in_testo).
+# Le colonne non previste (es. PDF) restano come sono.
+TESTO = "testo"
+CATEGORIA = "categoria"
+NUMERO = "numero"
+BOOLEANO = "booleano"
+DATA = "data"
+
+FORMATO_DATA = "%d/%m/%Y"
+
+# Identità di ogni riga (UUID assegnato all'inserimento, salvato su Drive e
+# nel journal): è la chiave con cui si uniscono le versioni dei file.
+COLONNA_ID = "IdRiga"
+
+SCHEMI = {
+    "ricevute_emesse": {
+        "Numero": TESTO,
+        "Data": DATA,
+        "Intestatario": TESTO,
+        "CF": TESTO,
+        "TipoVoce": CATEGORIA,
+        "CentroCosto": CATEGORIA,
+        "Causale": TESTO,
+        "Importo": NUMERO,
+        "MetodoPagamento": CATEGORIA,
+        "Note": TESTO,
+        COLONNA_ID: TESTO,
+    },
+    "prima_nota": {
+        "Data": DATA,
+        "NumeroDocumento": TESTO,
+        "Intestatario": TESTO,
+        "TipoVoce": CATEGORIA,
+        "CentroCosto": CATEGORIA,
+        "Causale": TESTO,
+        "Entrata": NUMERO,
+        "Uscita": NUMERO,
+        "MetodoPagamento": CATEGORIA,
+        COLONNA_ID: TESTO,
+    },
+    "soci": {
+        "Nome": TESTO,
+        "Cognome": TESTO,
+        "CF": TESTO,
+        "Email": TESTO,
+        "Telefono": TESTO,
+        "DataIscrizione": DATA,
+        "CertificatoScadenza": DATA,
+        "AttivitaPrincipale": TESTO,
+        "Note": TESTO,
+        "Attivo": BOOLEANO,
+        COLONNA_ID: TESTO,
+    },
+}
+
+COLONNE_RICEVUTE = list(SCHEMI["ricevute_emesse"]) + ["PDF"]
+COLONNE_PRIMA_NOTA = list(SCHEMI["prima_nota"])
+COLONNE_SOCI = list(SCHEMI["soci"])
+
+# Nomi usati da versioni precedenti / file compilati a mano
+ALIAS_COLONNE = {
+    "soci": {
+        "Codice fiscale": "CF",
+        "Codice Fiscale": "CF",
+        "Attività principale (es. Calcio U10)": "AttivitaPrincipale",
+        "Attività principale": "AttivitaPrincipale",
+    },
+}
+
+# Valore per le colonne mancanti (se diverso dal default del tipo)
+PREDEFINITI = {
+    # senza colonna Attivo tutti i soci erano considerati attivi
+    "Attivo": True,
+}
+
+_VERO = {"true", "vero", "si", "sì", "s", "yes", "y", "1", "x"}
+
+
+def _a_testo(serie: pd.Series) -> pd.Series:
+    def _valore(v):
+        if v is None or (not isinstance(v, str) and pd.isna(v)):
+            return ""
+        if isinstance(v, float) and v.is_integer():
+            # es. numeri ricevuta letti da Excel come 12.0
+            return str(int(v))
+        return str(v)
+
+    if serie.dtype == object and serie.map(lambda v: isinstance(v, str)).all():
+        return serie
+    return serie.map(_valore).astype(object)
+
+
+def _a_booleano(serie: pd.Series, predefinito: bool = False) -> pd.Series:
+    if serie.dtype == bool:
+        return serie
+
+    def _valore(v):
+        if v is None or (not isinstance(v, str) and pd.isna(v)):
+            return predefinito
+        if isinstance(v, str):
+            return v.strip().lower() in _VERO
+        return bool(v)
+
+    return serie.map(_valore).astype(bool)
+
+
+def _a_data(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        if getattr(serie.dt, "tz", None) is not None:
+            serie = serie.dt.tz_localize(None)
+        return serie.astype("datetime64[ns]")
+
+    date = pd.to_datetime(serie, format=FORMATO_DATA, errors="coerce")
+    # altri formati: ISO (journal, csv), date/Timestamp (Excel, parquet)
+    vuote = serie.isna() | (serie.astype(str).str.strip() == "")
+    altre = date.isna() & ~vuote
+    if altre.any():
+        testo = serie[altre].astype(str).str.strip()
+        # prima ISO (anno-mese-giorno): dayfirst invertirebbe giorno e mese
+        date[altre] = pd.to_datetime(testo, format="ISO8601", errors="coerce")
+        restanti = date.isna() & ~vuote
+        if restanti.any():
+            date[restanti] = pd.to_datetime(
+                testo[restanti[altre]], format="mixed", dayfirst=True, errors="coerce"
+            )
+        non_valide = int((date.isna() & ~vuote).sum())
+        if non_valide:
+            warnings.warn(f"{serie.name}: {non_valide} date non riconosciute (lasciate vuote)")
+    return date.astype("datetime64[ns]")
+
+
+def _converti(serie: pd.Series, tipo: str, predefinito=None) -> pd.Series:
+    if tipo == NUMERO:
+        if serie.dtype == "float64":
+            return serie.fillna(0.0)
+        return pd.to_numeric(serie, errors="coerce").fillna(0.0).astype("float64")
+    if tipo == BOOLEANO:
+        return _a_booleano(serie, bool(predefinito))
+    if tipo == DATA:
+        return _a_data(serie)
+    if tipo == CATEGORIA:
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            return serie
+        return _a_testo(serie).astype("category")
+    return _a_testo(serie)
+
+
+def _rinomina(nome: str, df: pd.DataFrame) -> pd.DataFrame:
+    alias = ALIAS_COLONNE.get(nome, {})
+    rinomina = {}
+    for col in df.columns:
+        canonico = alias.get(col)
+        if canonico is None and nome == "soci" and str(col).startswith("Attività principale"):
+            canonico = "AttivitaPrincipale"
+        if canonico and canonico not in df.columns and canonico not in rinomina.values():
+            rinomina[col] = canonico
+    return df.rename(columns=rinomina) if rinomina else df
+
+
+def normalizza_df(nome: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Nuovo DataFrame con colonne canoniche e tipi dello schema di nome
+    (df non viene modificato). Dataset senza schema: df invariato.
+    """
+    schema = SCHEMI.get(nome)
+    if schema is None or df is None:
+        return df
+
+    df = _rinomina(nome, df)
+    colonne = {}
+    for col, tipo in schema.items():
+        if col in df.columns:
+            colonne[col] = _converti(df[col], tipo, PREDEFINITI.get(col))
+        else:
+            vuota = pd.Series([PREDEFINITI.get(col)] * len(df), index=df.index, dtype=object)
+            colonne[col] = _converti(vuota, tipo, PREDEFINITI.get(col))
+    altre = [c for c in df.columns if c not in schema]
+    return pd.DataFrame({**colonne, **{c: df[c] for c in altre}}, index=df.index)
+
+
+def nuovi_id(n: int = 1) -> list:
+    """n identificativi di riga nuovi (UUID4 esadecimali)."""
+    return [uuid.uuid4().hex for _ in range(n)]
+
+
+def df_vuoto(nome: str, colonne_extra=()) -> pd.DataFrame:
+    """DataFrame vuoto con le colonne e i tipi dello schema."""
+    return normalizza_df(nome, pd.DataFrame(columns=list(SCHEMI[nome]) + list(colonne_extra)))
+
+
+def concatena(nome: str, blocchi: list) -> pd.DataFrame:
+    """
+    Un solo pd.concat dei blocchi (già normalizzati) senza perdere i tipi:
+    le colonne categoriche ricevono prima l'unione delle categorie di tutti
+    i blocchi (altrimenti pd.concat tornerebbe a object).
+    """
+    blocchi = [b for b in blocchi if b is not None]
+    for col, tipo in SCHEMI.get(nome, {}).items():
+        if tipo != CATEGORIA or not all(col in b.columns for b in blocchi):
+            continue
+        serie = [
+            b[col] if isinstance(b[col].dtype, pd.CategoricalDtype) else b[col].astype("category")
+            for b in blocchi
+        ]
+        categorie = serie[0].cat.categories
+        for x in serie[1:]:
+            categorie = categorie.union(x.cat.categories)
+        blocchi = [
+            b.assign(**{col: x.cat.set_categories(categorie)}) for b, x in zip(blocchi, serie)
+        ]
+    return pd.concat(blocchi, ignore_index=True)
+
+
+def date_in_testo(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia di df con le colonne datetime in testo FORMATO_DATA (NaT -> "")."""
+    date = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+    if not date:
+        return df
+    return df.assign(**{c: df[c].dt.strftime(FORMATO_DATA).fillna("") for c in date})
+
+
+def formatta_data(valore) -> str:
+    """Data (Timestamp / date / testo) in FORMATO_DATA, "" se mancante."""
+    if valore is None or (not isinstance(valore, str) and pd.isna(valore)):
+        return ""
+    if isinstance(valore, str):
+        return valore
+    return valore.strftime(FORMATO_DATA)
+
+
+def config_colonne_data(df: pd.DataFrame) -> dict:
+    """column_config di st.dataframe per mostrare le date in gg/mm/aaaa."""
+    return {
+        c: st.column_config.DateColumn(format="DD/MM/YYYY")
+        for c in df.columns
+        if pd.api.types.is_datetime64_any_dtype(df[c])
+    }
+
+
+def avviso_date_mancanti(mancanti: int):
+    """Segnala i movimenti senza data valida (esclusi da grafici e report per periodo)."""
+    if mancanti:
+        st.warning(f"{mancanti} movimenti senza data valida: esclusi dai riepiloghi per periodo.")
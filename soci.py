@@ -2,27 +2,19 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
-from drive_utils import salva_df_su_drive
-
-COLONNE_SOCI = [
-    "Nome",
-    "Cognome",
-    "CF",
-    "Email",
-    "Telefono",
-    "DataIscrizione",
-    "CertificatoScadenza",
-    "AttivitaPrincipale",
-    "Note",
-    "Attivo",
-]
+from persistenza import accoda_salvataggio, mostra_stato_sincronizzazione
+from dataset_condivisi import aggiungi_righe, dataset, versione_dataset
+from griglia import griglia_paginata
+from schema import COLONNA_ID, COLONNE_SOCI, df_vuoto, nuovi_id
 
 
 def pagina_soci():
     st.subheader("Soci / Iscritti")
 
     if "soci" not in st.session_state:
-        st.session_state.soci = pd.DataFrame(columns=COLONNE_SOCI)
+        st.session_state.soci = df_vuoto("soci")
+
+    mostra_stato_sincronizzazione("soci_asd_ssd.xlsx")
 
     tab_nuovo, tab_elenco = st.tabs(["Nuovo socio / iscritto", "Elenco soci"])
 
@@ -54,25 +46,20 @@ def pagina_soci():
                     "CF": cf,
                     "Email": email,
                     "Telefono": tel,
-                    "DataIscrizione": data_iscr.strftime("%d/%m/%Y"),
-                    "CertificatoScadenza": cert_scad.strftime("%d/%m/%Y"),
+                    "DataIscrizione": pd.Timestamp(data_iscr),
+                    "CertificatoScadenza": pd.Timestamp(cert_scad),
                     "AttivitaPrincipale": attivita_princ,
                     "Note": note,
                     "Attivo": attivo,
+                    COLONNA_ID: nuovi_id()[0],
                 }
-                st.session_state.soci = pd.concat(
-                    [st.session_state.soci, pd.DataFrame([nuova_riga])],
-                    ignore_index=True,
-                )
+                aggiungi_righe("soci", pd.DataFrame([nuova_riga]), COLONNE_SOCI)
 
-                # Salvataggio automatico elenco soci su Google Drive
-                try:
-                    salva_df_su_drive(
-                        st.session_state.soci,
-                        "soci_asd_ssd.xlsx",
-                    )
-                except Exception:
-                    pass
+                # Salvataggio automatico elenco soci su Google Drive (in background)
+                accoda_salvataggio(
+                    pd.DataFrame([nuova_riga]),
+                    "soci_asd_ssd.xlsx",
+                )
 
                 st.success("Socio salvato correttamente.")
 
@@ -80,10 +67,16 @@ def pagina_soci():
     # ELENCO SOCI
     # ==========================
     with tab_elenco:
-        df = st.session_state.soci.copy()
+        df = dataset("soci")
         if df.empty:
             st.info("Nessun socio inserito.")
             return
 
-        st.dataframe(df)
+        griglia_paginata(
+            df,
+            "elenco_soci",
+            versione=versione_dataset("soci"),
+            nascoste=(COLONNA_ID,),
+            selezione=False,
+        )
 
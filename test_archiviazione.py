@@ -0,0 +1,13 @@
+import os
+
+from archiviazione import BackendLocale
+
+
+def test_elenca_solo_i_file_della_cartella(tmp_path):
+    backend = BackendLocale(str(tmp_path))
+    # archivio dei PDF (blob_pdf.py) dentro ASD_DATI_DIR
+    os.makedirs(tmp_path / "pdf" / "ab")
+    backend.salva("prima_nota_asd_ssd.parquet", b"dati", "application/vnd.apache.parquet")
+
+    assert [m["name"] for m in backend.elenca()] == ["prima_nota_asd_ssd.parquet"]
+    assert backend.elenca("pdf") == []
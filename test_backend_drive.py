@@ -0,0 +1,64 @@
+import pytest
+
+import backend_drive
+from archiviazione import ConflittoVersione
+from backend_drive import BackendDrive
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    """Drive simulato: metadati letti prima della scrittura e revisioni dopo."""
+    stato = {
+        "letta": {"id": "f", "version": "7", "md5Checksum": "a", "headRevisionId": "r1"},
+        "sostituita": {"id": "r1", "md5Checksum": "a"},
+        "scaricate": [],
+    }
+    monkeypatch.setattr(backend_drive, "_get_drive_service", lambda: ("service", "cartella", None))
+    monkeypatch.setattr(backend_drive, "_metadati", lambda *a, **k: stato["letta"])
+    monkeypatch.setattr(
+        backend_drive,
+        "_carica_bytes_su_drive",
+        lambda *a: {"id": "f", "version": "12", "md5Checksum": "b"},
+    )
+    monkeypatch.setattr(backend_drive, "_revisione_precedente", lambda *a: stato["sostituita"])
+
+    def _scarica_revisione(service, file_id, revision_id):
+        stato["scaricate"].append(revision_id)
+        return b"altro contenuto"
+
+    monkeypatch.setattr(backend_drive, "_scarica_revisione", _scarica_revisione)
+    return stato
+
+
+def test_versione_cresciuta_per_i_metadati_non_e_un_conflitto(drive):
+    # la versione salta da 7 a 12 (permessi, metadati) ma la revisione sostituita è quella letta
+    meta = BackendDrive().salva("dati.parquet", b"x", "application/octet-stream", se_versione="7")
+
+    assert meta["version"] == "12"
+    assert drive["scaricate"] == []
+
+
+def test_stesso_contenuto_in_altra_revisione_non_e_un_conflitto(drive):
+    drive["sostituita"] = {"id": "r2", "md5Checksum": "a"}
+
+    BackendDrive().salva("dati.parquet", b"x", "application/octet-stream", se_versione="7")
+
+    assert drive["scaricate"] == []
+
+
+def test_revisione_di_un_altro_processo_sostituita(drive):
+    drive["sostituita"] = {"id": "r2", "md5Checksum": "c"}
+
+    with pytest.raises(ConflittoVersione) as e:
+        BackendDrive().salva("dati.parquet", b"x", "application/octet-stream", se_versione="7")
+
+    assert e.value.sovrascritto == b"altro contenuto"
+    assert e.value.nuova["version"] == "12"
+    assert drive["scaricate"] == ["r2"]
+
+
+def test_versione_cambiata_prima_della_scrittura(drive):
+    with pytest.raises(ConflittoVersione) as e:
+        BackendDrive().salva("dati.parquet", b"x", "application/octet-stream", se_versione="6")
+
+    assert e.value.nuova is None
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+import dataset_condivisi
+from dataset_condivisi import ArchivioDataset, versione_dataset
+
+
+@pytest.fixture
+def archivio(monkeypatch):
+    archivio = ArchivioDataset()
+    monkeypatch.setattr(dataset_condivisi, "_archivio", archivio)
+    return archivio
+
+
+def _in_sessione(monkeypatch, sessione: dict):
+    monkeypatch.setattr(dataset_condivisi.st, "session_state", sessione)
+
+
+def test_stessa_versione_stessa_chiave_in_ogni_sessione(monkeypatch, archivio):
+    archivio.pubblica("soci", pd.DataFrame({"Nome": ["Anna"]}))
+    prima, seconda = {}, {}
+
+    _in_sessione(monkeypatch, prima)
+    chiave = versione_dataset("soci")
+    assert versione_dataset("soci") == chiave
+    _in_sessione(monkeypatch, seconda)
+    assert versione_dataset("soci") == chiave
+
+    archivio.aggiungi_righe("soci", pd.DataFrame({"Nome": ["Luca"]}))
+    nuova = versione_dataset("soci")
+    assert nuova != chiave
+    _in_sessione(monkeypatch, prima)
+    assert versione_dataset("soci") == nuova
+
+
+def test_dataset_solo_in_sessione(monkeypatch, archivio):
+    sessione = {"soci": pd.DataFrame({"Nome": ["Anna"]})}
+    _in_sessione(monkeypatch, sessione)
+
+    chiave = versione_dataset("soci")
+    assert versione_dataset("soci") == chiave
+    sessione["soci"] = pd.DataFrame({"Nome": ["Luca"]})
+    assert versione_dataset("soci") != chiave
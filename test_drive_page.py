@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
 
-from drive_utils import carica_dati_iniziali_da_drive, salva_df_su_drive
+from drive_utils import verifica_lettura_da_drive, salva_df_su_drive
+from formati import formato_dataset, nome_file
 
 
 def pagina_test_drive():
@@ -15,13 +16,19 @@ def pagina_test_drive():
     st.subheader("Test lettura da Drive")
     if st.button("Esegui test di LETTURA"):
         try:
-            # Usa la stessa funzione che usi all'avvio dell'app
-            carica_dati_iniziali_da_drive()
+            # Stessa lettura dell'avvio dell'app, senza sostituire i dati in uso
+            verifica_lettura_da_drive()
             st.success(
                 "✅ Lettura da Google Drive eseguita senza errori.\n\n"
                 "Se non vedi file elencati nel gestionale è possibile che la cartella sia ancora vuota, "
                 "ma la connessione funziona."
             )
+            for filename, err in st.session_state.get("errori_caricamento_drive", {}).items():
+                st.warning(f"{filename}: {err}")
+            tempi = st.session_state.get("tempi_caricamento_drive")
+            if tempi:
+                st.caption("Tempi di caricamento (secondi)")
+                st.json(tempi)
         except Exception as e:
             st.error("❌ Errore durante la LETTURA da Google Drive")
             st.code(repr(e))
@@ -44,10 +51,13 @@ def pagina_test_drive():
             # Salviamo un file di prova nella cartella Drive
             salva_df_su_drive(df_test, "test_drive_asd_ssd.xlsx")
 
+            nome_su_drive = nome_file(
+                "test_drive_asd_ssd.xlsx", formato_dataset("test_drive_asd_ssd.xlsx")
+            )
             st.success(
                 "✅ Scrittura su Google Drive riuscita.\n\n"
                 "Controlla nella cartella Drive del gestionale se è comparso "
-                "il file **test_drive_asd_ssd.xlsx**."
+                f"il file **{nome_su_drive}**."
             )
         except Exception as e:
             st.error("❌ Errore durante la SCRITTURA su Google Drive")
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+import cache_locale
+import drive_utils
+from archiviazione import BackendLocale
+from formati import CSV_GZ, PARQUET, PARQUET_DISPONIBILE, deserializza_df, serializza_df
+from schema import COLONNA_ID, normalizza_df, nuovi_id
+
+FORMATI = [CSV_GZ] + ([PARQUET] if PARQUET_DISPONIBILE else [])
+
+
+def _prima_nota():
+    # DataFrame come quelli in sessione: colonne categoriche, date, IdRiga
+    righe = pd.DataFrame(
+        [
+            {"Data": "01/03/2024", "CentroCosto": "Calcio", "Causale": "Quota", "Entrata": 50},
+            {"Data": "", "TipoVoce": "Affitto", "Causale": "Campo", "Uscita": 300},
+        ]
+    )
+    return normalizza_df("prima_nota", righe.assign(**{COLONNA_ID: nuovi_id(2)}))
+
+
+@pytest.mark.parametrize("formato", FORMATI)
+def test_andata_e_ritorno_con_colonne_categoriche(formato):
+    df = _prima_nota()
+
+    letto = normalizza_df("prima_nota", deserializza_df(serializza_df(df, formato), formato))
+
+    pd.testing.assert_frame_equal(letto, df)
+
+
+def test_salvataggio_completo_di_un_dataset_normalizzato(monkeypatch, tmp_path):
+    backend = BackendLocale(str(tmp_path / "dati"))
+    monkeypatch.setattr(drive_utils, "get_backend", lambda: backend)
+    monkeypatch.setattr(drive_utils, "_versioni_note", {})
+    monkeypatch.setattr(cache_locale, "CACHE_DIR", str(tmp_path / "cache"))
+    df = _prima_nota()
+
+    ok, _ = drive_utils.salva_df_su_drive(df, "prima_nota_asd_ssd.xlsx")
+    letto, errore = drive_utils.carica_df_da_drive("prima_nota_asd_ssd.xlsx")
+
+    assert ok and errore is None
+    pd.testing.assert_frame_equal(normalizza_df("prima_nota", letto), df)
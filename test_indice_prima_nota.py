@@ -0,0 +1,132 @@
+import datetime
+
+import pandas as pd
+
+from indice_prima_nota import IndicePrimaNota
+
+
+def _prima_nota():
+    return pd.DataFrame(
+        [
+            # 0
+            {
+                "Data": pd.Timestamp(2024, 3, 1, 9, 30),
+                "NumeroDocumento": "R-1",
+                "Intestatario": "Rossi Mario",
+                "TipoVoce": "Quota",
+                "CentroCosto": "Calcio",
+                "Causale": "Quota associativa",
+                "Entrata": 50.0,
+                "Uscita": 0.0,
+                "MetodoPagamento": "Contanti",
+            },
+            # 1: ultimo minuto del 31/03
+            {
+                "Data": pd.Timestamp(2024, 3, 31, 23, 59),
+                "NumeroDocumento": "R-2",
+                "Intestatario": "Bianchi Anna",
+                "TipoVoce": "Quota",
+                "CentroCosto": "Nuoto",
+                "Causale": "Quota corso nuoto",
+                "Entrata": 120.0,
+                "Uscita": 0.0,
+                "MetodoPagamento": "Bonifico",
+            },
+            # 2
+            {
+                "Data": pd.Timestamp(2024, 4, 1),
+                "NumeroDocumento": "F-10",
+                "Intestatario": "Palestra Srl",
+                "TipoVoce": "Affitto",
+                "CentroCosto": "Calcio",
+                "Causale": "Affitto campo",
+                "Entrata": 0.0,
+                "Uscita": 300.0,
+                "MetodoPagamento": "Bonifico",
+            },
+            # 3: data mancante
+            {
+                "Data": None,
+                "NumeroDocumento": "",
+                "Intestatario": "Verdi Luca",
+                "TipoVoce": "Quota",
+                "CentroCosto": "Calcio",
+                "Causale": "Quota associativa",
+                "Entrata": 50.0,
+                "Uscita": 0.0,
+                "MetodoPagamento": "Contanti",
+            },
+        ]
+    )
+
+
+def test_senza_criteri_tutte_le_righe():
+    indice = IndicePrimaNota(_prima_nota())
+
+    assert list(indice.filtra({})) == [0, 1, 2, 3]
+
+
+def test_fine_periodo_include_tutto_il_giorno():
+    indice = IndicePrimaNota(_prima_nota())
+
+    filtro = {"dal": datetime.date(2024, 3, 1), "al": datetime.date(2024, 3, 31)}
+
+    assert list(indice.filtra(filtro)) == [0, 1]
+
+
+def test_periodo_esclude_date_mancanti():
+    indice = IndicePrimaNota(_prima_nota())
+
+    assert list(indice.filtra({"dal": datetime.date(2024, 1, 1)})) == [0, 1, 2]
+
+
+def test_importo_estremi_inclusi():
+    indice = IndicePrimaNota(_prima_nota())
+
+    assert list(indice.filtra({"importo_min": 50, "importo_max": 120})) == [0, 1, 3]
+    assert list(indice.filtra({"importo_min": 121})) == [2]
+
+
+def test_movimenti_e_categorie():
+    indice = IndicePrimaNota(_prima_nota())
+
+    assert list(indice.filtra({"movimenti": "Solo uscite"})) == [2]
+    assert list(indice.filtra({"CentroCosto": ("Calcio",)})) == [0, 2, 3]
+    # più valori della stessa dimensione: basta uno
+    assert list(indice.filtra({"MetodoPagamento": ("Bonifico", "Contanti")})) == [0, 1, 2, 3]
+    assert list(indice.filtra({"CentroCosto": ("Tennis",)})) == []
+
+
+def test_testo_prefissi_in_and_senza_accenti():
+    indice = IndicePrimaNota(_prima_nota())
+
+    assert list(indice.filtra({"testo": "quota ass"})) == [0, 3]
+    assert list(indice.filtra({"testo": "QUÒTA nuo"})) == [1]
+    assert list(indice.filtra({"testo": "f-10"})) == [2]
+    assert list(indice.filtra({"testo": "sociale"})) == []
+
+
+def test_filtri_combinati():
+    indice = IndicePrimaNota(_prima_nota())
+
+    filtro = {
+        "movimenti": "Solo entrate",
+        "dal": datetime.date(2024, 3, 1),
+        "al": datetime.date(2024, 3, 31),
+        "importo_min": 40,
+        "importo_max": 200,
+        "CentroCosto": ("Calcio", "Nuoto"),
+        "MetodoPagamento": ("Contanti",),
+        "testo": "rossi quota",
+    }
+
+    assert list(indice.filtra(filtro)) == [0]
+    assert list(indice.filtra({**filtro, "MetodoPagamento": ("Bonifico",)})) == []
+    assert list(indice.filtra({**filtro, "testo": "", "MetodoPagamento": ()})) == [0, 1]
+
+
+def test_valori_per_i_selettori():
+    indice = IndicePrimaNota(_prima_nota())
+
+    assert indice.valori("CentroCosto") == ["Calcio", "Nuoto"]
+    assert indice.valori("TipoVoce") == ["Affitto", "Quota"]
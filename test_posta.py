@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from posta import CodaPosta
+
+
+class _SessioneFinta:
+    def __init__(self):
+        self.inviati = []
+
+    def invia(self, msg, config):
+        self.inviati.append(msg)
+
+
+@pytest.fixture
+def coda(monkeypatch):
+    monkeypatch.setenv("SMTP_SERVER", "localhost")
+    monkeypatch.setenv("SENDER_EMAIL", "asd@example.org")
+    monkeypatch.setenv("SMTP_MAX_AL_MINUTO", "0")
+    monkeypatch.setenv("SMTP_TENTATIVI", "3")
+    sessione = _SessioneFinta()
+    return CodaPosta(sessione), sessione
+
+
+def _attendi(coda, lotto, fatti):
+    for _ in range(200):
+        stato = coda.stato_lotto(lotto)
+        if stato["inviati"] + len(stato["errori"]) >= fatti:
+            return stato
+        time.sleep(0.01)
+    raise AssertionError(f"lotto {lotto} non completato: {coda.stato_lotto(lotto)}")
+
+
+def test_ricevute_gia_accodate_non_ripetute(coda):
+    coda, sessione = coda
+    elementi = [("a", "Ricevuta 1", lambda: "msg a"), ("b", "Ricevuta 2", lambda: "msg b")]
+
+    assert coda.accoda_lotto("Ricevute 2024-03", elementi) == 2
+    assert coda.accoda_lotto("Ricevute 2024-03", elementi) == 0
+    stato = _attendi(coda, "Ricevute 2024-03", 2)
+
+    assert coda.accoda_lotto("Ricevute 2024-03", elementi) == 0
+    assert stato["totale"] == 2
+    assert sorted(sessione.inviati) == ["msg a", "msg b"]
+
+
+def test_errore_nel_creare_il_messaggio_non_si_ripete(coda):
+    coda, sessione = coda
+    chiamate = []
+
+    def crea():
+        chiamate.append(1)
+        raise ValueError("PDF non ricreabile")
+
+    coda.accoda_lotto("Ricevute Tutte", [("a", "Ricevuta 1", crea)])
+    stato = _attendi(coda, "Ricevute Tutte", 1)
+
+    assert len(chiamate) == 1
+    assert stato["errori"] == [("Ricevuta 1", "PDF non ricreabile")]
+    assert sessione.inviati == []
+    # fallita: si può accodare di nuovo
+    assert coda.accoda_lotto("Ricevute Tutte", [("a", "Ricevuta 1", lambda: "msg")]) == 1
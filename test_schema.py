@@ -0,0 +1,37 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from schema import _a_data
+
+
+def test_date_in_testo_e_iso():
+    serie = pd.Series(
+        [
+            "05/03/2024",
+            "2024-03-05",
+            "2024-03-05T00:00:00",
+            "2024-03-05 10:30:00",
+            pd.Timestamp(2024, 3, 5),
+            datetime.date(2024, 3, 5),
+        ],
+        name="Data",
+        dtype=object,
+    )
+
+    date = _a_data(serie)
+
+    assert date.dtype == "datetime64[ns]"
+    assert list(date.dt.date) == [datetime.date(2024, 3, 5)] * 6
+    assert date[3].hour == 10
+
+
+def test_date_vuote_e_non_valide():
+    serie = pd.Series(["", None, "  ", "boh", "31/02/2024", "05/03/2024"], name="Data")
+
+    with pytest.warns(UserWarning, match="2 date non riconosciute"):
+        date = _a_data(serie)
+
+    assert date[:5].isna().all()
+    assert date[5] == pd.Timestamp(2024, 3, 5)
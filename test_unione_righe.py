@@ -0,0 +1,106 @@
+import pandas as pd
+
+from drive_utils import _aggiungi_mancanti, _unisci_voci, con_id_righe, id_righe, unisci_per_chiave
+from schema import COLONNA_ID
+
+RICEVUTE = "ricevute_asd_ssd.xlsx"
+PRIMA_NOTA = "prima_nota_asd_ssd.xlsx"
+
+
+def _ricevuta(id_riga, numero, importo, intestatario="Rossi Mario"):
+    return {
+        COLONNA_ID: id_riga,
+        "Numero": numero,
+        "Intestatario": intestatario,
+        "Importo": importo,
+    }
+
+
+def test_unione_tiene_righe_di_entrambe_le_parti():
+    remoto = pd.DataFrame([_ricevuta("a", "1", 10.0), _ricevuta("b", "2", 20.0)])
+    locale = pd.DataFrame([_ricevuta("b", "2", 20.0), _ricevuta("c", "3", 30.0)])
+
+    unito, conflitti = unisci_per_chiave(remoto, locale, RICEVUTE)
+
+    assert list(unito[COLONNA_ID]) == ["a", "b", "c"]
+    assert conflitti == []
+
+
+def test_stesso_id_contenuto_diverso_resta_locale_e_registra_conflitto():
+    remoto = pd.DataFrame([_ricevuta("a", "1", 10.0)])
+    locale = pd.DataFrame([_ricevuta("a", "1", 15.0)])
+
+    unito, conflitti = unisci_per_chiave(remoto, locale, RICEVUTE)
+
+    assert len(unito) == 1
+    assert unito.loc[0, "Importo"] == 15.0
+    assert len(conflitti) == 1
+    assert conflitti[0][COLONNA_ID] == "a"
+    assert conflitti[0]["remota"]["Importo"] == 10.0
+    assert conflitti[0]["locale"]["Importo"] == 15.0
+
+
+def test_stesso_numero_con_id_diversi_non_si_sovrascrivono():
+    # due processi che emettono la stessa ricevuta: nessuna delle due va persa
+    remoto = pd.DataFrame([_ricevuta("a", "7", 10.0, "Bianchi Anna")])
+    locale = pd.DataFrame([_ricevuta("b", "7", 10.0, "Verdi Luca")])
+
+    unito, conflitti = unisci_per_chiave(remoto, locale, RICEVUTE)
+
+    assert sorted(unito["Intestatario"]) == ["Bianchi Anna", "Verdi Luca"]
+    assert conflitti == []
+
+
+def test_righe_senza_id_identiche_restano_distinte():
+    # file scritti prima di IdRiga: due movimenti uguali sono due movimenti
+    riga = {"Data": "01/03/2024", "Causale": "Quota", "Entrata": 50.0, "Uscita": 0.0}
+    remoto = pd.DataFrame([riga, riga])
+    locale = pd.DataFrame([riga])
+
+    unito, conflitti = unisci_per_chiave(remoto, locale, PRIMA_NOTA)
+
+    assert len(unito) == 2
+    assert unito[COLONNA_ID].nunique() == 2
+    assert conflitti == []
+
+
+def test_righe_mancanti_identiche_aggiunte_tutte():
+    # journal con tre movimenti uguali, di cui il file ne contiene già uno
+    riga = {"Data": "01/03/2024", "Causale": "Quota", "Entrata": 50.0, "Uscita": 0.0}
+    df = con_id_righe(pd.DataFrame([riga]), PRIMA_NOTA)
+
+    unito = _aggiungi_mancanti(df, pd.DataFrame([riga, riga, riga]), PRIMA_NOTA)
+
+    assert len(unito) == 3
+    assert unito[COLONNA_ID].nunique() == 3
+
+
+def test_id_derivati_stabili_tra_formati():
+    # la stessa riga letta da Excel (numeri, date) e dal journal JSON (testo)
+    da_excel = pd.DataFrame(
+        [{"Data": pd.Timestamp(2024, 3, 1), "Causale": "Quota", "Entrata": 50, "Uscita": 0.0}]
+    )
+    da_journal = pd.DataFrame(
+        [{"Data": "01/03/2024", "Causale": "Quota", "Entrata": "50.0", "Uscita": "0"}]
+    )
+
+    assert list(id_righe(da_excel, PRIMA_NOTA)) == list(id_righe(da_journal, PRIMA_NOTA))
+
+
+def test_voci_journal_senza_doppioni_per_id():
+    remote = [{"riga": _ricevuta("a", "1", 10.0)}, {"riga": _ricevuta("b", "2", 20.0)}]
+    nuove = [{"riga": _ricevuta("b", "2", 25.0)}, {"riga": _ricevuta("c", "3", 30.0)}]
+
+    voci, conflitti = _unisci_voci(remote, nuove, RICEVUTE)
+
+    assert [v["riga"][COLONNA_ID] for v in voci] == ["a", "b", "c"]
+    assert voci[1]["riga"]["Importo"] == 25.0
+    assert [c[COLONNA_ID] for c in conflitti] == ["b"]
+    assert conflitti[0]["remota"]["Importo"] == 20.0
+
+
+def test_voci_journal_con_una_parte_vuota():
+    voci = [{"riga": _ricevuta("a", "1", 10.0)}]
+
+    assert _unisci_voci([], voci, RICEVUTE) == (voci, [])
+    assert _unisci_voci(voci, [], RICEVUTE) == (voci, [])